@@ -0,0 +1,84 @@
+"""Text mode path vs bytes engine, from raw bytes to raw bytes.
+
+Reads every .py file under a path (the standard library by default)
+as bytes, then times turning them into the bytes that would be
+written back: decoding, running the default engine and encoding
+again for the text mode path, and nline.get_newlines_bytes for the
+bytes engine. Runs on the files as they are (LF) and converted to
+CRLF, where the text mode path also loses the original terminators.
+
+Usage: python benchmarks/bench_bytes.py [path] [repeat] [tags...]
+"""
+import io
+import os
+import sys
+import sysconfig
+import timeit
+
+from pytagged import nline
+
+
+def load_sources(path: str):
+    sources = []
+    for root, _, fnames in os.walk(path):
+        for fname in fnames:
+            if not fname.endswith(".py"):
+                continue
+            try:
+                with open(os.path.join(root, fname), "rb") as f:
+                    data = f.read()
+                data.decode("utf-8")
+            except (OSError, UnicodeDecodeError):
+                continue
+            # keep LF only files, the CRLF corpus is derived from them
+            if b"\r" not in data:
+                sources.append(data)
+    return sources
+
+
+def text_path(data: bytes, matcher: nline.Matcher) -> bytes:
+    # what opening the file in text mode does
+    fi = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8")
+    newlines = nline.get_newlines_changed(fi, matcher)
+    return "".join(newlines.lines).encode("utf-8")
+
+
+def bytes_path(data: bytes, matcher: nline.Matcher) -> bytes:
+    newlines = nline.get_newlines_bytes(data, matcher, "utf-8")
+    return b"".join(newlines.lines)
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else sysconfig.get_paths()["stdlib"]
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    tags = sys.argv[3:] or ["debug", "develop"]
+
+    lf = load_sources(path)
+    crlf = [src.replace(b"\n", b"\r\n") for src in lf]
+    num_lines = sum(src.count(b"\n") for src in lf)
+    num_bytes = sum(len(src) for src in lf)
+    matcher = nline.get_matcher(tags)
+    print(f"{path}: {len(lf)} files, {num_lines} lines, "
+          f"{num_bytes / 1e6:.1f}MB, tags {tags}")
+
+    for corpus_name, corpus in (("LF", lf), ("CRLF", crlf)):
+        # only the commented out lines may differ from the input
+        expected = [text_path(src, matcher) for src in lf]
+        if corpus is crlf:
+            expected = [out.replace(b"\n", b"\r\n") for out in expected]
+
+        for name, fn in (("text", text_path), ("bytes", bytes_path)):
+            actual = [fn(src, matcher) for src in corpus]
+            same = "same output" if actual == expected else "DIFFERENT OUTPUT"
+
+            def run():
+                for src in corpus:
+                    fn(src, matcher)
+
+            best = min(timeit.repeat(run, number=1, repeat=repeat))
+            print(f"{corpus_name:5} {name:6} {best:8.3f}s "
+                  f"{num_lines / best:14,.0f} lines/s  {same}")
+
+
+if __name__ == "__main__":
+    main()
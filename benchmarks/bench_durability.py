@@ -0,0 +1,69 @@
+"""Write throughput of each write strategy & durability level.
+
+Creates num_files small modules, each with a tagged line, spread over
+num_dirs directories of a temporary directory (pass a path to put it
+on another disk), then processes them with _proc.proc_file: in place,
+and atomically with each durability level. Files are recreated
+before every run.
+
+Usage: python benchmarks/bench_durability.py [num_files] [num_dirs] [tmp_root]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from pytagged import _proc, _write, nline
+
+
+SRC = b"import os\n\n\ndef fn(x):\n    print(x)  # debug\n    return x\n"
+
+
+def make_tree(root: str, num_files: int, num_dirs: int):
+    paths = []
+    for d in range(num_dirs):
+        os.makedirs(os.path.join(root, f"pkg{d}"), exist_ok=True)
+    for i in range(num_files):
+        path = os.path.join(root, f"pkg{i % num_dirs}", f"mod{i}.py")
+        with open(path, "wb") as f:
+            f.write(SRC)
+        paths.append(path)
+    return paths
+
+
+def main():
+    num_files = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    num_dirs = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    tmp_root = sys.argv[3] if len(sys.argv) > 3 else None
+
+    matcher = nline.get_matcher(["debug"])
+    root = tempfile.mkdtemp(prefix="pytagged-bench-", dir=tmp_root)
+    cases = [("in place", None)] + [
+        (f"atomic {level}", level) for level in _write.DURABILITY_LEVELS]
+
+    print(f"{num_files} files in {num_dirs} dirs under {root}")
+    try:
+        for name, durability in cases:
+            paths = make_tree(root, num_files, num_dirs)
+            writer = None
+            if durability is not None:
+                writer = _write.AtomicWriter(durability)
+
+            st = time.perf_counter()
+            for p in paths:
+                _proc.proc_file(p, matcher, write=True, keep_lines=False,
+                                writer=writer)
+            if writer is not None:
+                writer.flush()
+            elapsed = time.perf_counter() - st
+
+            fsyncs = writer.fsyncs if writer is not None else 0
+            print(f"{name:12} {elapsed:8.3f}s {num_files / elapsed:12,.0f} files/s"
+                  f" {fsyncs:8} fsyncs")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
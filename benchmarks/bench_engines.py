@@ -0,0 +1,59 @@
+"""Throughput of the nline engines on real world code.
+
+Reads every .py file under a path (the standard library by
+default) into memory once, then runs each engine over all
+of them and reports lines/sec. Also checks that every engine
+gives the same output as the regex engine.
+
+Usage: python benchmarks/bench_engines.py [path] [repeat] [tags...]
+"""
+import io
+import os
+import sys
+import sysconfig
+import timeit
+
+from pytagged import nline
+
+
+def load_sources(path: str):
+    sources = []
+    for root, _, fnames in os.walk(path):
+        for fname in fnames:
+            if not fname.endswith(".py"):
+                continue
+            try:
+                with open(os.path.join(root, fname), encoding="utf-8") as f:
+                    sources.append(f.read())
+            except (OSError, UnicodeDecodeError):
+                continue
+    return sources
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else sysconfig.get_paths()["stdlib"]
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    tags = sys.argv[3:] or ["debug", "develop"]
+
+    sources = load_sources(path)
+    num_lines = sum(src.count('\n') for src in sources)
+    matcher = nline.get_matcher(tags)
+    print(f"{path}: {len(sources)} files, {num_lines} lines, tags {tags}")
+
+    expected = [nline.get_newlines_regex(io.StringIO(src), matcher)
+                for src in sources]
+
+    for name, engine in nline.ENGINES.items():
+        actual = [engine(io.StringIO(src), matcher) for src in sources]
+        same = "same output" if actual == expected else "DIFFERENT OUTPUT"
+
+        def run():
+            for src in sources:
+                engine(io.StringIO(src), matcher)
+
+        best = min(timeit.repeat(run, number=1, repeat=repeat))
+        print(f"{name:10} {best:8.3f}s {num_lines / best:14,.0f} lines/s  {same}")
+
+
+if __name__ == "__main__":
+    main()
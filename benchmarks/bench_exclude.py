@@ -0,0 +1,82 @@
+"""Walk time with the exclude patterns matched one fnmatch call at a
+time (what match_path used to do) vs with a PathMatcher, which
+compiles them all into a single regex.
+
+Creates a tree of num_entries files & directories in a temporary
+directory, fanout entries per directory, a few of which match the
+patterns, then times filepaths_from_path with each matcher.
+
+Usage: python benchmarks/bench_exclude.py [num_entries] [fanout] [repeat]
+"""
+import fnmatch
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from pytagged import _files_utils
+from pytagged.app import DEFAULT_EXCLUDED_PATTERNS
+
+PATTERNS = DEFAULT_EXCLUDED_PATTERNS + [
+    "env", "venv", ".venv", "build", "dist", "node_modules", "*.pyc",
+    "*_pb2.py", "*.min.js", ".mypy_cache", ".pytest_cache", "site-packages",
+    "migrations", "*.so", "docs/_build",
+]
+
+
+def fnmatch_match_path(path: str) -> bool:
+    basename = os.path.basename(path)
+    if basename not in ('**', "*"):
+        return any(fnmatch.fnmatch(basename, p) for p in PATTERNS)
+    abs_path = os.path.abspath(path)
+    return any(fnmatch.fnmatch(abs_path, p) for p in PATTERNS)
+
+
+def make_tree(root: str, num_entries: int, fanout: int):
+    """Breadth first, a directory every fanout // 5 entries"""
+    dirs = [root]
+    made = 0
+    i = 0
+    while made < num_entries:
+        d = dirs[i]
+        i += 1
+        for j in range(fanout):
+            if made >= num_entries:
+                break
+            made += 1
+            if j % 5 == 0:
+                name = "build" if j == fanout - 5 else f"pkg{j}"
+                os.mkdir(os.path.join(d, name))
+                dirs.append(os.path.join(d, name))
+            else:
+                name = f"mod{j}_pb2.py" if j == 1 else f"mod{j}.py"
+                open(os.path.join(d, name), "w").close()
+
+
+def main():
+    num_entries = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    fanout = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    root = tempfile.mkdtemp(prefix="pytagged-bench-")
+    try:
+        make_tree(root, num_entries, fanout)
+        matchers = [
+            ("fnmatch", fnmatch_match_path),
+            ("PathMatcher", _files_utils.PathMatcher(PATTERNS)),
+        ]
+        print(f"{num_entries} entries, {len(PATTERNS)} patterns")
+        for name, matcher in matchers:
+            best = float("inf")
+            for _ in range(repeat):
+                st = time.perf_counter()
+                files = list(_files_utils.filepaths_from_path(root, matcher))
+                best = min(best, time.perf_counter() - st)
+            print(f"{name:12} {best * 1e3:10.1f}ms {len(files):8} files")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
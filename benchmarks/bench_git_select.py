@@ -0,0 +1,72 @@
+"""File selection: walking the tree vs asking git for the changes.
+
+Creates a git repository of num_files modules spread over num_dirs
+directories in a temporary directory, commits them, modifies changed
+of them, then times listing the files to process with
+_files_utils.filepaths_from_path and with _git.changed_files for
+--changed-since HEAD and --staged.
+
+Usage: python benchmarks/bench_git_select.py [num_files] [num_dirs] [changed]
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from pytagged import _files_utils, _git
+from pytagged.app import DEFAULT_EXCLUDED_PATTERNS
+
+
+def git(root: str, *args):
+    subprocess.run(["git", "-c", "user.name=bench", "-c", "user.email=b@b",
+                    *args], cwd=root, check=True, stdout=subprocess.DEVNULL)
+
+
+def main():
+    num_files = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    num_dirs = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    changed = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    root = tempfile.mkdtemp(prefix="pytagged-bench-")
+    try:
+        paths = []
+        for i in range(num_files):
+            d = os.path.join(root, f"pkg{i % num_dirs}")
+            os.makedirs(d, exist_ok=True)
+            paths.append(os.path.join(d, f"mod{i}.py"))
+            with open(paths[-1], "w") as f:
+                f.write("x = 1\n")
+        git(root, "init", "-q")
+        git(root, "add", ".")
+        git(root, "commit", "-q", "-m", "init")
+        for p in paths[:changed]:
+            with open(p, "a") as f:
+                f.write("print(x)  # debug\n")
+        git(root, "add", *paths[:changed // 2])
+
+        def exclude(p: str) -> bool:
+            return _files_utils.match_path(p, DEFAULT_EXCLUDED_PATTERNS)
+
+        cases = [
+            ("walk", lambda: list(
+                _files_utils.filepaths_from_path(root, exclude))),
+            ("changed-since", lambda: _git.changed_files(
+                root, "HEAD", False, exclude)),
+            ("staged", lambda: _git.changed_files(root, None, True, exclude)),
+        ]
+        print(f"{num_files} files in {num_dirs} dirs, {changed} changed")
+        for name, fn in cases:
+            best = float("inf")
+            for _ in range(5):
+                st = time.perf_counter()
+                files = fn()
+                best = min(best, time.perf_counter() - st)
+            print(f"{name:14} {best * 1e3:10.1f}ms {len(files):8} files")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
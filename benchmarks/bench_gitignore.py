@@ -0,0 +1,68 @@
+"""Walk time of a repo whose untracked trees are only listed in its
+.gitignore, with and without --respect-gitignore.
+
+Creates src/ with num_src files next to ignored venv/, build/ and
+node_modules/ trees of num_ignored files each, plus generated _pb2
+files in src/, then times filepaths_from_path with the default
+exclude patterns, alone and with a GitIgnore.
+
+Usage: python benchmarks/bench_gitignore.py [num_src] [num_ignored] [repeat]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from pytagged import _files_utils, _gitignore
+from pytagged.app import DEFAULT_EXCLUDED_PATTERNS, PY_EXT
+
+GITIGNORE = """\
+venv/
+build/
+node_modules/
+*_pb2.py
+"""
+
+
+def make_files(root: str, num_files: int, per_dir: int = 20):
+    for i in range(num_files):
+        d = os.path.join(root, f"d{i // per_dir}")
+        os.makedirs(d, exist_ok=True)
+        name = f"msg{i}_pb2.py" if i % 10 == 0 else f"mod{i}.py"
+        open(os.path.join(d, name), "w").close()
+
+
+def main():
+    num_src = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    num_ignored = int(sys.argv[2]) if len(sys.argv) > 2 else 30000
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    root = tempfile.mkdtemp(prefix="pytagged-bench-")
+    try:
+        make_files(os.path.join(root, "src"), num_src)
+        for name in ("venv", "build", "node_modules"):
+            make_files(os.path.join(root, name), num_ignored)
+        with open(os.path.join(root, ".gitignore"), "w") as f:
+            f.write(GITIGNORE)
+        matcher = _files_utils.PathMatcher(DEFAULT_EXCLUDED_PATTERNS)
+
+        print(f"{num_src} files in src/, {3 * num_ignored} ignored files")
+        for name in ("excludes", "gitignore"):
+            best = float("inf")
+            for _ in range(repeat):
+                st = time.perf_counter()
+                ignore = None
+                if name == "gitignore":
+                    ignore = _gitignore.GitIgnore(root)
+                files = list(_files_utils.filepaths_from_path(
+                    root, matcher, PY_EXT, ignore))
+                best = min(best, time.perf_counter() - st)
+            pruned = f"{ignore.pruned:8} pruned" if ignore is not None else ""
+            print(f"{name:10} {best * 1e3:10.1f}ms {len(files):8} files {pruned}")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
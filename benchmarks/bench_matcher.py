@@ -0,0 +1,59 @@
+"""Micro-benchmark of the per file overhead of building the
+tag regexes, on many small in-memory files.
+
+Compares compiling a new Matcher for every file (what get_newlines
+used to do) with reusing a single Matcher built by get_matcher.
+
+Usage: python benchmarks/bench_matcher.py [num_files] [repeat]
+"""
+import io
+import re
+import sys
+import timeit
+
+from pytagged import nline
+
+
+SMALL_FILE = """\
+import os
+
+
+def fn(x):
+    print(x)  # debug
+    return os.path.join(x, "y")
+"""
+TAGS = ["debug", "develop", "slow", "skip", "env"]
+
+
+def main():
+    num_files = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    files = [io.StringIO(SMALL_FILE) for _ in range(num_files)]
+
+    def run(get_tags):
+        for f in files:
+            f.seek(0)
+            nline.get_newlines(f, get_tags())
+
+    def compile_per_file():
+        # also purge re's own cache, which is what happens on
+        # large runs once it's full of other patterns
+        re.purge()
+        return nline.Matcher(TAGS)
+
+    matcher = nline.get_matcher(TAGS)
+    cases = {
+        "compile per file": compile_per_file,
+        "raw tags (lru)": lambda: TAGS,
+        "shared matcher": lambda: matcher,
+    }
+
+    print(f"{num_files} files, best of {repeat}")
+    for name, get_tags in cases.items():
+        best = min(timeit.repeat(lambda: run(get_tags), number=1, repeat=repeat))
+        per_file = best / num_files * 1e6
+        print(f"{name:20} {best * 1000:10.2f}ms {per_file:10.2f}us/file")
+
+
+if __name__ == "__main__":
+    main()
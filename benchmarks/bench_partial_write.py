@@ -0,0 +1,69 @@
+"""Full rewrite vs partial rewrite from the first changed line.
+
+Writes a module of num_lines lines with a single tagged line at
+position (0 is the top of the file, 1 the bottom), then times
+rewriting it as a whole, like text mode does, against rewriting
+it from the first edit on with _proc.write_edits, and reports the
+bytes written by each.
+
+Usage: python benchmarks/bench_partial_write.py [num_lines] [position] [repeat]
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+from pytagged import _proc, nline
+
+
+def make_source(num_lines: int, position: float) -> bytes:
+    lines = [b"    x = compute(x, %d)  # some comment\n" % i
+             for i in range(num_lines)]
+    lines[min(int(num_lines * position), num_lines - 1)] = \
+        b"    print(x)  # debug\n"
+    return b"".join(lines)
+
+
+def main():
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    position = float(sys.argv[2]) if len(sys.argv) > 2 else 0.95
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    src = make_source(num_lines, position)
+    edits = nline.get_edits_bytes(src, ["debug"], "utf-8")
+    new = nline.apply_edits(src, edits)
+    fd, path = tempfile.mkstemp(suffix=".py")
+    os.close(fd)
+
+    def reset():
+        with open(path, "wb") as f:
+            f.write(src)
+
+    def full():
+        # what writing the lines of a file opened in text mode does
+        with open(path, "r+b") as f:
+            f.truncate()
+            f.write(new)
+        return len(new)
+
+    def partial():
+        with open(path, "r+b") as f:
+            return _proc.write_edits(f, src, edits)
+
+    print(f"{num_lines} lines, {len(src)} bytes, edit at line "
+          f"{edits[0].index}, best of {repeat}")
+    try:
+        for name, fn in (("full", full), ("partial", partial)):
+            reset()
+            written = fn()
+            with open(path, "rb") as f:
+                same = "same output" if f.read() == new else "DIFFERENT OUTPUT"
+            best = min(timeit.repeat(fn, setup=reset, number=1, repeat=repeat))
+            print(f"{name:8} {best * 1e6:10.1f}us {written:12,} bytes written"
+                  f"  {same}")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Time & peak memory of resolving blocks and triple quotes.
+
+Builds in-memory files made of big tagged blocks and docstrings,
+scans them once, then compares the old resolution, which expanded
+every block & docstring into a set of line indices, with
+nline._resolve, which works on merged intervals.
+
+Usage: python benchmarks/bench_resolve.py [block_lines] [num_blocks] [repeat]
+"""
+import io
+import sys
+import timeit
+import tracemalloc
+
+from pytagged import nline
+
+
+def make_source(block_lines: int, num_blocks: int) -> str:
+    body = "    x = 1\n" * block_lines
+    doc = '    """\n' + "    doc line\n" * block_lines + '    """\n'
+    block = "    # block: debug\n" + body + "    # end\n"
+    part = "".join(["def fn():\n", doc, block, "    y = 2  # debug\n"])
+    return part * num_blocks
+
+
+def resolve_sets(scan):
+    """The set based resolution, as it was before intervals."""
+    lines, indices, cmt_line_idx, block_pairs, triple_quote_pairs = scan
+    indices = set(indices)
+    for start, end in block_pairs:
+        if start == -1:
+            continue
+        indices |= {j for j in range(start + 1, end)}
+    for start, end in triple_quote_pairs:
+        if start == -1:
+            continue
+        indices -= {j for j in range(start, end + 1)}
+    indices -= set(cmt_line_idx)
+    changed = 0
+    for i in indices:
+        if lines[i] == '\n':
+            continue
+        lines[i] = nline._comment_out(lines[i])
+        changed += 1
+    return nline.NewLines(lines, changed)
+
+
+def fresh_scan(scan):
+    # _resolve modifies the lines in place
+    return scan._replace(lines=list(scan.lines))
+
+
+def peak_kib(fn, scan) -> float:
+    tracemalloc.start()
+    fn(fresh_scan(scan))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def main():
+    block_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    num_blocks = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    src = make_source(block_lines, num_blocks)
+    matcher = nline.get_matcher(["debug"])
+    scan = nline._scan_fast(io.StringIO(src), matcher)
+    print(f"{len(scan.lines)} lines, {len(scan.block_pairs)} blocks, "
+          f"{len(scan.triple_quote_pairs)} docstrings, best of {repeat}")
+
+    cases = {"sets": resolve_sets, "intervals": nline._resolve}
+    expected = resolve_sets(fresh_scan(scan))
+    for name, fn in cases.items():
+        same = "same output" if fn(fresh_scan(scan)) == expected \
+            else "DIFFERENT OUTPUT"
+        scans = [fresh_scan(scan) for _ in range(repeat)]
+        best = min(timeit.repeat(lambda: fn(scans.pop()), number=1,
+                                 repeat=repeat))
+        peak = peak_kib(fn, scan)
+        print(f"{name:10} {best * 1000:10.2f}ms {peak:12,.0f}KiB peak  {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Undoing a run: snapshot & write back every file vs journal restore.
+
+Creates num_files modules of num_lines lines in a temporary directory,
+a fraction of which (tagged, 0.1 by default) have a tagged line, then
+times the two ways to get the originals back after a run: reading
+every file before the run and writing every file back after it, like
+conftest.switch_to_release used to, and _journal.restore, which only
+opens the files the run changed, plus saving & loading the journal.
+The run itself isn't timed.
+
+Usage: python benchmarks/bench_restore.py [num_files] [num_lines] [tagged]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from pytagged import _journal, _proc, nline
+
+
+def make_tree(root: str, num_files: int, num_lines: int, tagged: float):
+    paths = []
+    every = max(1, round(1 / tagged)) if tagged > 0 else 0
+    for i in range(num_files):
+        lines = [b"x = compute(x, %d)  # some comment\n" % j
+                 for j in range(num_lines)]
+        if every and i % every == 0:
+            lines[num_lines // 2] = b"print(x)  # debug\n"
+        path = os.path.join(root, f"mod{i}.py")
+        with open(path, "wb") as f:
+            f.write(b"".join(lines))
+        paths.append(path)
+    return paths
+
+
+def run(paths, matcher, undo: bool) -> _journal.Journal:
+    journal = _journal.Journal()
+    for p in paths:
+        res = _proc.proc_file(p, matcher, write=True, keep_lines=False,
+                              undo=undo)
+        if res.undo is not None:
+            journal.record(p, res.undo)
+    return journal
+
+
+def main():
+    num_files = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    num_lines = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    tagged = float(sys.argv[3]) if len(sys.argv) > 3 else 0.1
+
+    matcher = nline.get_matcher(["debug"])
+    root = tempfile.mkdtemp(prefix="pytagged-bench-")
+    try:
+        paths = make_tree(root, num_files, num_lines, tagged)
+
+        st = time.perf_counter()
+        snapshot = {}
+        for p in paths:
+            with open(p, "rb") as f:
+                snapshot[p] = f.read()
+        snapshot_time = time.perf_counter() - st
+        run(paths, matcher, undo=False)
+        st = time.perf_counter()
+        for p, data in snapshot.items():
+            with open(p, "wb") as f:
+                f.write(data)
+        write_back_time = time.perf_counter() - st
+
+        journal = run(paths, matcher, undo=True)
+        journal_path = os.path.join(root, "journal.json")
+        st = time.perf_counter()
+        journal.save(journal_path)
+        res = _journal.restore(_journal.Journal.load(journal_path))
+        restore_time = time.perf_counter() - st
+
+        same = all(open(p, "rb").read() == data for p, data in snapshot.items())
+        print(f"{num_files} files of {num_lines} lines, "
+              f"{len(res.restored)} changed by the run")
+        snapshot_total = snapshot_time + write_back_time
+        print(f"snapshot + write back {snapshot_total * 1e3:10.1f}ms")
+        print(f"journal + restore     {restore_time * 1e3:10.1f}ms"
+              f"  journal of {os.path.getsize(journal_path):,} bytes"
+              f"  {'same output' if same else 'DIFFERENT OUTPUT'}")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
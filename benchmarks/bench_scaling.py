@@ -0,0 +1,197 @@
+"""How time & peak memory scale along each dimension of the synthetic
+corpus of corpus.py: nline.get_newlines on a single file, for the
+number of lines, the tag density, the block size and the nesting of
+triple quote regions, and the whole App pipeline, for the number of
+files and the depth of the tree.
+
+Each row gives the best time of repeat runs, the throughput and the
+peak memory traced by tracemalloc, in a run of its own. For the
+suites that grow the input, the slope columns are the local exponents
+of time and memory against the number of lines, log(t2/t1)/log(n2/n1):
+about 1 for linear scaling, a regression to quadratic shows up as
+slopes heading to 2. The other suites keep the input size and should
+keep a flat throughput. Changed is the number of lines commented
+out by the engine, or the tagged lines of the corpus for App.
+
+Usage: python benchmarks/bench_scaling.py [suite|all] [repeat] [seed]
+"""
+import io
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from typing import Callable, List, NamedTuple, Tuple
+
+from corpus import Spec, make_source, write_corpus
+from pytagged import nline
+from pytagged.app import App
+
+TAGS = ["debug"]
+SIZE_LINES = [1000, 4000, 16000, 64000, 256000]
+LINES = 64000
+DENSITIES = [0.0, 0.01, 0.1, 0.5, 1.0]
+BLOCK_SIZES = [1, 10, 100, 1000, 10000]
+# about this fraction of the lines are in blocks, whatever their size
+BLOCK_FRACTION = 0.1
+NESTING = [0, 1, 2, 4, 8]
+NUM_FILES = [100, 400, 1600, 6400]
+DEPTHS = [0, 2, 4, 8]
+DEPTH_FILES = 2000
+
+
+class Row(NamedTuple):
+    param: str
+    lines: int
+    seconds: float
+    peak: int
+    changed: int
+
+
+def peak_bytes(fn: Callable[[], object]) -> int:
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def engine_row(param: str, spec: Spec, lines: int, repeat: int) -> Row:
+    """get_newlines on one file, read from io.StringIO"""
+    src, stats = make_source(random.Random(spec.seed), spec, lines)
+    matcher = nline.get_matcher(TAGS)
+    best = float("inf")
+    for _ in range(repeat):
+        buf = io.StringIO(src)
+        st = time.perf_counter()
+        nline.get_newlines(buf, matcher)
+        best = min(best, time.perf_counter() - st)
+    changed = nline.get_newlines_changed(io.StringIO(src), matcher).changed
+    peak = peak_bytes(lambda: nline.get_newlines(io.StringIO(src), matcher))
+    return Row(param, stats.lines, best, peak, changed)
+
+
+def run_app(root: str):
+    argv = [os.path.join(root, "src"), "-t", *TAGS, "--no-cache",
+            "--journal", os.path.join(root, "journal.json")]
+    with redirect_stdout(io.StringIO()):
+        try:
+            App().run(argv)
+        except SystemExit as e:
+            if e.code:
+                raise
+
+
+def app_row(param: str, spec: Spec, repeat: int) -> Row:
+    """A default mode run of App on the corpus, that is written again
+    before each run, since a run comments the tagged lines out
+    """
+    best = float("inf")
+    peak = 0
+    stats = None
+    for i in range(repeat + 1):
+        root = tempfile.mkdtemp(prefix="pytagged-bench-")
+        try:
+            stats = write_corpus(os.path.join(root, "src"), spec)
+            if i == repeat:
+                peak = peak_bytes(lambda: run_app(root))
+            else:
+                st = time.perf_counter()
+                run_app(root)
+                best = min(best, time.perf_counter() - st)
+        finally:
+            shutil.rmtree(root)
+    return Row(param, stats.lines, best, peak, stats.tagged)
+
+
+def suite_size(repeat: int, seed: int) -> List[Row]:
+    spec = Spec(seed=seed)
+    return [engine_row(str(n), spec, n, repeat) for n in SIZE_LINES]
+
+
+def suite_density(repeat: int, seed: int) -> List[Row]:
+    return [engine_row(str(d), Spec(seed=seed, tag_density=d), LINES, repeat)
+            for d in DENSITIES]
+
+
+def suite_blocks(repeat: int, seed: int) -> List[Row]:
+    return [engine_row(str(n), Spec(seed=seed, block_lines=n,
+                                    block_rate=BLOCK_FRACTION / n),
+                       LINES, repeat)
+            for n in BLOCK_SIZES]
+
+
+def suite_nesting(repeat: int, seed: int) -> List[Row]:
+    return [engine_row(str(n), Spec(seed=seed, nesting=n, docstring_rate=0.02,
+                                    docstring_lines=50),
+                       LINES, repeat)
+            for n in NESTING]
+
+
+def suite_files(repeat: int, seed: int) -> List[Row]:
+    return [app_row(str(n), Spec(seed=seed, files=n), repeat)
+            for n in NUM_FILES]
+
+
+def suite_depth(repeat: int, seed: int) -> List[Row]:
+    return [app_row(str(d), Spec(seed=seed, files=DEPTH_FILES, depth=d,
+                                 fanout=4), repeat)
+            for d in DEPTHS]
+
+
+# name: (what varies, suite, whether it grows the input)
+SUITES = {
+    "size": ("lines", suite_size, True),
+    "density": ("tag density", suite_density, False),
+    "blocks": ("block lines", suite_blocks, False),
+    "nesting": ("nesting", suite_nesting, False),
+    "files": ("files (App)", suite_files, True),
+    "depth": ("depth (App)", suite_depth, False),
+}
+
+
+def slope(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    """Exponent k of y = c * x^k through the points a & b"""
+    (x1, y1), (x2, y2) = a, b
+    if x1 == x2 or y1 <= 0 or y2 <= 0:
+        return float("nan")
+    return math.log(y2 / y1) / math.log(x2 / x1)
+
+
+def print_rows(title: str, rows: List[Row], grows: bool):
+    header = f"{title:>12} {'lines':>9} {'time':>10} {'Mlines/s':>9} " \
+        f"{'peak':>10} {'B/line':>7} {'changed':>8}"
+    if grows:
+        header += f" {'t slope':>7} {'m slope':>7}"
+    print(header)
+    for i, r in enumerate(rows):
+        line = (f"{r.param:>12} {r.lines:9} {r.seconds * 1e3:8.1f}ms "
+                f"{r.lines / r.seconds / 1e6:9.2f} {r.peak / 1024:8.0f}KiB "
+                f"{r.peak / r.lines:7.0f} {r.changed:8}")
+        if grows and i > 0:
+            prev = rows[i - 1]
+            t_slope = slope((prev.lines, prev.seconds), (r.lines, r.seconds))
+            m_slope = slope((prev.lines, prev.peak), (r.lines, r.peak))
+            line += f" {t_slope:7.2f} {m_slope:7.2f}"
+        print(line)
+    print("")
+
+
+def main():
+    name = sys.argv[1] if len(sys.argv) > 1 else "all"
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+
+    names = list(SUITES) if name == "all" else [name]
+    for n in names:
+        title, suite, grows = SUITES[n]
+        print_rows(title, suite(repeat, seed), grows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""File discovery: the os.walk based walk, drained into a list and
+filtered on .py afterwards (what pytag used to do before processing
+the first file), vs the os.scandir walk of filepaths_from_path, which
+filters on the extension as it goes and yields files as they are found.
+
+Reports the time until the first file can be processed and the time
+of the whole walk, on the tree of bench_exclude.py.
+
+Usage: python benchmarks/bench_walk.py [num_entries] [fanout] [repeat]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from bench_exclude import PATTERNS, make_tree
+from pytagged import _files_utils
+from pytagged.app import PY_EXT
+
+
+def os_walk_files(path, is_excluded):
+    if is_excluded(path):
+        return
+    for root, subdirs, fnames in os.walk(path):
+        if is_excluded(root):
+            subdirs[:] = []
+            continue
+        subdirs[:] = [d for d in subdirs if not is_excluded(d)]
+        for f in fnames:
+            joined = os.path.join(root, f)
+            if not is_excluded(joined):
+                yield joined
+
+
+def os_walk_list(path, is_excluded):
+    files = [f for f in os_walk_files(path, is_excluded) if f.endswith(PY_EXT)]
+    return iter(files)
+
+
+def scandir_walk(path, is_excluded):
+    return _files_utils.filepaths_from_path(path, is_excluded, PY_EXT)
+
+
+def main():
+    num_entries = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    fanout = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    root = tempfile.mkdtemp(prefix="pytagged-bench-")
+    try:
+        make_tree(root, num_entries, fanout)
+        matcher = _files_utils.PathMatcher(PATTERNS)
+        print(f"{num_entries} entries, {len(PATTERNS)} patterns")
+        print(f"{'':10} {'first file':>12} {'whole walk':>12} {'files':>8}")
+        for name, walk in (("os.walk", os_walk_list),
+                           ("scandir", scandir_walk)):
+            best_first = best_total = float("inf")
+            for _ in range(repeat):
+                st = time.perf_counter()
+                it = walk(root, matcher)
+                next(it)
+                first = time.perf_counter() - st
+                num_files = 1 + sum(1 for _ in it)
+                total = time.perf_counter() - st
+                best_first = min(best_first, first)
+                best_total = min(best_total, total)
+            print(f"{name:10} {best_first * 1e3:10.2f}ms "
+                  f"{best_total * 1e3:10.1f}ms {num_files:8}")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""Seeded synthetic corpus of python-like files, for the benchmarks
+that need more than the few files of test_files/. The same spec and
+seed always give the same files, byte for byte.
+
+A spec controls the number of files, the distribution of their sizes
+(log-normal number of lines around a median), the density of tagged
+lines, the rate & size of tagged blocks, the rate & size of docstrings
+and how many triple quote regions are nested in each of them, and the
+depth of the directory tree. Docstrings contain tags & blocks too,
+which must be left alone.
+
+Usage: python benchmarks/corpus.py out_dir [num_files] [seed]
+"""
+import math
+import os
+import random
+import sys
+from typing import List, NamedTuple, Tuple
+
+
+class Spec(NamedTuple):
+    seed: int = 0
+    files: int = 100
+    # lines per file: log-normal, median_lines * e^(size_sigma * N(0, 1)),
+    # clamped to [1, max_lines]
+    median_lines: int = 200
+    size_sigma: float = 1.0
+    max_lines: int = 100000
+    # fraction of the statements that end with a tag
+    tag_density: float = 0.02
+    # chance that a block starts at a line, and mean lines per block
+    block_rate: float = 0.01
+    block_lines: int = 20
+    # same for docstrings, which hold nesting regions of the other
+    # quote kind inside each other
+    docstring_rate: float = 0.01
+    docstring_lines: int = 10
+    nesting: int = 1
+    # files are spread over directories 0 to depth levels deep,
+    # with at most fanout subdirectories per directory
+    depth: int = 3
+    fanout: int = 8
+    tag: str = "debug"
+
+
+class Stats(NamedTuple):
+    files: int
+    lines: int
+    bytes: int
+    # tagged lines & block bodies outside of docstrings, the lines
+    # a run comments out if docstrings aren't nested
+    tagged: int
+    blocks: int
+    docstrings: int
+
+
+QUOTES = ('"""', "'''")
+
+
+class _Source:
+    """Lines of one file, with the counts of what was generated"""
+
+    def __init__(self, rng: random.Random, spec: Spec):
+        self.rng = rng
+        self.spec = spec
+        self.lines = []     # type: List[str]
+        self.tagged = 0
+        self.blocks = 0
+        self.docstrings = 0
+
+    def statement(self, counted: bool = True) -> str:
+        """Statement, that ends with a tag at the tag density,
+        counted as tagged unless it is in a block or a docstring
+        """
+        n = len(self.lines)
+        line = f"value_{n} = compute({n}, 'abc', key={n % 7})"
+        if self.rng.random() < self.spec.tag_density:
+            if counted:
+                self.tagged += 1
+            return f"{line}  # {self.spec.tag}\n"
+        return line + "\n"
+
+    def block(self, in_string: bool = False):
+        size = max(1, int(self.rng.expovariate(1 / self.spec.block_lines)))
+        self.lines.append(f"# block: {self.spec.tag}\n")
+        for _ in range(size):
+            self.lines.append(self.statement(counted=False))
+        self.lines.append("# end\n")
+        if not in_string:
+            self.blocks += 1
+            self.tagged += size
+
+    def docstring(self, level: int = 0):
+        quote = QUOTES[level % 2]
+        size = max(1, int(self.rng.expovariate(1 / self.spec.docstring_lines)))
+        # the engines only see a line that starts with triple quotes
+        # as the start of a region, and one that ends with them as its end
+        self.lines.append(f"{quote}doc {len(self.lines)}\n")
+        for i in range(size):
+            if level < self.spec.nesting and i == size // 2:
+                self.docstring(level + 1)
+            elif self.rng.random() < self.spec.block_rate:
+                self.block(in_string=True)
+            else:
+                self.lines.append(self.statement(counted=False))
+        self.lines.append(f"{quote}\n")
+        if level == 0:
+            self.docstrings += 1
+
+    def fill(self, num_lines: int) -> str:
+        spec = self.spec
+        while len(self.lines) < num_lines:
+            r = self.rng.random()
+            if r < spec.block_rate:
+                self.block()
+            elif r < spec.block_rate + spec.docstring_rate:
+                self.docstring()
+            else:
+                self.lines.append(self.statement())
+        return "".join(self.lines)
+
+
+def num_lines(rng: random.Random, spec: Spec) -> int:
+    n = spec.median_lines * math.exp(spec.size_sigma * rng.gauss(0, 1))
+    return max(1, min(spec.max_lines, int(n)))
+
+
+def make_source(rng: random.Random, spec: Spec,
+                lines: int) -> Tuple[str, Stats]:
+    """Source of about lines lines, a block or docstring started
+    near the end is finished, so the file may be a bit longer
+    """
+    src = _Source(rng, spec)
+    text = src.fill(lines)
+    return text, Stats(1, len(src.lines), len(text.encode()), src.tagged,
+                       src.blocks, src.docstrings)
+
+
+def write_corpus(root: str, spec: Spec) -> Stats:
+    """Write the corpus of spec under root
+
+    Returns:
+        Stats: totals over all the files
+    """
+    rng = random.Random(spec.seed)
+    totals = [0] * len(Stats._fields)
+    for i in range(spec.files):
+        depth = rng.randint(0, spec.depth)
+        parts = [f"pkg{rng.randrange(spec.fanout)}" for _ in range(depth)]
+        text, stats = make_source(rng, spec, num_lines(rng, spec))
+        dir_path = os.path.join(root, *parts)
+        os.makedirs(dir_path, exist_ok=True)
+        with open(os.path.join(dir_path, f"mod{i}.py"), "w") as f:
+            f.write(text)
+        totals = [t + s for t, s in zip(totals, stats)]
+    return Stats(*totals)
+
+
+def main():
+    out_dir = sys.argv[1]
+    num_files = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+
+    stats = write_corpus(out_dir, Spec(seed=seed, files=num_files))
+    for name, value in zip(Stats._fields, stats):
+        print(f"{name:12} {value:>12,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,687 @@
+"""Benchmark mode reports: the time of each phase of a run is measured
+with time.perf_counter_ns, then summarized over the runs with the mean,
+standard deviation and percentiles, along with the throughput. Reports
+are printed as text or written as JSON, to be archived and compared
+across releases.
+"""
+import io
+import itertools
+import json
+import math
+import os
+import sys
+import time
+from typing import (
+    Any, Callable, Dict, IO, List, NamedTuple, Optional, Sequence, Tuple, Union,
+)
+
+from pytagged import __version__
+from pytagged import _files_utils
+from pytagged import _gitignore
+from pytagged import _prefilter
+from pytagged import _proc
+from pytagged import _utils
+from pytagged import _write
+from pytagged import nline
+from pytagged._bench_defaults import (
+    BASELINE_DIR, BYTES_ENGINE_NAMES, DEFAULT_MAX_SLOWDOWN,
+)
+
+_SEPS = tuple(s for s in (os.sep, os.altsep) if s)
+
+try:
+    perf_counter_ns = time.perf_counter_ns
+except AttributeError:
+    # python 3.6
+    def perf_counter_ns() -> int:
+        return int(time.perf_counter() * 10**9)
+
+PERCENTILES = (50, 90, 99)
+# bump this whenever the layout of the JSON report changes
+REPORT_VERSION = 1
+# confidence level & resamples of the bootstrapped intervals
+CONFIDENCE = 0.95
+RESAMPLES = 2000
+
+# run time of each phase, in ns, one sample per measured run
+Samples = Dict[str, List[int]]
+Report = Dict[str, Any]
+
+
+def percentile(sorted_samples: Sequence[float], p: float) -> float:
+    """p-th percentile, interpolated linearly between the closest ranks
+
+    Args:
+        sorted_samples (Sequence[float]): samples, in ascending order
+        p (float): percentile, between 0 and 100
+
+    Returns:
+        float: the percentile, 0 if there are no samples
+    """
+    if not sorted_samples:
+        return 0.0
+    rank = (len(sorted_samples) - 1) * p / 100
+    lo = math.floor(rank)
+    hi = min(lo + 1, len(sorted_samples) - 1)
+    frac = rank - lo
+    return sorted_samples[lo] * (1 - frac) + sorted_samples[hi] * frac
+
+
+def summarize(samples: Sequence[int]) -> Dict[str, float]:
+    """Mean, sample standard deviation, min, percentiles & max of
+    samples, in the unit of the samples
+    """
+    import statistics
+
+    ordered = sorted(samples)
+    stats = {
+        "mean": statistics.mean(ordered) if ordered else 0.0,
+        "stdev": statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+        "min": ordered[0] if ordered else 0.0,
+    }
+    for p in PERCENTILES:
+        stats[f"p{p}"] = percentile(ordered, p)
+    stats["max"] = ordered[-1] if ordered else 0.0
+    return stats
+
+
+# engines of the memory benchmark besides the text engines of
+# nline.ENGINES, these work on the raw bytes of the files
+BYTES_ENGINES = {
+    "bytes": nline.get_newlines_bytes,
+    "edits": nline.get_edits_bytes,
+}
+assert tuple(BYTES_ENGINES) == BYTES_ENGINE_NAMES
+
+
+def load_sources(paths: Sequence[str], engine: str) -> List[Union[str, bytes]]:
+    """Content of each file, as bytes for the bytes engines, else as
+    text decoded like the files opened by the other benchmarks
+    """
+    sources = []
+    for p in paths:
+        if engine in BYTES_ENGINES:
+            with open(p, "rb") as f:
+                sources.append(f.read())
+        else:
+            with open(p) as f:
+                sources.append(f.read())
+    return sources
+
+
+def time_engine(sources: Sequence[Union[str, bytes]],
+                engine: str,
+                matcher: nline.Matcher,
+                timer: Callable[[], int] = perf_counter_ns) -> Tuple[int, int]:
+    """Run the engine over every source, text engines read them
+    from io.StringIO buffers, which are created before the timer starts
+
+    Args:
+        sources (Sequence[Union[str, bytes]]): from load_sources
+        engine (str): one of engine_names()
+        matcher (nline.Matcher): matcher of the tags
+        timer (Callable[[], int]): timer in ns
+
+    Returns:
+        Tuple[int, int]: ns taken by the engine, and number of
+            files with lines commented out
+    """
+    if engine in BYTES_ENGINES:
+        fn = BYTES_ENGINES[engine]
+        inputs = sources
+    else:
+        fn = nline.ENGINES[engine]
+        inputs = [io.StringIO(src) for src in sources]
+    st = timer()
+    results = [fn(i, matcher) for i in inputs]
+    elapsed = timer() - st
+
+    if engine == "edits":
+        changed = sum(1 for edits in results if edits)
+    else:
+        changed = sum(1 for res in results if res is not None and res.changed)
+    return elapsed, changed
+
+
+# phases of the e2e benchmark, and their titles
+E2E_PHASES = {
+    "walk": "Walk",
+    "filter": "Exclude patterns & prefilter",
+    "read": "Open & read file",
+    "transform": "Generate edits",
+    "write": "Write edits",
+    "close": "Close file",
+}
+# linux ioctl that makes the destination share the blocks of the source
+_FICLONE = 0x40049409
+
+
+def clone_file(src: str, dst: str) -> str:
+    """Copy src to dst as a reflink, whose blocks are only copied when
+    one of the files is written, where the file system supports it
+    (btrfs, xfs), else as a plain copy
+
+    Returns:
+        str: "reflink" or "copy"
+    """
+    if sys.platform.startswith("linux"):
+        import fcntl
+
+        with open(src, "rb") as fs, open(dst, "wb") as fd:
+            try:
+                fcntl.ioctl(fd.fileno(), _FICLONE, fs.fileno())
+                return "reflink"
+            except OSError:
+                pass
+    import shutil
+
+    shutil.copyfile(src, dst)
+    return "copy"
+
+
+def link_file(src: str, dst: str) -> str:
+    """Hardlink dst to src, or copy src if it can't be linked,
+    only for the files that are never written
+
+    Returns:
+        str: "hardlink" or "copy"
+    """
+    try:
+        os.link(src, dst)
+        return "hardlink"
+    except OSError:
+        import shutil
+
+        shutil.copyfile(src, dst)
+        return "copy"
+
+
+class Scratch:
+    """Copy of the tree at path in a temporary directory, that the e2e
+    benchmark can write to. Files with the extension are cloned, since
+    they are written in place, the others are hardlinked. Directories
+    that the walk prunes are created empty, and symlinks are left out.
+
+    Args:
+        path (str): file or directory to copy
+        extension (str): extension of the files that may be written
+        is_pruned (Callable[[str], bool]): whether the walk prunes
+            the directory at path
+    """
+
+    def __init__(self, path: str, extension: str,
+                 is_pruned: Callable[[str], bool]):
+        import tempfile
+
+        self.src = os.path.abspath(path)
+        self.extension = extension
+        self.is_pruned = is_pruned
+        self.dir = tempfile.mkdtemp(prefix="pytagged-bench-")
+        self.path = os.path.join(
+            self.dir, os.path.basename(self.src) or "root")
+        self.counts = {"reflink": 0, "hardlink": 0, "copy": 0}
+
+    def create(self, files: Sequence[str]) -> "Scratch":
+        """Copy the tree, files are the ones the walk finds, they are
+        cloned even if they don't have the extension
+        """
+        if not os.path.isdir(self.src):
+            self.counts[clone_file(self.src, self.path)] += 1
+            return self
+        to_clone = {os.path.abspath(f) for f in files}
+        for dir_path, dir_names, file_names in os.walk(self.src):
+            dst_dir = os.path.join(self.path, os.path.relpath(dir_path, self.src))
+            os.makedirs(dst_dir, exist_ok=True)
+            kept = []
+            for name in dir_names:
+                src = os.path.join(dir_path, name)
+                if os.path.islink(src):
+                    continue
+                if self.is_pruned(src):
+                    os.mkdir(os.path.join(dst_dir, name))
+                else:
+                    kept.append(name)
+            dir_names[:] = kept
+            for name in file_names:
+                src = os.path.join(dir_path, name)
+                dst = os.path.join(dst_dir, name)
+                # files with the extension are cloned even if the walk
+                # left them out, in case the copy isn't walked the same
+                writable = name.endswith(self.extension) and os.path.isfile(src)
+                if src in to_clone or writable:
+                    self.counts[clone_file(src, dst)] += 1
+                elif not os.path.islink(src) and os.path.isfile(src):
+                    self.counts[link_file(src, dst)] += 1
+        return self
+
+    def original(self, path: str) -> str:
+        """Path of the original of the copy at path"""
+        if path == self.path:
+            return self.src
+        return os.path.join(self.src, os.path.relpath(path, self.path))
+
+    def reset(self, paths: Sequence[str]):
+        """Clone the copies at paths again from their originals"""
+        for p in paths:
+            os.unlink(p)
+            clone_file(self.original(p), p)
+
+    def remove(self):
+        import shutil
+
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def __enter__(self) -> "Scratch":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.remove()
+
+
+class E2ERun(NamedTuple):
+    # ns per phase of E2E_PHASES
+    times: Dict[str, int]
+    files: int
+    # paths of the files that were written
+    written: List[str]
+    prefiltered: int
+    # streamed, or not ASCII compatible, processed by _proc.proc_file
+    # and timed as a whole in transform
+    fallback: int
+
+
+def time_e2e(path: str,
+             is_excluded: Callable[[str], bool],
+             extension: str,
+             respect_gitignore: bool,
+             tags: Sequence[str],
+             stream_threshold: int = _proc.STREAM_THRESHOLD,
+             durability: Optional[str] = None,
+             timer: Callable[[], int] = perf_counter_ns) -> E2ERun:
+    """Run the default mode pipeline on path, like a serial run without
+    the cache & the journal: the files are processed as the walk finds
+    them, and changed files are written in place, or atomically with
+    a durability. The time spent in is_excluded & in the prefilter is
+    counted as filter, and left out of the walk.
+
+    Args:
+        path (str): copy of the tree, whose files get written
+        is_excluded (Callable[[str], bool]): exclude patterns matcher
+        extension (str): extension of the files to process
+        respect_gitignore (bool): prune the entries that git ignores
+        tags (Sequence[str]): tags
+        stream_threshold (int): stream files at least this big
+        durability (Optional[str]): durability of atomic writes,
+            None to write in place
+        timer (Callable[[], int]): timer in ns
+
+    Returns:
+        E2ERun: result
+    """
+    times = dict.fromkeys(E2E_PHASES, 0)
+    exclude_ns = 0
+    prefilter_ns = 0
+
+    def timed_is_excluded(p: str) -> bool:
+        nonlocal exclude_ns
+        st = timer()
+        res = is_excluded(p)
+        exclude_ns += timer() - st
+        return res
+
+    st = timer()
+    ignore = _gitignore.GitIgnore(path) if respect_gitignore else None
+    gen_files = _files_utils.filepaths_from_path(
+        path, timed_is_excluded, extension, ignore)
+    matcher = nline.get_matcher(tags)
+    prefilter = _prefilter.Prefilter(tags)
+    writer = None
+    if durability is not None:
+        writer = _write.AtomicWriter(durability)
+    times["walk"] += timer() - st
+
+    num_files = 0
+    written = []
+    fallback = 0
+    while True:
+        st = timer()
+        f = next(gen_files, None)
+        times["walk"] += timer() - st
+        if f is None:
+            break
+        num_files += 1
+
+        st = timer()
+        if not prefilter.may_match(f):
+            prefilter_ns += timer() - st
+            continue
+        t0 = timer()
+        prefilter_ns += t0 - st
+
+        if os.path.getsize(f) < stream_threshold:
+            fi = open(f, "r+b" if writer is None else "rb")
+            try:
+                data = fi.read()
+                t1 = timer()
+                times["read"] += t1 - t0
+                edits = nline.get_edits_bytes(data, matcher)
+                t2 = timer()
+                times["transform"] += t2 - t1
+                if edits and writer is None:
+                    _proc.write_edits(fi, data, edits)
+                t3 = timer()
+            finally:
+                # closed on its own, to be timed
+                fi.close()
+            t4 = timer()
+            times["close"] += t4 - t3
+            if edits and writer is not None:
+                prefix = memoryview(data)[:edits[0].offset]
+                writer.write(f, itertools.chain(
+                    (prefix,), nline.iter_edited(data, edits)))
+            times["write"] += t3 - t2 + timer() - t4
+            if edits is not None:
+                if edits:
+                    written.append(f)
+                continue
+            t0 = timer()
+
+        res = _proc.proc_file(f, matcher, write=True, keep_lines=False,
+                              stream_threshold=stream_threshold,
+                              writer=writer)
+        times["transform"] += timer() - t0
+        fallback += 1
+        if res.written:
+            written.append(f)
+
+    if writer is not None:
+        st = timer()
+        writer.flush()
+        times["write"] += timer() - st
+    # is_excluded is called by the walk, its time is only counted once
+    times["walk"] -= exclude_ns
+    times["filter"] = exclude_ns + prefilter_ns
+    return E2ERun(times, num_files, written, prefilter.misses, fallback)
+
+
+def make_report(kind: str,
+                samples: Samples,
+                warmup: int,
+                num_files: int,
+                num_lines: int,
+                num_bytes: int,
+                misc: Optional[Dict[str, Any]] = None) -> Report:
+    """Build the report of a benchmark. The throughput is computed
+    from the median run time over all the phases.
+
+    Args:
+        kind (str): what was measured
+        samples (Samples): ns per phase & run, in phase order
+        warmup (int): number of warmup runs, not in samples
+        num_files (int): files processed per run
+        num_lines (int): lines processed per run
+        num_bytes (int): bytes processed per run
+        misc (Optional[Dict[str, Any]]): other numbers to report
+
+    Returns:
+        Report: JSON serializable report
+    """
+    import platform
+
+    runs = len(next(iter(samples.values()), []))
+    totals = [sum(run) for run in zip(*samples.values())]
+    all_samples = dict(samples, total=totals)
+
+    phases = {}
+    for name, phase_samples in all_samples.items():
+        stats = summarize(phase_samples)
+        stats["per_file"] = stats["mean"] / num_files if num_files else 0.0
+        stats["per_line"] = stats["mean"] / num_lines if num_lines else 0.0
+        phases[name] = stats
+
+    median_s = phases["total"]["p50"] / 10**9
+    return {
+        "report_version": REPORT_VERSION,
+        "kind": kind,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "pytagged": __version__,
+        "engine": nline.ENGINE_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "unit": "ns",
+        "runs": runs,
+        "warmup": warmup,
+        "files": num_files,
+        "lines": num_lines,
+        "bytes": num_bytes,
+        "throughput": {
+            "lines_per_sec": num_lines / median_s if median_s else 0.0,
+            "mb_per_sec": num_bytes / 10**6 / median_s if median_s else 0.0,
+        },
+        "phases": phases,
+        "samples": all_samples,
+        "misc": misc or {},
+    }
+
+
+class BaselineError(Exception):
+    pass
+
+
+def baseline_path(name: str, cache_dir: str) -> str:
+    """Path of the baseline name: a plain name is saved as name.json
+    in the baselines directory of the cache dir, a name with a
+    separator or ending in .json is a path
+    """
+    if name.endswith(".json") or any(sep in name for sep in _SEPS):
+        return name
+    return os.path.join(cache_dir, BASELINE_DIR, name + ".json")
+
+
+def save_baseline(report: Report, path: str):
+    dir_path = os.path.dirname(path)
+    if dir_path:
+        os.makedirs(dir_path, exist_ok=True)
+    with open(path, "w") as f:
+        write_json(report, f)
+
+
+def load_baseline(path: str) -> Report:
+    """Report saved at path
+
+    Raises:
+        BaselineError: if it can't be read, or isn't a report of
+            this version with its samples
+    """
+    try:
+        with open(path) as f:
+            baseline = json.load(f)
+    except (OSError, ValueError) as e:
+        raise BaselineError(f"could not load the baseline {path}: {e}")
+    if not isinstance(baseline, dict) or "samples" not in baseline:
+        raise BaselineError(f"{path} is not a benchmark report")
+    if baseline.get("report_version") != REPORT_VERSION:
+        raise BaselineError(
+            f"{path} is a version {baseline.get('report_version')} report, "
+            f"only version {REPORT_VERSION} can be compared")
+    return baseline
+
+
+def bootstrap_delta(base: Sequence[int],
+                    current: Sequence[int],
+                    rng: Any,
+                    confidence: float = CONFIDENCE,
+                    resamples: int = RESAMPLES) -> Tuple[float, float, float]:
+    """Relative change of the median from base to current, 0.1 for 10%
+    slower, with its confidence interval, from the percentiles of the
+    change between medians of samples drawn with replacement
+
+    Args:
+        base (Sequence[int]): samples of the baseline
+        current (Sequence[int]): samples of the current run
+        rng (random.Random): source of the resamples
+        confidence (float): confidence level of the interval
+        resamples (int): number of resamples
+
+    Returns:
+        Tuple[float, float, float]: change, low & high bounds
+    """
+    def median(samples: Sequence[int]) -> float:
+        return percentile(sorted(samples), 50)
+
+    def change(b: float, c: float) -> float:
+        return c / b - 1 if b else 0.0
+
+    delta = change(median(base), median(current))
+    if len(base) < 2 and len(current) < 2:
+        return delta, delta, delta
+    changes = sorted(
+        change(median(rng.choices(base, k=len(base))),
+               median(rng.choices(current, k=len(current))))
+        for _ in range(resamples))
+    tail = (1 - confidence) / 2 * 100
+    return delta, percentile(changes, tail), percentile(changes, 100 - tail)
+
+
+def compare(baseline: Report,
+            report: Report,
+            max_slowdown: float = DEFAULT_MAX_SLOWDOWN,
+            seed: int = 0) -> Dict[str, Any]:
+    """Compare the samples of each phase of report to the baseline. The
+    run regressed if its total is more than max_slowdown percent slower,
+    and the whole confidence interval of the change is above 0.
+
+    Args:
+        baseline (Report): from load_baseline
+        report (Report): from make_report
+        max_slowdown (float): percentage
+        seed (int): seed of the resamples, so that the same reports
+            always give the same intervals
+
+    Raises:
+        BaselineError: if the reports measured different things
+
+    Returns:
+        Dict[str, Any]: JSON serializable comparison
+    """
+    import random
+
+    if baseline["kind"] != report["kind"]:
+        raise BaselineError(f"the baseline is of kind {baseline['kind']}, "
+                            f"this benchmark of kind {report['kind']}")
+    warnings = []
+    for k in ("files", "lines", "bytes", "python"):
+        if baseline.get(k) != report[k]:
+            warnings.append(f"{k} differ, {baseline.get(k)} in the baseline, "
+                            f"{report[k]} now")
+
+    rng = random.Random(seed)
+    phases = {}
+    for name, samples in report["samples"].items():
+        base = baseline["samples"].get(name)
+        if not base or not samples:
+            continue
+        delta, low, high = bootstrap_delta(base, samples, rng)
+        phases[name] = {
+            "baseline": percentile(sorted(base), 50),
+            "current": percentile(sorted(samples), 50),
+            "delta": delta,
+            "low": low,
+            "high": high,
+            "slower": delta * 100 > max_slowdown and low > 0,
+        }
+    total = phases.get("total")
+    return {
+        "baseline_created": baseline.get("created"),
+        "baseline_pytagged": baseline.get("pytagged"),
+        "confidence": CONFIDENCE,
+        "max_slowdown": max_slowdown,
+        "phases": phases,
+        "regressed": total is not None and total["slower"],
+        "warnings": warnings,
+    }
+
+
+def write_json(report: Report, out: IO):
+    json.dump(report, out, indent=2)
+    out.write("\n")
+
+
+def print_text(report: Report, titles: Dict[str, str]):
+    """Print the report for a terminal, times in ms
+
+    Args:
+        report (Report): report from make_report
+        titles (Dict[str, str]): title of each phase
+    """
+    from shutil import get_terminal_size
+
+    width = get_terminal_size().columns // 4
+    titles = dict(titles, total="Total")
+    _utils.pretty_print_title("PERFORMANCE REPORT", span=True)
+    print('')
+    info = {
+        "Number of files": report["files"],
+        "Number of lines": report["lines"],
+        "Number of bytes": report["bytes"],
+        "Number of runs": report["runs"],
+        "Warmup runs": report["warmup"],
+    }
+    info.update(report["misc"])
+    for k, v in info.items():
+        print(f"{k:{width}} {v:>{width}}")
+    print('')
+
+    for name, stats in report["phases"].items():
+        _utils.pretty_print_title(titles.get(name, name), span=True)
+        for k, v in stats.items():
+            key = f"{k} per run" if k not in ("per_file", "per_line") \
+                else k.replace("_", " ")
+            print(f"{key:{width}} {v / 10**6:>{width - 2}.4f}ms")
+        print('')
+
+    _utils.pretty_print_title("Throughput", span=True)
+    throughput = report["throughput"]
+    print(f"{'lines/s':{width}} {throughput['lines_per_sec']:>{width}.0f}")
+    print(f"{'MB/s':{width}} {throughput['mb_per_sec']:>{width}.2f}")
+    print('')
+    if "comparison" in report:
+        print_comparison(report["comparison"], titles)
+    _utils.pretty_print_title("END REPORT", span=True)
+
+
+def print_comparison(comparison: Dict[str, Any], titles: Dict[str, str]):
+    """Print the median of each phase in the baseline & now, in ms,
+    and the change with its confidence interval
+    """
+    _utils.pretty_print_title(
+        f"Compared to the baseline of {comparison['baseline_created']}",
+        span=True)
+    level = round(comparison["confidence"] * 100)
+    for name, c in comparison["phases"].items():
+        mark = "  SLOWER" if c["slower"] else ""
+        print(f"{titles.get(name, name):28} {c['baseline'] / 10**6:>10.4f}ms "
+              f"-> {c['current'] / 10**6:>10.4f}ms {c['delta']:>+8.1%} "
+              f"[{c['low']:+.1%}, {c['high']:+.1%}] {level}% CI{mark}")
+    print('')
+
+
+def output_report(report: Report, fmt: str, path: Optional[str],
+                  titles: Dict[str, str]):
+    """Print the report as text or JSON, to the file at path,
+    or to stdout if path is None
+    """
+    if path is None:
+        _output_report(report, fmt, titles)
+        return
+    from contextlib import redirect_stdout
+
+    with open(path, "w") as f, redirect_stdout(f):
+        _output_report(report, fmt, titles)
+
+
+def _output_report(report: Report, fmt: str, titles: Dict[str, str]):
+    if fmt == "json":
+        write_json(report, sys.stdout)
+    else:
+        print_text(report, titles)
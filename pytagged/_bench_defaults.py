@@ -0,0 +1,30 @@
+"""Choices & defaults of the benchmark mode options, apart from
+_bench so that parsing the cli args doesn't import all of it.
+"""
+from typing import List
+
+from pytagged import nline
+
+FORMATS = ("text", "json")
+DEFAULT_FORMAT = "text"
+# io: each file is copied to a temporary file then processed,
+# memory: the engine alone, on files loaded in memory once,
+# e2e: the whole default mode pipeline, on a scratch copy of the tree
+KINDS = ("io", "memory", "e2e")
+DEFAULT_KIND = "io"
+# runs done before the measured ones, to warm up the page cache,
+# the lru caches of the matchers and the allocator
+DEFAULT_WARMUP = 3
+# named baselines are saved in this directory of the cache dir
+BASELINE_DIR = "baselines"
+# a run whose total is slower than the baseline by more than this
+# percentage, with a confidence interval above 0, is a regression
+DEFAULT_MAX_SLOWDOWN = 10.0
+# engines of the memory benchmark besides the text engines of
+# nline.ENGINES, these work on the raw bytes of the files,
+# see _bench.BYTES_ENGINES
+BYTES_ENGINE_NAMES = ("bytes", "edits")
+
+
+def engine_names() -> List[str]:
+    return [*nline.ENGINES, *BYTES_ENGINE_NAMES]
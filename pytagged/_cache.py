@@ -0,0 +1,170 @@
+"""On disk cache of files that are known to be left
+unchanged by a run with a given set of tags, so that
+repeated runs only read the files that changed since.
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+from pytagged import __version__
+from pytagged import nline
+
+
+DEFAULT_CACHE_DIR = ".pytagged_cache"
+INDEX_NAME = "index.json"
+README = "# Created by pytagged, safe to delete.\n"
+
+# a file modified this close to the time it was recorded
+# might have been modified again within the same mtime tick,
+# so its content hash is checked even if size & mtime match
+RACY_NS = 2 * 10**9
+
+# entry: [size, mtime_ns, content digest, time recorded in ns]
+Entry = List
+
+
+def normalize_tags(tags: Iterable[str]) -> str:
+    """Key for a set of tags, independent of order & duplicates"""
+    return ','.join(nline.normalize_tags(t.strip() for t in tags))
+
+
+def make_cache_dir(path: str):
+    """Create the directory path if needed, with a .gitignore that
+    ignores all of it, so that neither the index nor the journal,
+    which holds lines of source, show up in git status. Used for
+    every directory that pytagged writes its files to.
+    """
+    os.makedirs(path, exist_ok=True)
+    gitignore = os.path.join(path, ".gitignore")
+    if not os.path.exists(gitignore):
+        with open(gitignore, 'w') as f:
+            f.write(README + "*\n")
+
+
+def content_hash():
+    """Hash object of the content digests of the entries"""
+    return hashlib.blake2b(digest_size=16)
+
+
+def file_digest(path: str) -> str:
+    h = content_hash()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class Cache:
+    """Index of files that a run with the given tags leaves unchanged.
+    Entries are keyed by the absolute path, and hold the size,
+    mtime_ns and content hash of the file. A file is a hit if its
+    size and mtime match, or if only its mtime differs but its
+    content hash still matches. The whole index is dropped when
+    the pytagged version or the engine version changes.
+    """
+
+    def __init__(self, cache_dir: str, tags: Iterable[str],
+                 engine: str = nline.ENGINE_VERSION):
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, INDEX_NAME)
+        self.header = {"version": __version__, "engine": engine}
+        self.tags_key = normalize_tags(tags)
+        self.index = {}     # type: Dict[str, Dict[str, Entry]]
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+
+    @property
+    def entries(self) -> Dict[str, Entry]:
+        return self.index.setdefault(self.tags_key, {})
+
+    def load(self) -> "Cache":
+        try:
+            with open(self.index_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return self
+
+        if not isinstance(data, dict) or data.get("header") != self.header:
+            return self
+
+        index = data.get("index")
+        if isinstance(index, dict):
+            self.index = index
+        return self
+
+    def lookup(self, path: str) -> bool:
+        """Returns True if path is known to be left unchanged,
+        also counts hits & misses.
+        """
+        hit = self._lookup(os.path.abspath(path))
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return hit
+
+    def _lookup(self, abs_path: str) -> bool:
+        entry = self.entries.get(abs_path)
+        if entry is None:
+            return False
+
+        try:
+            st = os.stat(abs_path)
+        except OSError:
+            return False
+
+        size, mtime_ns, digest, recorded_ns = entry
+        if st.st_size != size:
+            return False
+
+        if st.st_mtime_ns == mtime_ns and st.st_mtime_ns < recorded_ns - RACY_NS:
+            return True
+
+        # same size, but mtime changed or is too recent to be trusted
+        try:
+            if file_digest(abs_path) != digest:
+                return False
+        except OSError:
+            return False
+
+        self._set(abs_path, st.st_size, st.st_mtime_ns, digest)
+        return True
+
+    def record(self, path: str, digest: Optional[str] = None):
+        """Record path as left unchanged by a run in its current state,
+        i.e. right after it has been processed. digest should be the
+        one of the content the run read or wrote, if None the file is
+        read again, and a change made since the run would be missed.
+        """
+        abs_path = os.path.abspath(path)
+        try:
+            st = os.stat(abs_path)
+            if digest is None:
+                digest = file_digest(abs_path)
+        except OSError:
+            self.entries.pop(abs_path, None)
+            return
+        self._set(abs_path, st.st_size, st.st_mtime_ns, digest)
+
+    def _set(self, abs_path: str, size: int, mtime_ns: int, digest: str):
+        recorded_ns = int(time.time() * 10**9)
+        self.entries[abs_path] = [size, mtime_ns, digest, recorded_ns]
+        self._dirty = True
+
+    def save(self):
+        """Write the index, replacing the old one atomically.
+        Raises OSError if the cache dir can't be written.
+        """
+        if not self._dirty:
+            return
+
+        make_cache_dir(self.cache_dir)
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        data = {"header": self.header, "index": self.index}
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, self.index_path)
+        self._dirty = False
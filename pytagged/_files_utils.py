@@ -1,6 +1,19 @@
 import os
+import re
+import stat
 import fnmatch as _fnmatch
-from typing import Sequence, Generator, Callable
+from functools import lru_cache
+from typing import (
+    Sequence, Generator, Callable, Optional, Pattern, Set, Tuple,
+)
+
+from pytagged import _gitignore
+
+# the full path is matched instead of the basename for these
+_WILDCARD_BASENAMES = ('**', "*")
+_SEPS = tuple(s for s in (os.sep, os.altsep) if s)
+# fnmatch normalizes the case of names & patterns, a no-op on posix
+_NORMCASE = os.path.normcase("A") != "A"
 
 
 def fnmatch(path: str, patterns: Sequence[str]) -> bool:
@@ -23,26 +36,90 @@ def match_path(path: str, patterns: Sequence[str]) -> bool:
     """
     if not patterns:
         return False
+    return get_path_matcher(patterns)(path)
+
+
+def _compile_patterns(patterns: Sequence[str]) -> Optional[Pattern]:
+    if not patterns:
+        return None
+    return re.compile("|".join(_fnmatch.translate(p) for p in patterns))
+
+
+class PathMatcher:
+    """Callable that matches paths like match_path(path, patterns),
+    with all the patterns translated once into a single compiled
+    regex per rule: one for basenames, one for full paths. Patterns
+    with a separator outside of [] can only match a full path, so
+    they are left out of the basename regex.
+
+    Args:
+        patterns (Sequence[str]): fnmatch patterns
+    """
+
+    def __init__(self, patterns: Sequence[str]):
+        patterns = list(dict.fromkeys(patterns))
+        if _NORMCASE:
+            patterns = [os.path.normcase(p) for p in patterns]
+        self.patterns = tuple(patterns)
+        self.basename_rgx = _compile_patterns(
+            [p for p in patterns
+             if '[' in p or not any(sep in p for sep in _SEPS)])
+        self.path_rgx = _compile_patterns(patterns)
+
+    def __call__(self, path: str) -> bool:
+        if self.path_rgx is None:
+            return False
+
+        # match basename
+        basename = os.path.basename(path)
+        if basename not in _WILDCARD_BASENAMES:
+            if self.basename_rgx is None:
+                return False
+            if _NORMCASE:
+                basename = os.path.normcase(basename)
+            return self.basename_rgx.match(basename) is not None
+
+        # match abspath
+        abs_path = os.path.abspath(path)
+        if _NORMCASE:
+            abs_path = os.path.normcase(abs_path)
+        return self.path_rgx.match(abs_path) is not None
 
-    # match basename
-    basename = os.path.basename(path)
-    if basename not in ('**', "*"):
-        return fnmatch(basename, patterns)
 
-    # match abspath
-    abs_path = os.path.abspath(path)
-    return fnmatch(abs_path, patterns)
+@lru_cache(maxsize=32)
+def _compile_path_matcher(patterns: Tuple[str, ...]) -> PathMatcher:
+    return PathMatcher(patterns)
+
+
+def get_path_matcher(patterns: Sequence[str]) -> PathMatcher:
+    """Get the matcher for patterns, matchers are cached by
+    their tuple of patterns
+    """
+    return _compile_path_matcher(tuple(patterns))
 
 
 def filepaths_from_path(
         path: str,
-        is_excluded: Callable[[str], bool]) -> Generator[str, str, None]:
-    """Generates filtered paths to files from a path.
+        is_excluded: Callable[[str], bool],
+        extension: str = "",
+        ignore: Optional[_gitignore.GitIgnore] = None
+) -> Generator[str, str, None]:
+    """Generates filtered paths to files from a path. The tree is walked
+    depth first with os.scandir, using the file type of each entry
+    instead of a stat. Each directory is read in full before its files
+    are yielded, so the caller can process them while the walk goes on.
+    Symlinks to directories are not followed, and a file reachable
+    through several symlinks or hard links is only yielded once.
 
     Args:
         path (str): Given path
         is_excluded (Callable[[str], bool]): Callable that takes a path and returns
             a bool. If True, exclude the path, else yield it.
+        extension (str): only yield the files with this extension,
+            every file by default
+        ignore (Optional[_gitignore.GitIgnore]): also leave out what the
+            .gitignore files ignore, ignored directories are pruned
+            without being read. Counts the pruned entries.
 
     Yields:
         Generator[str, str, None]: Generator of paths to files
@@ -50,21 +127,107 @@ def filepaths_from_path(
     if is_excluded(path):
         return
 
-    if os.path.isdir(path):
-        for root, subdirs, fnames in os.walk(path):
-            if is_excluded(root):
-                # if root is excluded, no need to walk the subdirs
-                subdirs[:] = []
+    if not os.path.isdir(path):
+        if path.endswith(extension):
+            yield path
+        return
+
+    # (st_dev, st_ino) of the files yielded so far
+    seen = set()    # type: Set[Tuple[int, int]]
+    # (directory, st_dev, scope), the inode of an entry is only unique
+    # per device, the scope of a subdirectory lacks its own .gitignore
+    scope = None if ignore is None else ignore.scope(path)
+    stack = [(path, os.stat(path).st_dev, scope)]
+    while stack:
+        root, dev, scope = stack.pop()
+        try:
+            with os.scandir(root) as it:
+                entries = list(it)
+        except OSError:
+            # gone, or not readable, like os.walk
+            continue
+        if scope is not None and root != path \
+                and any(e.name == _gitignore.GITIGNORE for e in entries):
+            # the listing tells which directories have a .gitignore
+            rule_set = ignore.rules(root)
+            if rule_set is not None:
+                scope.rule_sets.insert(0, (rule_set, ""))
+
+        subdirs = []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                if entry.is_symlink() or is_excluded(entry.path):
+                    continue
+                if scope is not None and scope.ignored(entry.name, True):
+                    ignore.pruned += 1
+                    continue
+                subdirs.append(entry)
+                continue
+            if not entry.name.endswith(extension) or is_excluded(entry.path):
+                continue
+            if scope is not None and scope.ignored(entry.name, False):
+                ignore.pruned += 1
+                continue
+
+            try:
+                if entry.is_symlink():
+                    st = os.stat(entry.path)
+                    if not stat.S_ISREG(st.st_mode):
+                        continue
+                    key = (st.st_dev, st.st_ino)
+                elif entry.is_file(follow_symlinks=False):
+                    key = (dev, entry.inode())
+                else:
+                    # fifos, sockets & devices
+                    continue
+            except OSError:
+                # broken symlink
+                continue
+            if key in seen:
+                continue
+            seen.add(key)
+            yield entry.path
+
+        for entry in reversed(subdirs):
+            try:
+                sub_dev = entry.stat(follow_symlinks=False).st_dev
+            except OSError:
                 continue
+            sub_scope = None if scope is None else scope.child(entry.name, None)
+            stack.append((entry.path, sub_dev, sub_scope))
+
+
+def is_excluded_under(path: str, root: str,
+                      is_excluded: Callable[[str], bool]) -> bool:
+    """Whether filepaths_from_path(root, is_excluded) would leave out
+    path, a file under root, without walking the tree: root, each
+    directory in between and the file are matched like the walk does.
+
+    Args:
+        path (str): path to a file, under root
+        root (str): path given to filepaths_from_path
+        is_excluded (Callable[[str], bool]): same as for filepaths_from_path
+
+    Returns:
+        bool: True if path is excluded, or not under root
+    """
+    if is_excluded(root):
+        return True
+    rel = os.path.relpath(path, root)
+    if rel == os.curdir:
+        # root is the file itself
+        return False
+    if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+        return True
 
-            for d in subdirs:
-                # remove excluded directory
-                if is_excluded(d):
-                    subdirs.remove(d)
-
-            for f in fnames:
-                joined = os.path.join(root, f)
-                if not is_excluded(joined):
-                    yield joined
-    else:
-        yield path
+    parts = rel.split(os.sep)
+    cur = root
+    for d in parts[:-1]:
+        cur = os.path.join(cur, d)
+        if is_excluded(cur):
+            return True
+    return is_excluded(path)
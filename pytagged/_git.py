@@ -0,0 +1,83 @@
+"""File selection from git: the files changed since a ref, or staged
+in the index, instead of every file under the path. The cost of a run
+is then proportional to the size of the change, not of the repo.
+"""
+import os
+import subprocess
+from typing import Callable, List, Optional
+
+from pytagged import _files_utils
+
+
+class GitError(Exception):
+    pass
+
+
+def _git(args: List[str], cwd: str) -> bytes:
+    try:
+        completed = subprocess.run(
+            ["git", *args], cwd=cwd,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        raise GitError(f"could not run git: {e}")
+    if completed.returncode != 0:
+        msg = completed.stderr.decode(errors="replace").strip()
+        raise GitError(f"git {args[0]} failed: {msg}")
+    return completed.stdout
+
+
+def _names(out: bytes) -> List[str]:
+    return [os.fsdecode(n) for n in out.split(b"\0") if n]
+
+
+def changed_files(path: str,
+                  since: Optional[str],
+                  staged: bool,
+                  is_excluded: Callable[[str], bool]) -> List[str]:
+    """Files under path that changed according to git, filtered like
+    _files_utils.filepaths_from_path(path, is_excluded) would.
+
+    Args:
+        path (str): file or directory in a git work tree
+        since (Optional[str]): files changed between this ref and the
+            work tree, committed or not, plus untracked files
+        staged (bool): files changed in the index, if since is None,
+            otherwise along with the ones changed since the ref
+        is_excluded (Callable[[str], bool]): same as for
+            filepaths_from_path
+
+    Returns:
+        List[str]: sorted paths, joined to path like the walk does.
+            Deleted files are left out.
+
+    Raises:
+        GitError: git isn't installed, path isn't in a work tree,
+            or since isn't a valid ref
+    """
+    # git prints the real path of the work tree
+    abs_path = os.path.realpath(path)
+    cwd = abs_path if os.path.isdir(abs_path) else os.path.dirname(abs_path)
+    top = os.fsdecode(
+        _git(["rev-parse", "--show-toplevel"], cwd).rstrip(b"\n"))
+    spec = ["--", os.path.relpath(abs_path, top)]
+    # added, copied, modified, renamed or type changed, not deleted
+    diff = ["diff", "--name-only", "-z", "--diff-filter=ACMRT"]
+
+    names = set()
+    if staged:
+        names.update(_names(_git([*diff, "--cached", *spec], top)))
+    if since is not None:
+        names.update(_names(_git([*diff, since, *spec], top)))
+        names.update(_names(_git(
+            ["ls-files", "--others", "--exclude-standard", "-z", *spec], top)))
+
+    files = []
+    for name in names:
+        abs_file = os.path.join(top, name)
+        if not os.path.isfile(abs_file):
+            continue
+        rel = os.path.relpath(abs_file, abs_path)
+        f = path if rel == os.curdir else os.path.join(path, rel)
+        if not _files_utils.is_excluded_under(f, path, is_excluded):
+            files.append(f)
+    return sorted(files)
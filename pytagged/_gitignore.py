@@ -0,0 +1,279 @@
+""".gitignore support for the walk: the .gitignore files of the work
+tree, and .git/info/exclude, are each parsed once and compiled into a
+single regex, so that ignored directories are pruned before they are
+descended into. Follows gitignore(5): the last matching pattern wins,
+deeper files override the ones above them, and a file can't be
+re-included if one of its parent directories is ignored. The global
+core.excludesFile isn't read.
+"""
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional, Pattern, Tuple
+
+GITIGNORE = ".gitignore"
+
+
+class Rule(NamedTuple):
+    # regex source, matched against the path relative to the
+    # directory of the .gitignore, with / separators
+    rgx: str
+    negate: bool
+    dir_only: bool
+
+
+def _translate_class(pattern: str, i: int) -> Tuple[Optional[str], int]:
+    """Regex of the [...] class starting at pattern[i], and the index
+    after it, None if the class isn't closed
+    """
+    j = i + 1
+    if j < len(pattern) and pattern[j] in "!^":
+        j += 1
+    if j < len(pattern) and pattern[j] == "]":
+        j += 1
+    j = pattern.find("]", j)
+    if j == -1:
+        return None, i + 1
+    stuff = pattern[i + 1:j]
+    negate = stuff[:1] in ("!", "^")
+    if negate:
+        stuff = stuff[1:]
+    stuff = stuff.replace("\\", "\\\\").replace("[", "\\[")
+    if negate:
+        # a class never matches the separator
+        return f"[^/{stuff}]", j + 1
+    return f"(?!/)[{stuff}]", j + 1
+
+
+def translate(pattern: str) -> str:
+    """Translate a gitignore glob, without its leading ! or /
+    and trailing /, to a regex
+
+    Args:
+        pattern (str): glob, * and ? don't match a /, ** matches
+            any number of directories when it is a whole component
+
+    Returns:
+        str: regex source, matches whole paths
+    """
+    res = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            j = i
+            while j < n and pattern[j] == "*":
+                j += 1
+            whole = j - i == 2 and (i == 0 or pattern[i - 1] == "/")
+            if whole and j == n:
+                # abc/** matches everything inside abc
+                res.append(".+")
+            elif whole and pattern[j] == "/":
+                # **/abc, a/**/b
+                res.append("(?:.*/)?")
+                j += 1
+            else:
+                res.append("[^/]*")
+            i = j
+        elif c == "?":
+            res.append("[^/]")
+            i += 1
+        elif c == "[":
+            rgx, i = _translate_class(pattern, i)
+            res.append(re.escape(c) if rgx is None else rgx)
+        elif c == "\\" and i + 1 < n:
+            res.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            res.append(re.escape(c))
+            i += 1
+    return "".join(res)
+
+
+def parse_rule(line: str) -> Optional[Rule]:
+    """Rule of a line of a .gitignore, None for blank lines & comments"""
+    line = line.rstrip("\r\n")
+    if not line or line.startswith("#"):
+        return None
+    # trailing spaces are ignored unless escaped
+    while line.endswith(" ") and not line.endswith("\\ "):
+        line = line[:-1]
+    negate = line.startswith("!")
+    if negate:
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+
+    # a separator at the beginning or in the middle anchors the
+    # pattern to the directory of the .gitignore
+    if "/" in line:
+        rgx = translate(line.lstrip("/"))
+    else:
+        rgx = "(?:.*/)?" + translate(line)
+    return Rule(rgx, negate, dir_only)
+
+
+class RuleSet:
+    """Rules of one ignore file, compiled into one regex for files and
+    one for directories. The rules are tried last first, each in a
+    group of its own, so the index of the matching group tells which
+    rule matched.
+
+    Args:
+        rules (List[Rule]): rules, in file order
+    """
+
+    def __init__(self, rules: List[Rule]):
+        self.rules = rules
+        self.file_rgx, self.file_negate = self._compile(
+            [r for r in rules if not r.dir_only])
+        self.dir_rgx, self.dir_negate = self._compile(rules)
+
+    @staticmethod
+    def _compile(rules: List[Rule]) -> Tuple[Optional[Pattern], List[bool]]:
+        if not rules:
+            return None, []
+        rules = rules[::-1]
+        rgx = re.compile("|".join(f"({r.rgx})" for r in rules), re.DOTALL)
+        # group 0 is the whole match
+        return rgx, [False] + [r.negate for r in rules]
+
+    @classmethod
+    def from_file(cls, path: str) -> Optional["RuleSet"]:
+        """Rules of the file at path, None if it has none
+        or can't be read
+        """
+        try:
+            with open(path, encoding="utf-8", errors="surrogateescape") as f:
+                rules = [r for r in map(parse_rule, f) if r is not None]
+        except OSError:
+            return None
+        return cls(rules) if rules else None
+
+    def match(self, rel_path: str, is_dir: bool) -> Optional[bool]:
+        """Whether rel_path, relative to the directory of the file, is
+        ignored, None if no rule matches it
+        """
+        if is_dir:
+            rgx, negate = self.dir_rgx, self.dir_negate
+        else:
+            rgx, negate = self.file_rgx, self.file_negate
+        if rgx is None:
+            return None
+        m = rgx.fullmatch(rel_path)
+        if m is None:
+            return None
+        return not negate[m.lastindex]
+
+
+class Scope:
+    """Rule sets that apply to the entries of a directory, deepest
+    first, each with the path of the directory relative to its own.
+    """
+
+    def __init__(self, rule_sets: List[Tuple[RuleSet, str]]):
+        self.rule_sets = rule_sets
+
+    def ignored(self, name: str, is_dir: bool) -> bool:
+        """Whether the entry name of the directory is ignored"""
+        for rule_set, prefix in self.rule_sets:
+            res = rule_set.match(prefix + name, is_dir)
+            if res is not None:
+                return res
+        return False
+
+    def child(self, name: str, rule_set: Optional[RuleSet]) -> "Scope":
+        """Scope of the subdirectory name, with rule_set the rules
+        of its own .gitignore
+        """
+        rule_sets = [(rs, f"{prefix}{name}/") for rs, prefix in self.rule_sets]
+        if rule_set is not None:
+            rule_sets.insert(0, (rule_set, ""))
+        return Scope(rule_sets)
+
+
+def _outside(rel: str) -> bool:
+    return rel == os.curdir or rel == os.pardir \
+        or rel.startswith(os.pardir + os.sep)
+
+
+def find_top(path: str) -> Optional[str]:
+    """Top directory of the work tree that contains path, if any"""
+    cur = os.path.abspath(path)
+    if not os.path.isdir(cur):
+        cur = os.path.dirname(cur)
+    while True:
+        if os.path.exists(os.path.join(cur, ".git")):
+            return cur
+        parent = os.path.dirname(cur)
+        if parent == cur:
+            return None
+        cur = parent
+
+
+class GitIgnore:
+    """Ignore rules of the work tree of path, loaded lazily, once per
+    directory. Outside of a work tree, only the .gitignore files under
+    path are read. Counts the entries that the walk pruned.
+
+    Args:
+        path (str): file or directory that is walked
+    """
+
+    def __init__(self, path: str):
+        path = os.path.abspath(path)
+        top = find_top(path)
+        self.top = top if top is not None else (
+            path if os.path.isdir(path) else os.path.dirname(path))
+        self.rule_sets = {}     # type: Dict[str, Optional[RuleSet]]
+        self.info = RuleSet.from_file(
+            os.path.join(self.top, ".git", "info", "exclude"))
+        self.pruned = 0
+
+    def rules(self, dir_path: str) -> Optional[RuleSet]:
+        """Rules of the .gitignore in dir_path, None if it has none"""
+        dir_path = os.path.abspath(dir_path)
+        if dir_path not in self.rule_sets:
+            self.rule_sets[dir_path] = RuleSet.from_file(
+                os.path.join(dir_path, GITIGNORE))
+        return self.rule_sets[dir_path]
+
+    def scope(self, dir_path: str) -> Scope:
+        """Scope of the entries of dir_path, with the rules of the
+        directories from the top of the work tree down to it
+        """
+        dir_path = os.path.abspath(dir_path)
+        # .git/info/exclude comes after all the .gitignore files
+        rule_sets = [(rs, "") for rs in (self.rules(self.top), self.info)
+                     if rs is not None]
+        scope = Scope(rule_sets)
+
+        rel = os.path.relpath(dir_path, self.top)
+        if _outside(rel):
+            return scope
+        cur = self.top
+        for name in rel.split(os.sep):
+            cur = os.path.join(cur, name)
+            scope = scope.child(name, self.rules(cur))
+        return scope
+
+    def ignored(self, path: str, is_dir: bool) -> bool:
+        """Whether path, or one of its parent directories under
+        the top of the work tree, is ignored
+        """
+        path = os.path.abspath(path)
+        rel = os.path.relpath(path, self.top)
+        if _outside(rel):
+            return False
+        parts = rel.split(os.sep)
+        scope = self.scope(self.top)
+        cur = self.top
+        for i, name in enumerate(parts):
+            last = i == len(parts) - 1
+            if scope.ignored(name, is_dir or not last):
+                return True
+            if not last:
+                cur = os.path.join(cur, name)
+                scope = scope.child(name, self.rules(cur))
+        return False
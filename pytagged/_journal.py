@@ -0,0 +1,201 @@
+"""Undo journal: the lines that a run commented out, with their
+original content, so that `pytag --restore <journal>` can put them
+back without reading or writing the files that didn't change.
+"""
+import codecs
+import json
+import os
+from typing import Dict, List, NamedTuple, Optional
+
+from pytagged import _cache, nline
+from pytagged._proc import Undo, write_edits, write_text
+from pytagged._write import AtomicWriter
+
+
+JOURNAL_VERSION = 1
+DEFAULT_JOURNAL_NAME = "journal.json"
+
+
+class JournalError(Exception):
+    pass
+
+
+class _Entry(NamedTuple):
+    # lines of files written by the bytes engine are bytes,
+    # the others were written in text mode
+    text: bool
+    undo: Undo
+
+
+class RestoreResult(NamedTuple):
+    restored: List[str]
+    # files whose commented out lines were changed since the run,
+    # or that can't be read anymore
+    skipped: List[str]
+
+
+def _to_json(line: nline.AnyLine) -> str:
+    if isinstance(line, bytes):
+        # lone surrogates survive the json round trip
+        return line.decode('utf-8', 'surrogateescape')
+    return line
+
+
+def _from_json(line: str, text: bool) -> nline.AnyLine:
+    return line if text else line.encode('utf-8', 'surrogateescape')
+
+
+def _load_entry(e: dict) -> _Entry:
+    text = e["text"]
+    if not isinstance(text, bool):
+        raise TypeError("text")
+    undo = []
+    for i, ln in e["lines"]:
+        if not isinstance(i, int) or i < 0 or not isinstance(ln, str):
+            raise TypeError("line")
+        undo.append((i, _from_json(ln, text)))
+    return _Entry(text, undo)
+
+
+class Journal:
+    """Changed lines of each file of a run, keyed by absolute path."""
+
+    def __init__(self):
+        self.files = {}     # type: Dict[str, _Entry]
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def record(self, path: str, undo: Undo):
+        """Add the lines of path that a run commented out. The lines
+        of an earlier run on the same file, like an earlier batch of
+        --watch, are kept, unless it was handled by the other engine.
+        """
+        if not undo:
+            return
+        text = isinstance(undo[0][1], str)
+        abs_path = os.path.abspath(path)
+        prev = self.files.get(abs_path)
+        if prev is not None and prev.text == text:
+            lines = dict(prev.undo)
+            lines.update(undo)
+            undo = sorted(lines.items())
+        self.files[abs_path] = _Entry(text, undo)
+
+    def save(self, path: str):
+        """Write the journal to path, atomically. Its directory is
+        created like the cache dir, if it doesn't exist yet.
+        """
+        files = {
+            p: {"text": e.text, "lines": [[i, _to_json(ln)] for i, ln in e.undo]}
+            for p, e in self.files.items()
+        }
+        data = {"version": JOURNAL_VERSION, "files": files}
+        dir_path = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(dir_path):
+            _cache.make_cache_dir(dir_path)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "Journal":
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except ValueError as e:
+            raise JournalError(f"invalid journal {path}: {e}")
+        if not isinstance(data, dict) or data.get("version") != JOURNAL_VERSION:
+            raise JournalError(f"unsupported journal version in {path}")
+
+        journal = cls()
+        try:
+            for p, e in data["files"].items():
+                journal.files[p] = _load_entry(e)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            # truncated or edited by hand
+            raise JournalError(f"malformed journal {path}")
+        return journal
+
+
+def _restore_bytes(path: str, undo: Undo,
+                   writer: Optional[AtomicWriter]) -> bool:
+    mode = 'r+b' if writer is None else 'rb'
+    with open(path, mode) as f:
+        data = f.read()
+        bom = codecs.BOM_UTF8 if data.startswith(codecs.BOM_UTF8) else b''
+        # same line terminators as the bytes engine: \n, \r\n & \r
+        lines = data[len(bom):].splitlines(keepends=True)
+        edits = []
+        offset = len(bom)
+        prev = 0
+        for i, orig in sorted(undo):
+            if i >= len(lines) or lines[i] != nline.comment_out(orig):
+                return False
+            offset += sum(map(len, lines[prev:i]))
+            prev = i
+            edits.append(nline.Edit(i, offset, len(lines[i]), orig))
+        if not edits:
+            return True
+        if writer is None:
+            write_edits(f, data, edits)
+            return True
+    writer.write(path, [nline.apply_edits(data, edits)])
+    return True
+
+
+def _restore_text(path: str, undo: Undo,
+                  writer: Optional[AtomicWriter]) -> bool:
+    with open(path, 'r') as f:
+        lines = f.readlines()
+    for i, orig in undo:
+        if i >= len(lines) or lines[i] != nline.comment_out(orig):
+            return False
+        lines[i] = orig
+    if writer is None:
+        with open(path, 'w') as f:
+            f.writelines(lines)
+    else:
+        with writer.open(path) as af:
+            write_text(af, lines)
+            af.commit()
+    return True
+
+
+def restore(journal: Journal,
+            writer: Optional[AtomicWriter] = None) -> RestoreResult:
+    """Put back the original content of the lines in the journal.
+    Only the files of the journal are opened. A file is skipped as
+    a whole if any of its lines isn't the commented out version of
+    the original anymore, so that edits made since the run are kept.
+
+    Args:
+        journal (Journal): journal of the run to undo
+        writer (Optional[AtomicWriter]): write the files atomically
+            with it, instead of in place
+
+    Returns:
+        RestoreResult: restored & skipped files
+    """
+    restored = []
+    skipped = []
+    for path, (text, undo) in sorted(journal.files.items()):
+        restore_file = _restore_text if text else _restore_bytes
+        try:
+            ok = restore_file(path, undo, writer)
+        except (OSError, UnicodeError):
+            ok = False
+        (restored if ok else skipped).append(path)
+    if writer is not None:
+        writer.flush()
+    return RestoreResult(restored, skipped)
+
+
+def default_journal_path(cache_dir: str) -> str:
+    return os.path.join(cache_dir, DEFAULT_JOURNAL_NAME)
@@ -6,4 +6,5 @@ class Mode(Enum):
     """
     DEFAULT = 0
     PRINTONLY = 1
-    BENCHMARK = 2
\ No newline at end of file
+    BENCHMARK = 2
+    RESTORE = 3
\ No newline at end of file
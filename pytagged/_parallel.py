@@ -0,0 +1,202 @@
+"""Process pool helpers, used to spread the work
+over multiple cores when running with -j/--jobs.
+"""
+import os
+from collections import deque
+from typing import Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from pytagged import nline
+from pytagged._prefilter import Prefilter
+from pytagged._proc import FileResult, proc_file, STREAM_THRESHOLD
+from pytagged._write import AtomicWriter
+
+
+# files at least this big are sent to the pool on their own,
+# smaller files are batched together up to this many bytes
+CHUNK_BYTES = 256 * 1024
+CHUNK_MAX_FILES = 64
+
+# default caps on the work that is submitted to the pool
+# but whose results have not been consumed yet
+MAX_INFLIGHT_FILES = 512
+MAX_INFLIGHT_BYTES = 64 * 1024 * 1024
+
+
+class Chunk(NamedTuple):
+    indices: List[int]
+    size: int
+
+
+ChunkResult = List[FileResult]
+
+
+def resolve_jobs(jobs: int) -> int:
+    """Turn the jobs option into a worker count, 0 or
+    a negative number means one worker per cpu.
+    """
+    if jobs > 0:
+        return jobs
+    return os.cpu_count() or 1
+
+
+def make_chunks(paths: Sequence[str],
+                ordered: bool = False,
+                chunk_bytes: int = CHUNK_BYTES,
+                chunk_max_files: int = CHUNK_MAX_FILES) -> List[Chunk]:
+    """Split the paths into chunks of indices. Big files get a chunk
+    of their own, small files are grouped so that the per task
+    overhead of the pool is paid once per chunk instead of once
+    per file. Unless ordered is True, largest files come first.
+
+    Args:
+        paths (Sequence[str]): paths to the files
+        ordered (bool): keep the chunks in the same order as paths
+        chunk_bytes (int): max size in bytes of a chunk of small files
+        chunk_max_files (int): max number of files in a chunk
+
+    Returns:
+        List[Chunk]: chunks of indices into paths
+    """
+    def size(i: int) -> int:
+        try:
+            return os.path.getsize(paths[i])
+        except OSError:
+            return 0
+
+    sizes = [size(i) for i in range(len(paths))]
+    order = range(len(paths))
+    if not ordered:
+        order = sorted(order, key=lambda i: sizes[i], reverse=True)
+
+    chunks = []
+    cur = []
+    cur_bytes = 0
+    for i in order:
+        full = cur_bytes + sizes[i] > chunk_bytes \
+            or len(cur) >= chunk_max_files
+        if cur and full:
+            chunks.append(Chunk(cur, cur_bytes))
+            cur = []
+            cur_bytes = 0
+        cur.append(i)
+        cur_bytes += sizes[i]
+
+    if cur:
+        chunks.append(Chunk(cur, cur_bytes))
+    return chunks
+
+
+def proc_chunk(items: Sequence[Tuple[int, str]],
+               tags: Sequence[str],
+               write: bool,
+               keep_lines: bool,
+               prefilter: bool = False,
+               stream_threshold: int = STREAM_THRESHOLD,
+               durability: Optional[str] = None,
+               undo: bool = False,
+               digest: bool = False) -> ChunkResult:
+    """Worker entry point, process a chunk of files one at a time.
+    Each file is opened, transformed, written and closed before
+    the next one is opened.
+
+    Args:
+        items (Sequence[Tuple[int, str]]): (index, path) pairs
+        tags (Sequence[str]): tags
+        write (bool): write the new lines back to the files
+        keep_lines (bool): send the new lines back to the parent process
+        prefilter (bool): skip the files without any tag in them,
+            their new lines are None even if keep_lines is True
+        stream_threshold (int): stream the files at least this big
+        durability (Optional[str]): write the files atomically with
+            this durability level, None to write them in place
+        undo (bool): send back the original content of the changed
+            lines, for the undo journal
+        digest (bool): send back the content digest of the files
+
+    Returns:
+        ChunkResult: results, in the same order as items
+    """
+    matcher = nline.get_matcher(tags)
+    _prefilter = Prefilter(tags) if prefilter else None
+    writer = None
+    if write and durability is not None:
+        writer = AtomicWriter(durability)
+    results = [proc_file(path, matcher, write, keep_lines,
+                         prefilter=_prefilter,
+                         stream_threshold=stream_threshold,
+                         index=i, writer=writer, undo=undo,
+                         digest=digest)
+               for i, path in items]
+    if writer is not None:
+        writer.flush()
+    return results
+
+
+def imap_files(
+        paths: Sequence[str],
+        tags: Sequence[str],
+        jobs: int,
+        write: bool,
+        keep_lines: bool,
+        prefilter: bool = False,
+        stream_threshold: int = STREAM_THRESHOLD,
+        max_inflight_files: int = MAX_INFLIGHT_FILES,
+        max_inflight_bytes: int = MAX_INFLIGHT_BYTES,
+        durability: Optional[str] = None,
+        undo: bool = False,
+        digest: bool = False
+) -> Iterator[FileResult]:
+    """Process the files in a process pool. Chunks are submitted
+    as long as the files and bytes in flight stay under the caps,
+    at least one chunk is always in flight. When keep_lines is True,
+    the chunks are kept in path order and the results are yielded
+    in the same order as paths, so that the output stays stable.
+
+    Args:
+        paths (Sequence[str]): paths to the files
+        tags (Sequence[str]): tags
+        jobs (int): number of worker processes
+        write (bool): write the new lines back to the files
+        keep_lines (bool): yield the new lines, otherwise yield None
+        prefilter (bool): skip the files without any tag in them
+        stream_threshold (int): stream the files at least this big
+        max_inflight_files (int): cap on the number of files in flight
+        max_inflight_bytes (int): cap on the size of the files in flight
+        durability (Optional[str]): write the files atomically with
+            this durability level, None to write them in place
+        undo (bool): yield the original content of the changed lines
+        digest (bool): yield the content digest of the files
+
+    Yields:
+        Iterator[FileResult]: results
+    """
+    # slow to import, and only needed with more than one job
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunks = deque(make_chunks(paths, ordered=keep_lines))
+    tags = list(tags)
+    inflight = deque()
+    inflight_files = 0
+    inflight_bytes = 0
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        while chunks or inflight:
+            while chunks:
+                chunk = chunks[0]
+                over = inflight_files + len(chunk.indices) > max_inflight_files \
+                    or inflight_bytes + chunk.size > max_inflight_bytes
+                if inflight and over:
+                    break
+                chunks.popleft()
+                fut = pool.submit(proc_chunk,
+                                  [(i, paths[i]) for i in chunk.indices],
+                                  tags, write, keep_lines, prefilter,
+                                  stream_threshold, durability, undo, digest)
+                inflight.append((fut, chunk))
+                inflight_files += len(chunk.indices)
+                inflight_bytes += chunk.size
+
+            fut, chunk = inflight.popleft()
+            yield from fut.result()
+            inflight_files -= len(chunk.indices)
+            inflight_bytes -= chunk.size
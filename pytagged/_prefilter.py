@@ -0,0 +1,96 @@
+"""Whole file prefilter: a file that doesn't contain any
+"# <tag>" or "# block: <tag>" byte sequence can't have any
+line commented out, so it can be skipped without decoding it
+or splitting it into lines.
+"""
+import locale
+import mmap
+import os
+import re
+from typing import Iterable, List, Optional
+
+from pytagged import nline
+
+
+# files at least this big are memory-mapped instead of read
+MMAP_THRESHOLD = 1 << 20
+
+# up to this many needles are searched one at a time with
+# bytes.find, more than that are combined into a single regex
+MAX_FIND_NEEDLES = 8
+
+
+class Prefilter:
+    """Byte level scan for the tags, see may_match.
+    The needles are encoded with the encoding that the files
+    are opened with. If the tags are regexes rather than plain
+    literals, or can't be encoded, every file may match.
+    """
+
+    def __init__(self, tags: Iterable[str], encoding: Optional[str] = None):
+        if encoding is None:
+            encoding = locale.getpreferredencoding(False)
+        matcher = nline.get_matcher(tags)
+        self.needles = None     # type: Optional[List[bytes]]
+        self.rgx = None
+        self.hits = 0
+        self.misses = 0
+
+        if not matcher.literal:
+            return
+        try:
+            needles = [f"{prefix}{t}".encode(encoding)
+                       for t in matcher.tags
+                       for prefix in ("# ", nline.BLOCK_START)]
+        except (LookupError, UnicodeError):
+            return
+
+        self.needles = needles
+        if len(needles) > MAX_FIND_NEEDLES:
+            self.rgx = re.compile(b'|'.join(re.escape(n) for n in needles))
+
+    @property
+    def enabled(self) -> bool:
+        return self.needles is not None
+
+    def may_match_bytes(self, data) -> bool:
+        """Returns False only if no line of data can be commented out,
+        data is any bytes-like object with a find method (bytes, mmap).
+        """
+        if self.needles is None:
+            return True
+        if self.rgx is not None:
+            return self.rgx.search(data) is not None
+        return any(data.find(n) != -1 for n in self.needles)
+
+    def may_match(self, path: str, h=None) -> bool:
+        """Same as may_match_bytes but reads the file at path,
+        big files are memory-mapped. Also counts hits & misses.
+        h, a hashlib hash object, is updated with the content of
+        the file if it can't match.
+        """
+        if self.needles is None:
+            hit = True
+        else:
+            hit = self._may_match_path(path, h)
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return hit
+
+    def _may_match_path(self, path: str, h) -> bool:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return False
+            if size < MMAP_THRESHOLD:
+                return self._may_match_data(f.read(), h)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return self._may_match_data(mm, h)
+
+    def _may_match_data(self, data, h) -> bool:
+        hit = self.may_match_bytes(data)
+        if h is not None and not hit:
+            h.update(data)
+        return hit
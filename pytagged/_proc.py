@@ -0,0 +1,248 @@
+"""Processing of a single file, shared by the serial
+path of App and by the workers of the process pool.
+"""
+import io
+import itertools
+import os
+from typing import (
+    IO, BinaryIO, Iterable, Iterator, List, NamedTuple, Optional, Tuple,
+)
+
+from pytagged import nline
+from pytagged._cache import content_hash
+from pytagged._prefilter import Prefilter
+from pytagged._write import AtomicFile, AtomicWriter
+
+
+# files at least this big are streamed through nline.iter_newlines
+# instead of being read into memory as a whole
+STREAM_THRESHOLD = 16 * 1024 * 1024
+
+
+# (line index, original line) of each line that was commented out,
+# bytes lines for the bytes engine, str lines for text mode
+Undo = List[Tuple[int, nline.AnyLine]]
+
+
+class FileResult(NamedTuple):
+    index: int
+    lines: Optional[List[str]]
+    written: bool
+    # skipped by the prefilter, without being decoded
+    prefiltered: bool
+    # only if asked for, and the file was written
+    undo: Optional[Undo] = None
+    # only if asked for: content digest of the file as it was read, or
+    # written if it changed, for the cache. None for the files that
+    # go through text mode, which are hashed again when recorded
+    digest: Optional[str] = None
+
+
+def proc_file(path: str,
+              matcher: nline.Matcher,
+              write: bool,
+              keep_lines: bool,
+              prefilter: Optional[Prefilter] = None,
+              stream_threshold: int = STREAM_THRESHOLD,
+              index: int = 0,
+              writer: Optional[AtomicWriter] = None,
+              undo: bool = False,
+              digest: bool = False) -> FileResult:
+    """Open, transform, write & close a single file. Files are written
+    with the bytes engine, keeping their line terminators, unless their
+    encoding isn't ASCII compatible or they are streamed.
+
+    Args:
+        path (str): path to the file
+        matcher (nline.Matcher): matcher for the tags
+        write (bool): write the new lines back to the file, if any changed
+        keep_lines (bool): return the new lines, otherwise return None.
+            Streamed files never return their lines.
+        prefilter (Optional[Prefilter]): skip the file if the prefilter
+            doesn't find any tag in it
+        stream_threshold (int): stream files at least this big, 0 to
+            always stream, only used if write is True
+        index (int): index of the file, returned as is
+        writer (Optional[AtomicWriter]): write changed files atomically
+            with it, instead of in place
+        undo (bool): return the original content of the changed lines,
+            for the undo journal
+        digest (bool): return the content digest of the file
+
+    Returns:
+        FileResult: result
+    """
+    if prefilter is not None:
+        h = content_hash() if digest else None
+        if not prefilter.may_match(path, h):
+            return FileResult(index, None, False, True,
+                              digest=h.hexdigest() if digest else None)
+
+    if write and os.path.getsize(path) >= stream_threshold:
+        file_undo = [] if undo else None
+        written = stream_newlines_to_file(path, matcher, writer, file_undo)
+        if not written:
+            file_undo = None
+        return FileResult(index, None, written, False, file_undo)
+
+    if write:
+        res = proc_file_bytes(path, matcher, keep_lines, index, writer, undo,
+                              digest)
+        if res is not None:
+            return res
+
+    # files that the bytes engine can't handle go through text mode
+    mode = 'r+' if write and writer is None else 'r'
+    with open(path, mode) as fi:
+        lines = fi.readlines()
+        newlines, changed = nline.get_newlines_changed(iter(lines), matcher)
+        written = write and changed > 0
+        if written and writer is None:
+            fi.seek(0)
+            fi.truncate()
+            fi.writelines(newlines)
+    if written and writer is not None:
+        with writer.open(path) as af:
+            write_text(af, newlines)
+            af.commit()
+
+    file_undo = None
+    if undo and written:
+        # the engines only replace the lines they comment out
+        file_undo = [(i, old) for i, (old, new) in enumerate(zip(lines, newlines))
+                     if old is not new]
+    return FileResult(index, newlines if keep_lines else None, written, False,
+                      file_undo)
+
+
+def proc_file_bytes(path: str,
+                    matcher: nline.Matcher,
+                    keep_lines: bool,
+                    index: int = 0,
+                    writer: Optional[AtomicWriter] = None,
+                    undo: bool = False,
+                    digest: bool = False) -> Optional[FileResult]:
+    """Same as proc_file with write, but with the bytes engine: the
+    file isn't decoded, and keeps its line terminators & encoding.
+    Only the part of the file from the first changed line on is
+    rewritten, unless writer is given to replace it atomically.
+
+    Returns:
+        Optional[FileResult]: result, or None if the encoding of the
+            file isn't ASCII compatible, in which case the file is left
+            untouched
+    """
+    mode = 'r+b' if writer is None else 'rb'
+    with open(path, mode) as f:
+        data = f.read()
+        edits = nline.get_edits_bytes(data, matcher)
+        if edits is None:
+            return None
+        if edits and writer is None:
+            write_edits(f, data, edits)
+    if edits and writer is not None:
+        prefix = memoryview(data)[:edits[0].offset]
+        writer.write(path, itertools.chain(
+            (prefix,), nline.iter_edited(data, edits)))
+
+    lines = None
+    if keep_lines:
+        # decoded as if read in text mode, only to be printed
+        new_data = io.BytesIO(nline.apply_edits(data, edits))
+        lines = io.TextIOWrapper(new_data, errors='replace').readlines()
+    file_undo = None
+    if undo and edits:
+        file_undo = [(e.index, data[e.offset:e.offset + e.length])
+                     for e in edits]
+    file_digest = None
+    if digest:
+        # of the bytes written, not of what is on disk by now
+        h = content_hash()
+        if edits:
+            h.update(memoryview(data)[:edits[0].offset])
+            for piece in nline.iter_edited(data, edits):
+                h.update(piece)
+        else:
+            h.update(data)
+        file_digest = h.hexdigest()
+    return FileResult(index, lines, bool(edits), False, file_undo,
+                      file_digest)
+
+
+def write_text(af: AtomicFile, lines: Iterable[str]):
+    """Write lines to af, encoded like text mode would"""
+    out = io.TextIOWrapper(af.file)
+    out.writelines(lines)
+    out.flush()
+    out.detach()
+
+
+def write_edits(f: BinaryIO, data: bytes, edits: List[nline.Edit]) -> int:
+    """Apply edits to f, whose content is data, in place. The prefix
+    of the file up to the first edit is left as is, only the rest of
+    it is rewritten.
+
+    Returns:
+        int: number of bytes written
+    """
+    f.seek(edits[0].offset)
+    written = 0
+    for piece in nline.iter_edited(data, edits):
+        written += f.write(piece)
+    # truncating is slow even when the size doesn't change, and
+    # commenting lines out only ever makes the file bigger
+    if edits[0].offset + written < len(data):
+        f.truncate()
+    return written
+
+
+def stream_newlines_to_file(path: str,
+                            matcher: nline.Matcher,
+                            writer: Optional[AtomicWriter] = None,
+                            undo: Optional[Undo] = None) -> bool:
+    """Stream the new lines of the file into a temporary file, and
+    copy them back only if any line changed. Memory use stays constant
+    regardless of the size of the file. With a writer, the temporary
+    file is the one that atomically replaces the file instead.
+
+    Args:
+        undo (Optional[Undo]): if given, the original content of the
+            changed lines is appended to it
+
+    Returns:
+        bool: whether the file was written
+    """
+    changed = False
+
+    def newlines(fi: IO) -> Iterator[str]:
+        nonlocal changed
+        numbered = enumerate(nline.iter_newlines_changed(fi, matcher))
+        for i, (ln, ln_changed) in numbered:
+            if ln_changed:
+                changed = True
+                if undo is not None:
+                    undo.append((i, nline.uncomment(ln)))
+            yield ln
+
+    if writer is not None:
+        with open(path, 'r') as fi, writer.open(path) as af:
+            write_text(af, newlines(fi))
+            if changed:
+                af.commit()
+        return changed
+
+    # only streamed files need these
+    import shutil
+    import tempfile
+
+    with open(path, 'r') as fi, tempfile.TemporaryFile(mode='w+') as tmp:
+        tmp.writelines(newlines(fi))
+
+        if not changed:
+            return False
+
+        tmp.seek(0)
+        fi.close()
+        with open(path, 'w') as fo:
+            shutil.copyfileobj(tmp, fo)
+    return True
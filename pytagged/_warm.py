@@ -0,0 +1,72 @@
+"""State kept warm between the runs of the daemon: parsed config
+files and loaded caches, each reused until its file changes on disk.
+The compiled matchers are kept by the lru cache of nline.get_matcher.
+"""
+import os
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+from pytagged import _cache
+from pytagged.options import Options
+
+
+# (size, mtime_ns), None if the file doesn't exist
+Signature = Optional[Tuple[int, int]]
+CacheKey = Tuple[str, str]
+
+
+def _signature(path: str) -> Signature:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class WarmState:
+
+    def __init__(self):
+        # path -> (signature, options)
+        self.configs = {}   # type: Dict[str, Tuple[Signature, Optional[Options]]]
+        # (cache dir, tags) -> (signature of the index, cache)
+        self.caches = {}    # type: Dict[CacheKey, Tuple[Signature, _cache.Cache]]
+        self.used = set()   # type: Set[CacheKey]
+
+    def config(self, path: str,
+               parse: Callable[[str], Optional[Options]]) -> Optional[Options]:
+        """Options of the config file at path, parsed with parse
+        only if the file changed since it was last parsed
+        """
+        sig = _signature(path)
+        cached = self.configs.get(path)
+        if cached is not None and cached[0] == sig:
+            return cached[1]
+        opts = parse(path)
+        self.configs[path] = (sig, opts)
+        return opts
+
+    def cache(self, cache_dir: str, tags: Iterable[str]) -> _cache.Cache:
+        """Cache for the tags, loaded only if its index changed on disk
+        since the end of the last run that used it. Hits & misses are
+        counted from 0 for each run.
+        """
+        cache_dir = os.path.abspath(cache_dir)
+        key = (cache_dir, _cache.normalize_tags(tags))
+        self.used.add(key)
+        cached = self.caches.get(key)
+        if cached is not None and cached[0] == _signature(cached[1].index_path):
+            cache = cached[1]
+            cache.hits = cache.misses = 0
+            return cache
+        cache = _cache.Cache(cache_dir, tags).load()
+        self.caches[key] = (_signature(cache.index_path), cache)
+        return cache
+
+    def settle(self):
+        """Call at the end of each run, once the caches are saved.
+        Caches for other tags in the same dir were not saved by the
+        run, and are reloaded if the index changed.
+        """
+        for key in self.used:
+            cache = self.caches[key][1]
+            self.caches[key] = (_signature(cache.index_path), cache)
+        self.used.clear()
@@ -0,0 +1,315 @@
+"""Watch mode: after a full pass, wait for files to be created or
+modified and hand them over in debounced batches. Uses inotify on
+Linux, through ctypes, and falls back to polling the tree elsewhere.
+Files are filtered with the same exclude rules and extension as a
+full pass, and the files written by pytagged itself are ignored.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from pytagged import _files_utils, _gitignore
+
+
+# quiet period after the last event before a batch is handed over,
+# editors often write a file in several steps
+DEBOUNCE = 0.2
+POLL_INTERVAL = 0.5
+BACKENDS = ("inotify", "poll")
+
+# from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# a file is only processed once it's closed or moved in place,
+# IN_MODIFY would fire on every write of a file being saved
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE \
+    | IN_MOVED_FROM | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+_EVENT = struct.Struct("iIII")
+
+# (size, mtime_ns)
+Signature = Tuple[int, int]
+
+
+def _signature(path: str) -> Optional[Signature]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class _PollBackend:
+    """Stats every watched file each interval"""
+
+    def __init__(self, watcher: "Watcher", interval: float):
+        self.watcher = watcher
+        self.interval = interval
+        self.sigs = {p: _signature(p) for p in watcher.walk()}
+
+    def wait(self, timeout: Optional[float]) -> Set[str]:
+        time.sleep(self.interval if timeout is None
+                   else min(self.interval, timeout))
+        sigs = {p: _signature(p) for p in self.watcher.walk()}
+        changed = {p for p, sig in sigs.items() if self.sigs.get(p) != sig}
+        self.sigs = sigs
+        return changed
+
+    def close(self):
+        pass
+
+
+class _InotifyBackend:
+    """One inotify watch per directory, new directories are
+    watched as they are created.
+    """
+
+    def __init__(self, watcher: "Watcher", libc):
+        self.watcher = watcher
+        self.libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = {}      # type: Dict[int, str]
+        for d in watcher.walk_dirs():
+            self.add_dir(d)
+
+    def add_dir(self, path: str):
+        wd = self.libc.inotify_add_watch(
+            self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            # gone already, or out of watches
+            return
+        self.dirs[wd] = path
+
+    def wait(self, timeout: Optional[float]) -> Set[str]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed = set()
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            changed |= self._parse(buf)
+        return changed
+
+    def _parse(self, buf: bytes) -> Set[str]:
+        changed = set()
+        offset = 0
+        while offset < len(buf):
+            wd, mask, _, length = _EVENT.unpack_from(buf, offset)
+            offset += _EVENT.size
+            name = buf[offset:offset + length].rstrip(b"\0")
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # events were lost, look at everything
+                changed.update(self.watcher.walk())
+                continue
+            if mask & IN_IGNORED:
+                self.dirs.pop(wd, None)
+                continue
+            dir_path = self.dirs.get(wd)
+            if dir_path is None or not name:
+                continue
+            path = os.path.join(dir_path, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) \
+                        and not self.watcher.excluded_dir(path):
+                    # files may have been created before the watch was
+                    for d in self.watcher.walk_dirs(path):
+                        self.add_dir(d)
+                    changed.update(self.watcher.walk(path))
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher:
+    """Watches the files that a full pass on path would process.
+
+    Args:
+        path (str): file or directory, like the path of a run
+        is_excluded (Callable[[str], bool]): same exclude rule as
+            _files_utils.filepaths_from_path
+        extension (str): only files with this extension are watched
+        backend (Optional[str]): one of BACKENDS, defaults to inotify
+            where available, else poll
+        debounce (float): seconds without events before a batch
+            is handed over
+        poll_interval (float): seconds between two polls
+        ignore (Optional[_gitignore.GitIgnore]): also leave out what
+            the .gitignore files ignore
+    """
+
+    def __init__(self, path: str,
+                 is_excluded: Callable[[str], bool],
+                 extension: str,
+                 backend: Optional[str] = None,
+                 debounce: float = DEBOUNCE,
+                 poll_interval: float = POLL_INTERVAL,
+                 ignore: Optional[_gitignore.GitIgnore] = None):
+        # the exclude rule sees the path as given, like a full pass
+        self.given_path = path
+        self.path = os.path.abspath(path)
+        self.is_excluded = is_excluded
+        self.extension = extension
+        self.debounce = debounce
+        self.ignore = ignore
+        self.single_file = not os.path.isdir(self.path)
+        # state of each file as last processed, or written, by pytagged
+        self.seen_sigs = {}     # type: Dict[str, Optional[Signature]]
+
+        if backend is None:
+            backend = "inotify" if _load_libc() is not None else "poll"
+        if backend not in BACKENDS:
+            raise ValueError(f"unknown watch backend: {backend}")
+        if backend == "inotify":
+            libc = _load_libc()
+            if libc is None:
+                raise OSError("inotify is not available")
+            self.backend = _InotifyBackend(self, libc)
+        else:
+            self.backend = _PollBackend(self, poll_interval)
+        self.backend_name = backend
+
+    def walk(self, path: Optional[str] = None) -> Iterator[str]:
+        """Files under path that a full pass would process"""
+        path = self.given_path if path is None else path
+        yield from _files_utils.filepaths_from_path(
+            path, self.is_excluded, self.extension, self.ignore)
+
+    def walk_dirs(self, path: Optional[str] = None) -> Iterator[str]:
+        """Directories to watch, the parent of a single file"""
+        path = self.path if path is None else path
+        if self.single_file:
+            yield os.path.dirname(path)
+            return
+        if self.excluded_dir(path):
+            return
+        for root, subdirs, _ in os.walk(path):
+            subdirs[:] = [d for d in subdirs if not self.is_excluded(d)]
+            if self.ignore is not None:
+                subdirs[:] = [d for d in subdirs if not self.ignore.ignored(
+                    os.path.join(root, d), True)]
+            yield root
+
+    def excluded_dir(self, path: str) -> bool:
+        if self.single_file:
+            return True
+        if self.ignore is not None and path != self.path \
+                and self.ignore.ignored(path, True):
+            return True
+        while True:
+            if path == self.path:
+                return self.is_excluded(self.given_path)
+            if self.is_excluded(path):
+                return True
+            parent = os.path.dirname(path)
+            if parent == path:
+                # not under the watched path
+                return True
+            path = parent
+
+    def watched(self, path: str) -> bool:
+        """Whether a full pass would process path"""
+        path = os.path.abspath(path)
+        if self.single_file:
+            return path == self.path
+        if not path.endswith(self.extension):
+            return False
+        if _files_utils.is_excluded_under(path, self.given_path,
+                                          self.is_excluded):
+            return False
+        if self.ignore is None:
+            return True
+        return not self.ignore.ignored(path, False)
+
+    def seen(self, paths: Iterable[str]):
+        """Record the current state of paths, once pytagged is done with
+        them. Events that leave them in that state, like the ones of its
+        own writes, are ignored.
+        """
+        for p in paths:
+            self.seen_sigs[os.path.abspath(p)] = _signature(p)
+
+    def next_batch(self, timeout: Optional[float] = None) -> List[str]:
+        """Wait for files to be created or modified, until timeout
+        seconds passed if given, then for the debounce period to pass
+        without any event.
+
+        Returns:
+            List[str]: sorted absolute paths of the changed files,
+                empty if none changed before timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0.0, deadline - time.monotonic())
+            pending = self.backend.wait(remaining)
+            while pending:
+                more = self.backend.wait(self.debounce)
+                if not more:
+                    break
+                pending |= more
+
+            changed = []
+            for p in pending:
+                p = os.path.abspath(p)
+                if not self.watched(p):
+                    continue
+                sig = _signature(p)
+                if sig is None or self.seen_sigs.get(p) == sig:
+                    continue
+                changed.append(p)
+            if changed:
+                return sorted(changed)
+            if deadline is not None and time.monotonic() >= deadline:
+                return []
+
+    def batches(self) -> Iterator[List[str]]:
+        while True:
+            yield self.next_batch()
+
+    def close(self):
+        self.backend.close()
+
+    def __enter__(self) -> "Watcher":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
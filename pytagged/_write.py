@@ -0,0 +1,137 @@
+"""Atomic writes: the new content of a file is written to a
+temporary file in the same directory, which then replaces the
+original with os.replace. An interrupted run, or a full disk,
+leaves every file either untouched or completely written.
+"""
+import os
+import stat
+from typing import Iterable, Set
+
+# how hard to try to make the writes survive a crash of the machine:
+# none: no fsync, a crash may lose recent writes but never truncates
+#   a file since the original is only replaced once fully written
+# dir: fsync each file before it replaces the original, and fsync
+#   each directory once, when the writer is flushed
+# file: fsync each file, and its directory right after the replace
+DURABILITY_LEVELS = ("none", "dir", "file")
+DEFAULT_DURABILITY = "none"
+
+TMP_SUFFIX = ".pytagged-tmp"
+
+
+def fsync_dir(path: str):
+    """fsync a directory, so that renames in it are durable.
+    Directories can't be opened on Windows, where it's a no-op.
+    """
+    if os.name == 'nt':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class AtomicFile:
+    """Binary temporary file that replaces path on commit, and is
+    removed on discard, or if an exception escapes the with block
+    before commit. Symlinks are followed, the file they point to
+    is replaced. The mode, and the ownership if allowed, of the
+    original file are kept.
+    """
+
+    def __init__(self, path: str, writer: "AtomicWriter"):
+        # only atomic writes need it, it's slow to import
+        import tempfile
+
+        self.path = os.path.realpath(path)
+        self.writer = writer
+        self.dir = os.path.dirname(self.path)
+        fd, self.tmp_path = tempfile.mkstemp(
+            prefix=f".{os.path.basename(self.path)}.",
+            suffix=TMP_SUFFIX, dir=self.dir)
+        self.file = os.fdopen(fd, 'wb')
+        self.done = False
+
+    def commit(self):
+        st = os.stat(self.path)
+        try:
+            self.file.flush()
+            if self.writer.durability != "none":
+                os.fsync(self.file.fileno())
+            self.file.close()
+            os.chmod(self.tmp_path, stat.S_IMODE(st.st_mode))
+            if hasattr(os, "chown"):
+                try:
+                    os.chown(self.tmp_path, st.st_uid, st.st_gid)
+                except PermissionError:
+                    # only root can give away files
+                    pass
+            os.replace(self.tmp_path, self.path)
+        except BaseException:
+            self.discard()
+            raise
+        self.done = True
+        self.writer.replaced(self.dir)
+
+    def discard(self):
+        self.done = True
+        self.file.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "AtomicFile":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.done:
+            self.discard()
+
+
+class AtomicWriter:
+    """Writes files atomically with the given durability level,
+    see DURABILITY_LEVELS. Call flush once done writing, to fsync
+    the directories batched by the "dir" level.
+    """
+
+    def __init__(self, durability: str = DEFAULT_DURABILITY):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f"unknown durability level: {durability}")
+        self.durability = durability
+        self.pending_dirs = set()     # type: Set[str]
+        self.fsyncs = 0
+
+    def open(self, path: str) -> AtomicFile:
+        return AtomicFile(path, self)
+
+    def write(self, path: str, pieces: Iterable[bytes]) -> int:
+        """Replace the content of path with pieces.
+
+        Returns:
+            int: number of bytes written
+        """
+        written = 0
+        with self.open(path) as f:
+            for piece in pieces:
+                written += f.file.write(piece)
+            f.commit()
+        return written
+
+    def replaced(self, dir_path: str):
+        if self.durability == "none":
+            return
+        # the file itself was fsynced by AtomicFile.commit
+        self.fsyncs += 1
+        if self.durability == "file":
+            fsync_dir(dir_path)
+            self.fsyncs += 1
+        else:
+            self.pending_dirs.add(dir_path)
+
+    def flush(self):
+        for dir_path in sorted(self.pending_dirs):
+            fsync_dir(dir_path)
+            self.fsyncs += 1
+        self.pending_dirs.clear()
@@ -1,32 +1,34 @@
-import argparse
-import configparser
-import io
+import itertools
 import os
-import statistics
 import sys
-import tempfile
-import textwrap
-import time
-from shutil import get_terminal_size
 from typing import (
-    Callable, IO,
+    Any, Callable, Dict, IO,
     Sequence, Optional,
     Iterable, Iterator, Tuple, Union,
 )
 
-# only import resource if linux
-if sys.platform.startswith("linux"):
-    import resource
-
 from pytagged._mode import Mode
+from pytagged import _bench_defaults
+from pytagged import _cache
 from pytagged import _files_utils
+from pytagged import _gitignore
+from pytagged import _journal
+from pytagged import _parallel
+from pytagged import _prefilter
+from pytagged import _proc
 from pytagged import _utils
+from pytagged import _warm
+from pytagged import _write
 from pytagged import nline
 from pytagged.options import Options
 
 
+# mode specific modules, like argparse & configparser, and the ones
+# of the process pool & of watch mode, are imported where they are
+# used, so that a run on a few files starts fast
+
 # types
-LineProg = Callable[[IO, Iterable[str]], Sequence[str]]
+LineProg = Callable[[IO, Iterable[str]], nline.NewLines]
 LineProgResult = Optional[Sequence[str]]
 IOType = Union[IO, str]
 
@@ -38,6 +40,13 @@ DEFAULT_EXCLUDED_PATTERNS = [
     "__pycache__", ".tox", ".eggs", "*.egg",
 ]
 PY_EXT = '.py'
+# phases of a file timed by the benchmark mode, and their titles
+BENCHMARK_PHASES = {
+    "open": "Open file",
+    "gen_newlines": "Generate new lines",
+    "write": "Write new lines",
+    "close": "Close file",
+}
 
 
 class NoOptionsException(Exception):
@@ -45,7 +54,7 @@ class NoOptionsException(Exception):
 
 
 class App:
-    def __init__(self):
+    def __init__(self, warm: Optional[_warm.WarmState] = None):
         # fallback
         self.default_path = '.'
         self.default_excluded = DEFAULT_EXCLUDED_PATTERNS
@@ -54,10 +63,42 @@ class App:
         self.mode = Mode.DEFAULT
         self.verbosity = 0
         self.benchmark_runs = 100
-
-    def run(self):
+        # None for the defaults of _bench_defaults
+        self.benchmark_warmup = None
+        self.benchmark_format = None
+        self.benchmark_kind = None
+        self.benchmark_engine = None
+        # None to print the report
+        self.benchmark_output = None
+        # path to save the report to, and loaded report to compare
+        # it to, None not to
+        self.benchmark_save = None
+        self.benchmark_baseline = None
+        self.benchmark_max_slowdown = None
+        self.jobs = 1
+        self.max_inflight_files = _parallel.MAX_INFLIGHT_FILES
+        self.max_inflight_bytes = _parallel.MAX_INFLIGHT_BYTES
+        self.use_cache = True
+        self.cache_dir = _cache.DEFAULT_CACHE_DIR
+        self.stream_threshold = _proc.STREAM_THRESHOLD
+        # None to write files in place, else the durability
+        # level of atomic writes
+        self.durability = None
+        # None for the journal in the cache dir
+        self.journal_path = None
+        self.watch = False
+        # ignore rules of the path when respecting .gitignore files
+        self.gitignore = None
+        # parsed config files & loaded caches kept between runs
+        # by the daemon, None to load them for each run
+        self.warm = warm
+
+    def run(self, argv: Optional[Sequence[str]] = None):
+        """Run pytagged with argv, the command line arguments
+        without the program name, defaults to sys.argv[1:]
+        """
         try:
-            options = self.get_opts()
+            options = self.get_opts(argv)
         except NoOptionsException:
             sys.stderr.write(
                 "Error: no configs and no cli arguments\n")
@@ -72,10 +113,46 @@ class App:
         print(f"extend excluded: {options.extend_exclude}")
         print(f"mode: {options.mode.name}")
         print(f"benchmark runs: {options.benchmark_runs}")
+        print(f"benchmark warmup: {options.benchmark_warmup}")
+        print(f"benchmark format: {options.benchmark_format}")
+        print(f"benchmark kind: {options.benchmark_kind}")
+        print(f"benchmark engine: {options.benchmark_engine}")
+        print(f"benchmark output: {options.benchmark_output}")
+        print(f"save baseline: {options.save_baseline}")
+        print(f"compare to: {options.compare_to}")
+        print(f"max slowdown: {options.max_slowdown}")
         print(f"verbosity: {options.verbosity}")
+        print(f"jobs: {options.jobs}")
+        print(f"max inflight files: {options.max_inflight_files}")
+        print(f"max inflight bytes: {options.max_inflight_bytes}")
+        print(f"no cache: {options.no_cache}")
+        print(f"cache dir: {options.cache_dir}")
+        print(f"stream threshold: {options.stream_threshold}")
+        print(f"atomic: {options.atomic}")
+        print(f"durability: {options.durability}")
+        print(f"journal: {options.journal}")
+        print(f"restore: {options.restore}")
+        print(f"watch: {options.watch}")
+        print(f"changed since: {options.changed_since}")
+        print(f"staged: {options.staged}")
+        print(f"respect gitignore: {options.respect_gitignore}")
         print('')
         # end
 
+        if options.atomic or options.durability is not None:
+            durability = options.durability or _write.DEFAULT_DURABILITY
+            if durability not in _write.DURABILITY_LEVELS:
+                sys.stderr.write(
+                    f"durability must be one of "
+                    f"{', '.join(_write.DURABILITY_LEVELS)}\n")
+                sys.exit(1)
+            self.durability = durability
+
+        # restoring only needs the journal
+        if options.restore and options.mode in (Mode.DEFAULT, Mode.RESTORE):
+            self.mode = Mode.RESTORE
+            self._restore(options.restore)
+
         # need tags
         if not options.tags:
             sys.stderr.write(
@@ -102,21 +179,22 @@ class App:
             excluded_patterns = self.default_excluded
 
         if options.extend_exclude is not None:
-            excluded_patterns += options.extend_exclude
+            excluded_patterns = excluded_patterns + options.extend_exclude
         excluded_patterns = [i.strip() for i in excluded_patterns]
         excluded_patterns = [i for i in excluded_patterns if i]
 
-        def exclude(pth: str) -> bool:
-            return _files_utils.match_path(pth, excluded_patterns)
-
-        gen_files = _files_utils.filepaths_from_path(path, is_excluded=exclude)
-        files = [f for f in gen_files if f.endswith(self.extension)]
-
-        if not files:
-            print(f"Found no files matching pattern: {path}")
-            sys.exit(0)
+        exclude = _files_utils.get_path_matcher(excluded_patterns)
 
         self.mode = options.mode
+        if options.watch:
+            if self.mode is not Mode.DEFAULT:
+                sys.stderr.write("--watch only works in the default mode\n")
+                sys.exit(1)
+            if self.warm is not None:
+                sys.stderr.write("--watch can't run in the daemon\n")
+                sys.exit(1)
+            self.watch = True
+
         if options.verbosity is not None:
             self.verbosity = options.verbosity
 
@@ -128,7 +206,121 @@ class App:
                     sys.exit(1)
                 self.benchmark_runs = benchmark_runs
 
-        num_files = len(files)
+        if self.mode is Mode.BENCHMARK:
+            from pytagged import _bench
+
+            warmup = options.benchmark_warmup
+            if warmup is None:
+                warmup = _bench_defaults.DEFAULT_WARMUP
+            if warmup < 0:
+                sys.stderr.write("Benchmark warmup runs must not be negative\n")
+                sys.exit(1)
+            self.benchmark_warmup = warmup
+            fmt = options.benchmark_format or _bench_defaults.DEFAULT_FORMAT
+            if fmt not in _bench_defaults.FORMATS:
+                sys.stderr.write(f"benchmark format must be one of "
+                                 f"{', '.join(_bench_defaults.FORMATS)}\n")
+                sys.exit(1)
+            self.benchmark_format = fmt
+            self.benchmark_output = options.benchmark_output
+            kind = options.benchmark_kind or _bench_defaults.DEFAULT_KIND
+            if kind not in _bench_defaults.KINDS:
+                sys.stderr.write(f"benchmark kind must be one of "
+                                 f"{', '.join(_bench_defaults.KINDS)}\n")
+                sys.exit(1)
+            if kind == "e2e" and (options.changed_since or options.staged):
+                sys.stderr.write("the e2e benchmark walks the path, it can't "
+                                 "be combined with --changed-since or "
+                                 "--staged\n")
+                sys.exit(1)
+            self.benchmark_kind = kind
+            engine = options.benchmark_engine or nline.DEFAULT_ENGINE
+            if engine not in _bench_defaults.engine_names():
+                sys.stderr.write(f"benchmark engine must be one of "
+                                 f"{', '.join(_bench_defaults.engine_names())}\n")
+                sys.exit(1)
+            self.benchmark_engine = engine
+
+            # named baselines go to the cache dir given with this run
+            cache_dir = options.cache_dir or self.cache_dir
+            if options.save_baseline:
+                self.benchmark_save = _bench.baseline_path(
+                    options.save_baseline, cache_dir)
+            if options.compare_to:
+                try:
+                    self.benchmark_baseline = _bench.load_baseline(
+                        _bench.baseline_path(options.compare_to, cache_dir))
+                except _bench.BaselineError as e:
+                    sys.stderr.write(f"Error: {e}\n")
+                    sys.exit(1)
+            max_slowdown = options.max_slowdown
+            if max_slowdown is None:
+                max_slowdown = _bench_defaults.DEFAULT_MAX_SLOWDOWN
+            if max_slowdown < 0:
+                sys.stderr.write("max_slowdown must not be negative\n")
+                sys.exit(1)
+            self.benchmark_max_slowdown = max_slowdown
+
+        if options.jobs is not None:
+            self.jobs = _parallel.resolve_jobs(options.jobs)
+
+        for name in ("max_inflight_files", "max_inflight_bytes"):
+            cap = getattr(options, name)
+            if cap is not None:
+                if cap < 1:
+                    sys.stderr.write(f"{name} must be positive\n")
+                    sys.exit(1)
+                setattr(self, name, cap)
+
+        if options.no_cache:
+            self.use_cache = False
+        if options.cache_dir:
+            self.cache_dir = options.cache_dir
+
+        if options.stream_threshold is not None:
+            if options.stream_threshold < 0:
+                sys.stderr.write("stream_threshold must not be negative\n")
+                sys.exit(1)
+            self.stream_threshold = options.stream_threshold
+
+        if options.journal:
+            self.journal_path = options.journal
+
+        if options.respect_gitignore:
+            self.gitignore = _gitignore.GitIgnore(path)
+
+        if options.changed_since or options.staged:
+            # only the files that git knows changed, without walking
+            from pytagged import _git
+            try:
+                gen_files = _git.changed_files(
+                    path, options.changed_since, bool(options.staged), exclude)
+            except _git.GitError as e:
+                sys.stderr.write(f"Error: {e}\n")
+                sys.exit(1)
+            gen_files = [f for f in gen_files if f.endswith(self.extension)]
+            if self.gitignore is not None:
+                gen_files = [f for f in gen_files
+                             if not self.gitignore.ignored(f, False)]
+        else:
+            gen_files = _files_utils.filepaths_from_path(
+                path, exclude, self.extension, self.gitignore)
+
+        gen_files = iter(gen_files)
+        first = next(gen_files, None)
+        # files created later are picked up by the watcher
+        if first is None and not self.watch:
+            print(f"Found no files matching pattern: {path}")
+            sys.exit(0)
+
+        # the default mode processes the files as the walk finds them,
+        # the other modes, -j & -v need the whole list first
+        files = [] if first is None else itertools.chain([first], gen_files)
+        stream = self.mode is Mode.DEFAULT and not self.watch \
+            and self.jobs == 1 and self.verbosity == 0
+        if not stream:
+            files = list(files)
+        num_files = "streamed" if stream else len(files)
         # block: develop
         _utils.pretty_print_title("Run info", span=True)
         print(f"Mode: {self.mode.name.lower()}")
@@ -136,31 +328,32 @@ class App:
         print(f"Using tags: {', '.join(tags)}")
         print(f"Excluding: {excluded_patterns}")
         print(f"Verbosity: {self.verbosity}")
+        print(f"Jobs: {self.jobs}")
+        print(f"Cache: {self.cache_dir if self.use_cache else None}")
+        print(f"Atomic writes: {self.durability}")
+        print(f"Journal: {self._get_journal_path()}")
+        print(f"Watch: {self.watch}")
+        print(f"Respect .gitignore: {self.gitignore is not None}")
         print(f"Number of files: {num_files}")
         print('')
 
         # end
         if self.verbosity > 0:
             _utils.pretty_print_title("More Info", span=True)
+            if self.gitignore is not None:
+                print(f"Pruned by .gitignore: {self.gitignore.pruned} entries")
             print(f"Collected {num_files} files:")
             if num_files < 10:
                 for f in files:
                     print(f)
 
-        # TODO: handle file resources for windows/mac
-        if "resource" in sys.modules:
-            soft_lim, hard_lim = resource.getrlimit(resource.RLIMIT_NOFILE)
-            print("Hard limit of file descriptors: ", hard_lim)     # develop
-
-            if soft_lim < num_files:
-                if not self._try_request_resource(resource.RLIMIT_NOFILE,
-                                                  (num_files, hard_lim)):
-                    sys.stderr("Cannot acquire file resources, exiting")
-                    sys.exit(1)
-
         try:
-
-            self._run(files, tags)
+            if self.watch:
+                self._proc_files_watch(path, exclude, files, tags)
+            elif self.mode is Mode.BENCHMARK and self.benchmark_kind == "e2e":
+                self._proc_files_benchmark_e2e(path, exclude, files, tags)
+            else:
+                self._run(files, tags)
             sys.exit(0)
         except OSError as e:
             sys.stderr.write(str(e))
@@ -169,17 +362,21 @@ class App:
             sys.stderr.write("Interrupted while still working")
             sys.exit(1)
 
-    def get_opts(self) -> Options:
+    def get_opts(self, argv: Optional[Sequence[str]] = None) -> Options:
         """Get options from cli and from config file
         By default, we look for the config file first,
         and then "merge" it with the cli args if there is any.
         If both are None, raise NoOptionsException. The options
         from cli take precedence
 
+        Args:
+            argv (Optional[Sequence[str]]): cli arguments, defaults
+                to sys.argv[1:]
+
         Returns:
             (Options): Options obtained from cli and config file.
         """
-        cli_opts = self._get_cli_opts()
+        cli_opts = self._get_cli_opts(argv)
 
         # if no cli options, look for default config file
         if cli_opts is None:
@@ -212,7 +409,7 @@ class App:
         if config_path is None:
             raise ValueError("no config path provided")
 
-        cfg_options = {}
+        import configparser
 
         cfg_options = {k: v for k, v in _options.items() if v is not None}
         for k in cfg_options:
@@ -238,16 +435,23 @@ class App:
             extend_exclude=[],
             mode=Mode.DEFAULT,
             verbosity=0,
-            benchmark_runs=self.benchmark_runs)
-
-    def _try_request_resource(self,
-                              rsrc: int,
-                              new_lim: Tuple[int, int]) -> bool:
-        try:
-            resource.setrlimit(rsrc, new_lim)
-            return True
-        except (OSError, ValueError):
-            return False
+            benchmark_runs=self.benchmark_runs,
+            benchmark_warmup=self.benchmark_warmup,
+            benchmark_format=self.benchmark_format,
+            benchmark_kind=self.benchmark_kind,
+            benchmark_engine=self.benchmark_engine,
+            jobs=self.jobs,
+            max_inflight_files=self.max_inflight_files,
+            max_inflight_bytes=self.max_inflight_bytes,
+            no_cache=not self.use_cache,
+            cache_dir=self.cache_dir,
+            stream_threshold=self.stream_threshold,
+            atomic=self.durability is not None,
+            durability=self.durability,
+            journal=self._get_journal_path(),
+            watch=self.watch,
+            staged=False,
+            respect_gitignore=False)
 
     def _run(self, paths: str, tags: str):
         if self.mode is Mode.DEFAULT:
@@ -257,19 +461,38 @@ class App:
             self._proc_files_printonly(paths, tags)
 
         elif self.mode is Mode.BENCHMARK:
-            self._proc_files_benchmark(paths, tags)
+            if self.benchmark_kind == "memory":
+                self._proc_files_benchmark_memory(paths, tags)
+            else:
+                self._proc_files_benchmark(paths, tags)
+
+    def _get_cli_opts(self,
+                      argv: Optional[Sequence[str]] = None) -> Optional[Options]:
+        import argparse
+        import textwrap
+
+        def formatter(prog: str) -> argparse.HelpFormatter:
+            # argparse imports shutil, and bz2 & lzma along with it,
+            # only to get the terminal width, unless it's given
+            try:
+                width = int(os.environ["COLUMNS"])
+            except (KeyError, ValueError):
+                try:
+                    width = os.get_terminal_size().columns
+                except OSError:
+                    width = 80
+            return argparse.RawTextHelpFormatter(prog, width=width - 2)
 
-    def _get_cli_opts(self) -> Optional[Options]:
         arg_parser = argparse.ArgumentParser(
             description="Comment out tagged code in your python code",
             add_help=False,
-            formatter_class=argparse.RawTextHelpFormatter)
+            formatter_class=formatter)
 
         # required args
         arg_parser.add_argument("path",
                                 type=str,
                                 nargs='?',
-                                default='',
+                                default=None,
                                 help=textwrap.dedent("""\
                                     path to python file(s),
                                     if this is a directory, the program
@@ -279,7 +502,7 @@ class App:
 
         arg_parser.add_argument("-cf", "--config",
                                 type=str,
-                                default='',
+                                default=None,
                                 help=textwrap.dedent("""\
                                     path to a .cfg format file containing
                                     the configurations options to run
@@ -320,6 +543,126 @@ class App:
                                 verbosity, select the verbosity of the output.
                                 Defaults to 0, no output."""))
 
+        arg_parser.add_argument("-j", "--jobs",
+                                type=int,
+                                default=None,
+                                help=textwrap.dedent("""\
+                                number of worker processes used to process
+                                the files. Use 0 for one worker per cpu.
+                                Defaults to 1, no process pool.\n \n"""))
+
+        arg_parser.add_argument("--max-inflight-files",
+                                dest="max_inflight_files",
+                                type=int,
+                                default=None,
+                                help=textwrap.dedent("""\
+                                max number of files handed to the process
+                                pool whose results have not been consumed
+                                yet. Only used with -j/--jobs.\n \n"""))
+
+        arg_parser.add_argument("--max-inflight-bytes",
+                                dest="max_inflight_bytes",
+                                type=int,
+                                default=None,
+                                help=textwrap.dedent("""\
+                                same as --max-inflight-files but caps the
+                                total size in bytes of those files.\n \n"""))
+
+        arg_parser.add_argument("--no-cache",
+                                dest="no_cache",
+                                action="store_true",
+                                default=None,
+                                help=textwrap.dedent("""\
+                                do not use the cache of files known to be
+                                unchanged by previous runs, every file
+                                is read and processed.\n \n"""))
+
+        arg_parser.add_argument("--cache-dir",
+                                dest="cache_dir",
+                                type=str,
+                                default=None,
+                                help=textwrap.dedent(f"""\
+                                directory of the cache. Defaults to
+                                {_cache.DEFAULT_CACHE_DIR} in the
+                                working dir.\n \n"""))
+
+        arg_parser.add_argument("--stream-threshold",
+                                dest="stream_threshold",
+                                type=int,
+                                default=None,
+                                help=textwrap.dedent(f"""\
+                                files at least this many bytes big are
+                                streamed line by line instead of being
+                                read as a whole, 0 to stream every file.
+                                Defaults to {_proc.STREAM_THRESHOLD}.\n \n"""))
+
+        arg_parser.add_argument("--atomic",
+                                action="store_true",
+                                default=None,
+                                help=textwrap.dedent("""\
+                                write each changed file to a temporary
+                                file next to it, which then replaces it.
+                                An interrupted run never leaves a file
+                                half written.\n \n"""))
+
+        arg_parser.add_argument("--durability",
+                                choices=_write.DURABILITY_LEVELS,
+                                default=None,
+                                help=textwrap.dedent("""\
+                                fsync level of atomic writes, implies
+                                --atomic. none: no fsync, dir: fsync each
+                                file and each directory once at the end,
+                                file: fsync each file and its directory.
+                                Defaults to none.\n \n"""))
+
+        arg_parser.add_argument("--journal",
+                                type=str,
+                                default=None,
+                                help=textwrap.dedent(f"""\
+                                path of the undo journal, where each run
+                                records the original content of the lines
+                                it comments out. Defaults to
+                                {_journal.DEFAULT_JOURNAL_NAME} in the
+                                cache dir.\n \n"""))
+
+        arg_parser.add_argument("--watch",
+                                action="store_true",
+                                default=None,
+                                help=textwrap.dedent("""\
+                                after a full pass, keep watching the path
+                                and process the files that are created or
+                                modified, until interrupted with Ctrl-C.
+                                Uses inotify on Linux, polling elsewhere.\n \n"""))
+
+        arg_parser.add_argument("--changed-since",
+                                dest="changed_since",
+                                type=str,
+                                default=None,
+                                metavar="REF",
+                                help=textwrap.dedent("""\
+                                only process the files that git reports as
+                                changed since REF, committed or not, and
+                                the untracked ones, instead of walking the
+                                path. Excludes still apply.\n \n"""))
+
+        arg_parser.add_argument("--staged",
+                                action="store_true",
+                                default=None,
+                                help=textwrap.dedent("""\
+                                only process the files staged in the git
+                                index, e.g. in a pre-commit hook. Can be
+                                combined with --changed-since.\n \n"""))
+
+        arg_parser.add_argument("--respect-gitignore",
+                                dest="respect_gitignore",
+                                action="store_true",
+                                default=None,
+                                help=textwrap.dedent("""\
+                                also leave out the files & directories
+                                ignored by the .gitignore files of the
+                                work tree, and .git/info/exclude. Ignored
+                                directories are not walked.\n \n"""))
+
         # optional args
         arg_parser.add_argument("-h", "--help",
                                 action="store_true",
@@ -329,7 +672,7 @@ class App:
         modes.add_argument("-b", "--benchmark",
                            type=int,
                            nargs='?',
-                           default=0,
+                           default=None,
                            const=-1,
                            help=textwrap.dedent("""\
                                 Number of benchmark runs, if this is supplied
@@ -345,11 +688,108 @@ class App:
                                 to the -v flag but the program will not modify
                                 file(s).\n \n"""))
 
-        args = arg_parser.parse_args()
+        arg_parser.add_argument("--benchmark-warmup",
+                                dest="benchmark_warmup",
+                                type=int,
+                                default=None,
+                                metavar="N",
+                                help=textwrap.dedent("""\
+                                number of runs done before the measured
+                                ones in benchmark mode, and left out
+                                of the report. Defaults to {}.\n \n""".format(
+                                    _bench_defaults.DEFAULT_WARMUP)))
+
+        arg_parser.add_argument("--benchmark-format",
+                                dest="benchmark_format",
+                                choices=_bench_defaults.FORMATS,
+                                default=None,
+                                help=textwrap.dedent("""\
+                                format of the benchmark report, json
+                                includes the samples of every run, to be
+                                archived & compared. Defaults to text.\n \n"""))
 
-        try:
-            _ = sys.argv[1]
-        except IndexError:
+        arg_parser.add_argument("--benchmark-output",
+                                dest="benchmark_output",
+                                type=str,
+                                default=None,
+                                metavar="FILE",
+                                help=textwrap.dedent("""\
+                                write the benchmark report to FILE
+                                instead of printing it.\n \n"""))
+
+        arg_parser.add_argument("--benchmark-kind",
+                                dest="benchmark_kind",
+                                choices=_bench_defaults.KINDS,
+                                default=None,
+                                help=textwrap.dedent("""\
+                                what the benchmark measures. io: each
+                                file is copied to a temporary file, then
+                                opened, processed, written & closed.
+                                memory: only the engine, on the files
+                                loaded in memory once. e2e: the walk,
+                                exclusion, prefilter & real writes of the
+                                default mode, on a scratch copy of the
+                                tree. Defaults to io.\n \n"""))
+
+        arg_parser.add_argument("--benchmark-engine",
+                                dest="benchmark_engine",
+                                choices=_bench_defaults.engine_names(),
+                                default=None,
+                                help=textwrap.dedent(f"""\
+                                engine run by the memory benchmark, bytes
+                                & edits work on the raw bytes of the files.
+                                Defaults to {nline.DEFAULT_ENGINE}.\n \n"""))
+
+        arg_parser.add_argument("--save-baseline",
+                                dest="save_baseline",
+                                type=str,
+                                default=None,
+                                metavar="NAME",
+                                help=textwrap.dedent(f"""\
+                                save the benchmark report as the baseline
+                                NAME, in the {_bench_defaults.BASELINE_DIR} directory
+                                of the cache dir, or at NAME if it is a
+                                path or ends with .json.\n \n"""))
+
+        arg_parser.add_argument("--compare-to",
+                                dest="compare_to",
+                                type=str,
+                                default=None,
+                                metavar="BASELINE",
+                                help=textwrap.dedent("""\
+                                compare the benchmark to a baseline saved
+                                with --save-baseline, or to any JSON report,
+                                and exit with 1 if it is slower than
+                                --max-slowdown.\n \n"""))
+
+        arg_parser.add_argument("--max-slowdown",
+                                dest="max_slowdown",
+                                type=float,
+                                default=None,
+                                metavar="PCT",
+                                help=textwrap.dedent("""\
+                                percentage by which the median total of
+                                the runs may be slower than the baseline.
+                                Beyond it, if the confidence interval of
+                                the change is above 0, the run fails.
+                                Defaults to {:g}.\n \n""".format(
+                                    _bench_defaults.DEFAULT_MAX_SLOWDOWN)))
+
+        modes.add_argument("--restore",
+                           type=str,
+                           default=None,
+                           metavar="JOURNAL",
+                           help=textwrap.dedent("""\
+                                Restore mode, put back the lines commented
+                                out by the run that wrote JOURNAL. Only the
+                                files it changed are touched, and files
+                                edited since then are skipped.\n \n"""))
+
+        if argv is None:
+            argv = sys.argv[1:]
+        args = arg_parser.parse_args(argv)
+
+        if not argv:
             return None
 
         if args.help:
@@ -361,6 +801,8 @@ class App:
             mode_int = 1
         elif args.benchmark:
             mode_int = 2
+        elif args.restore:
+            mode_int = 3
 
         return Options(
             path=args.path,
@@ -370,12 +812,41 @@ class App:
             extend_exclude=args.extend_exclude,
             mode=Mode(mode_int),
             benchmark_runs=args.benchmark,
-            verbosity=args.verbosity
+            benchmark_warmup=args.benchmark_warmup,
+            benchmark_format=args.benchmark_format,
+            benchmark_output=args.benchmark_output,
+            benchmark_kind=args.benchmark_kind,
+            benchmark_engine=args.benchmark_engine,
+            save_baseline=args.save_baseline,
+            compare_to=args.compare_to,
+            max_slowdown=args.max_slowdown,
+            verbosity=args.verbosity,
+            jobs=args.jobs,
+            max_inflight_files=args.max_inflight_files,
+            max_inflight_bytes=args.max_inflight_bytes,
+            no_cache=args.no_cache,
+            cache_dir=args.cache_dir,
+            stream_threshold=args.stream_threshold,
+            atomic=args.atomic,
+            durability=args.durability,
+            journal=args.journal,
+            restore=args.restore,
+            watch=args.watch,
+            changed_since=args.changed_since,
+            staged=args.staged,
+            respect_gitignore=args.respect_gitignore
         )
 
     def _get_cfg_opts(self, path: str) -> Optional[Options]:
+        if self.warm is not None:
+            return self.warm.config(os.path.abspath(path), self._parse_cfg_opts)
+        return self._parse_cfg_opts(path)
+
+    def _parse_cfg_opts(self, path: str) -> Optional[Options]:
         path = os.path.abspath(path)
         if os.path.exists(path):
+            import configparser
+
             config = configparser.ConfigParser()
             try:
                 config.read(path)
@@ -428,180 +899,457 @@ class App:
                 except ValueError:
                     opt_dict["verbosity"] = None
 
-            return Options(**opt_dict)
-
-        return None
-
-    def _proc_files(self, paths: Sequence[str], tags: Sequence[str]):
-        open_hook = io.open
-        _line_prog = nline.get_newlines
+            for k in ("jobs", "max_inflight_files", "max_inflight_bytes",
+                      "stream_threshold", "benchmark_warmup"):
+                if k in opt_dict:
+                    try:
+                        opt_dict[k] = int(opt_dict[k])
+                    except ValueError:
+                        opt_dict[k] = None
 
-        def line_prog(fin: IO) -> Sequence[str]:
-            return _line_prog(fin, tags)
+            if "max_slowdown" in opt_dict:
+                try:
+                    opt_dict["max_slowdown"] = float(opt_dict["max_slowdown"])
+                except ValueError:
+                    opt_dict["max_slowdown"] = None
 
-        res_tuples = [tup for tup in
-                      (self._write_newlines_to_file(f, line_prog, open_hook)
-                       for f in paths)]
-        if self.verbosity < 1:
-            for fin, _ in res_tuples:
-                fin.close()
+            for k in ("no_cache", "atomic", "watch", "staged",
+                      "respect_gitignore"):
+                if k in opt_dict:
+                    flag = opt_dict[k].strip().lower()
+                    opt_dict[k] = \
+                        configparser.ConfigParser.BOOLEAN_STATES.get(flag)
 
-        else:
-            for i, t in enumerate(res_tuples):
-                fin, newlines = t
-                self._print_rawlines_pretty(paths[i], newlines)
-                fin.close()
+            for k in ("durability", "benchmark_format", "benchmark_kind",
+                      "benchmark_engine"):
+                if k in opt_dict:
+                    opt_dict[k] = opt_dict[k].strip().lower()
 
-    def _proc_files_printonly(self, paths: Sequence[str], tags: Sequence[str]):
-        open_hook = open
-        _line_prog = nline.get_newlines
+            if "restore" in opt_dict and "mode" not in opt_dict:
+                opt_dict["mode"] = Mode.RESTORE
 
-        def line_prog(fin: IO) -> Sequence[str]:
-            return _line_prog(fin, tags)
+            return Options(**opt_dict)
 
-        res_tuples = [
-            tup for tup in
-            (self._readlines_from_file(f, line_prog, open_hook) for f in paths)
-        ]
+        return None
 
-        for i, t in enumerate(res_tuples):
-            fin, newlines = t
-            self._print_rawlines_pretty(paths[i], newlines)
-            fin.close()
+    def _proc_files_parallel(self, paths: Sequence[str],
+                             tags: Sequence[str], write: bool,
+                             journal: Optional[_journal.Journal] = None,
+                             digests: Optional[Dict[str, str]] = None
+                             ) -> Tuple[int, int]:
+        # printonly mode prints every file, so it can't skip any
+        keep_lines = not write or self.verbosity > 0
+        results = _parallel.imap_files(
+            paths, tags, self.jobs,
+            write=write, keep_lines=keep_lines, prefilter=write,
+            stream_threshold=self.stream_threshold,
+            durability=self.durability,
+            undo=journal is not None,
+            digest=digests is not None,
+            max_inflight_files=self.max_inflight_files,
+            max_inflight_bytes=self.max_inflight_bytes)
+        written = 0
+        prefiltered = 0
+        for res in results:
+            written += res.written
+            prefiltered += res.prefiltered
+            if res.undo is not None:
+                journal.record(paths[res.index], res.undo)
+            if res.digest is not None:
+                digests[paths[res.index]] = res.digest
+            if keep_lines and res.lines is not None:
+                self._print_rawlines_pretty(paths[res.index], res.lines)
+        return written, prefiltered
+
+    def _proc_files(self, paths: Iterable[str], tags: Sequence[str],
+                    journal: Optional[_journal.Journal] = None):
+        cache = None
+        if self.use_cache:
+            cache = self._load_cache(tags)
+
+        num_files = 0
+        # files that were not skipped by the cache
+        done = []
+
+        def gen_todo() -> Iterator[str]:
+            nonlocal num_files
+            for f in paths:
+                num_files += 1
+                if cache is None or not cache.lookup(f):
+                    done.append(f)
+                    yield f
+
+        if journal is None:
+            journal = _journal.Journal()
+        # of the content each file was processed with
+        digests = None if cache is None else {}
+        if self.jobs > 1:
+            todo = list(gen_todo())
+        else:
+            # paths may still be walked, files are processed as they come
+            todo = gen_todo()
+        if self.jobs > 1 and len(todo) > 1:
+            written, prefiltered = self._proc_files_parallel(
+                todo, tags, write=True, journal=journal, digests=digests)
+        else:
+            written, prefiltered = self._proc_files_serial(
+                todo, tags, journal, digests)
 
-    def _proc_files_benchmark(self, paths: Sequence[str], tags: Sequence[str]):
+        # a run that changed nothing keeps the journal of the last one
+        # that did, whose lines are still commented out
+        journal_path = self._get_journal_path()
+        if written:
+            self._save_journal(journal, journal_path)
 
-        def countline(path: str):
-            with open(path) as fin:
-                return len(list(fin))
-        lines = 0
-        runs = self.benchmark_runs
-        for p in paths:
-            lines += countline(p)
-        total_lines = lines * runs
+        if cache is not None:
+            # every processed file is now left unchanged by another run
+            for f in done:
+                cache.record(f, digests.get(f))
+            self._save_cache(cache)
 
-        open_time_data = []
-        gen_newlines_time_data = []
-        write_time_data = []
-        close_time_data = []
-        num_files = len(paths)
-        num_runs = range(runs)
-
-        for _ in num_runs:
-            open_time, gen_newlines_time, write_time, close_time = \
-                self._time_process_files(paths, tags)
-            open_time_data.append(open_time)
-            gen_newlines_time_data.append(gen_newlines_time)
-            write_time_data.append(write_time)
-            close_time_data.append(close_time)
-
-        total_runs = runs * num_files
-        open_time_total = sum(open_time_data)
-        gen_newlines_time_total = sum(gen_newlines_time_data)
-        write_time_total = sum(write_time_data)
-        close_time_total = sum(close_time_data)
-
-        open_result = {
-            "open_time_total": open_time_total,
-            "open_time_avg_total": statistics.mean(open_time_data),
-            "open_time_median_total": statistics.median(open_time_data),
-            "open_time_avg_file": open_time_total / total_runs,
-            "open_time_avg_line": open_time_total / total_lines,
-        }
+        if self.verbosity > 0:
+            self._print_write_summary(written, num_files - written)
+            if cache is not None:
+                print(f"Cache hits: {cache.hits}, misses: {cache.misses}")
+            print(f"Skipped by the prefilter: {prefiltered} files")
+            if written:
+                print(f"Journal: {journal_path}")
+
+    def _proc_files_serial(self, paths: Iterable[str],
+                           tags: Sequence[str],
+                           journal: Optional[_journal.Journal] = None,
+                           digests: Optional[Dict[str, str]] = None
+                           ) -> Tuple[int, int]:
+        matcher = nline.get_matcher(tags)
+        # files without any tag in them are not even decoded
+        prefilter = _prefilter.Prefilter(tags)
+        keep_lines = self.verbosity > 0
+        writer = None
+        if self.durability is not None:
+            writer = _write.AtomicWriter(self.durability)
+
+        # one file is opened, transformed, written and closed
+        # before the next one is opened
+        written = 0
+        for f in paths:
+            res = _proc.proc_file(f, matcher, write=True, keep_lines=keep_lines,
+                                  prefilter=prefilter,
+                                  stream_threshold=self.stream_threshold,
+                                  writer=writer, undo=journal is not None,
+                                  digest=digests is not None)
+            written += res.written
+            if res.undo is not None:
+                journal.record(f, res.undo)
+            if res.digest is not None:
+                digests[f] = res.digest
+            if keep_lines and res.lines is not None:
+                self._print_rawlines_pretty(f, res.lines)
+        if writer is not None:
+            writer.flush()
+        return written, prefilter.misses
+
+    def _proc_files_watch(self, path: str, is_excluded: Callable[[str], bool],
+                          files: Sequence[str], tags: Sequence[str]):
+        """Full pass on files, then process the files under path that
+        are created or modified, in debounced batches, until interrupted.
+        The matcher & prefilter are built once for the whole session.
+        """
+        from pytagged import _watch
+
+        matcher = nline.get_matcher(tags)
+        prefilter = _prefilter.Prefilter(tags)
+        keep_lines = self.verbosity > 0
+        writer = None
+        if self.durability is not None:
+            writer = _write.AtomicWriter(self.durability)
+
+        # watching starts before the full pass, so that no change made
+        # during it is missed, its own writes are then marked as seen
+        with _watch.Watcher(path, is_excluded, self.extension,
+                            ignore=self.gitignore) as watcher:
+            # one journal for the whole session, --restore undoes the
+            # full pass and every batch
+            journal = _journal.Journal()
+            journal_path = self._get_journal_path()
+            if files:
+                self._proc_files(files, tags, journal)
+            watcher.seen(files)
+            cache = None
+            if self.use_cache:
+                cache = self._load_cache(tags)
+            print(f"Watching {path} ({watcher.backend_name}), "
+                  f"press Ctrl-C to stop", flush=True)
 
-        newlines_result = {
-            "gen_newlines_time_total":
-            gen_newlines_time_total,
-            "gen_newlines_time_avg_total":
-            statistics.mean(gen_newlines_time_data),
-            "gen_newlines_time_median_total":
-            statistics.median(gen_newlines_time_data),
-            "gen_newlines_avg_file":
-            gen_newlines_time_total / total_runs,
-            "gen_newlines_avg_line":
-            gen_newlines_time_total / total_lines,
-        }
+            try:
+                for batch in watcher.batches():
+                    written = 0
+                    for f in batch:
+                        res = _proc.proc_file(
+                            f, matcher, write=True, keep_lines=keep_lines,
+                            prefilter=prefilter,
+                            stream_threshold=self.stream_threshold,
+                            writer=writer, undo=True,
+                            digest=cache is not None)
+                        written += res.written
+                        if res.undo is not None:
+                            journal.record(f, res.undo)
+                        if cache is not None:
+                            cache.record(f, res.digest)
+                        if keep_lines and res.lines is not None:
+                            self._print_rawlines_pretty(f, res.lines)
+                    if writer is not None:
+                        writer.flush()
+                    watcher.seen(batch)
+                    # saved after each batch, a watch session ends with
+                    # Ctrl-C or a kill
+                    if written:
+                        self._save_journal(journal, journal_path)
+                    if cache is not None:
+                        self._save_cache(cache)
+                    if self.verbosity > 0:
+                        self._print_write_summary(written, len(batch) - written)
+                    sys.stdout.flush()
+            except KeyboardInterrupt:
+                pass
+
+    def _save_journal(self, journal: _journal.Journal, path: str):
+        try:
+            journal.save(path)
+        except OSError as e:
+            sys.stderr.write(f"Warning: could not save the journal: {e}\n")
 
-        write_result = {
-            "write_time_total": write_time_total,
-            "write_time_avg_total": statistics.mean(write_time_data),
-            "write_time_median_total": statistics.median(write_time_data),
-            "write_time_avg_file": write_time_total / total_runs,
-            "write_time_avg_line": write_time_total / total_lines,
-        }
+    def _save_cache(self, cache: _cache.Cache):
+        try:
+            cache.save()
+        except OSError as e:
+            sys.stderr.write(f"Warning: could not save the cache: {e}\n")
+
+    def _load_cache(self, tags: Sequence[str]) -> _cache.Cache:
+        if self.warm is not None:
+            return self.warm.cache(self.cache_dir, tags)
+        return _cache.Cache(self.cache_dir, tags).load()
+
+    def _get_journal_path(self) -> str:
+        if self.journal_path is not None:
+            return self.journal_path
+        return _journal.default_journal_path(self.cache_dir)
+
+    def _restore(self, journal_path: str):
+        """Undo the run that wrote the journal, and exit"""
+        writer = None
+        if self.durability is not None:
+            writer = _write.AtomicWriter(self.durability)
+        try:
+            journal = _journal.Journal.load(journal_path)
+            res = _journal.restore(journal, writer)
+        except (OSError, _journal.JournalError) as e:
+            sys.stderr.write(f"Error: {e}\n")
+            sys.exit(1)
 
-        close_result = {
-            "close_time_total": close_time_total,
-            "close_time_avg_total": statistics.mean(close_time_data),
-            "close_time_median_total": statistics.median(close_time_data),
-            "close_time_avg_file": close_time_total / total_runs,
-            "close_time_avg_line": close_time_total / total_lines
-        }
+        print(f"Restored {len(res.restored)} files")
+        for path in res.skipped:
+            sys.stderr.write(
+                f"Warning: skipped {path}, changed since the run\n")
+        sys.exit(1 if res.skipped else 0)
 
-        time_taken_total = open_time_total + gen_newlines_time_total + \
-            write_time_total + close_time_total
+    def _proc_files_printonly(self, paths: Sequence[str], tags: Sequence[str]):
+        if self.jobs > 1 and len(paths) > 1:
+            self._proc_files_parallel(paths, tags, write=False)
+            return
 
-        time_taken_avg_line = open_result["open_time_avg_line"] + \
-            newlines_result["gen_newlines_avg_line"] + \
-            write_result["write_time_avg_line"] + \
-            close_result["close_time_avg_line"]
+        open_hook = open
+        _line_prog = nline.get_newlines_changed
+        matcher = nline.get_matcher(tags)
 
-        time_taken_avg_file = open_result["open_time_avg_file"] + \
-            newlines_result["gen_newlines_avg_file"] + \
-            write_result["write_time_avg_file"] + \
-            close_result["close_time_avg_file"]
+        def line_prog(fin: IO) -> nline.NewLines:
+            return _line_prog(fin, matcher)
 
-        summary = {
-            "time_taken_total": time_taken_total,
-            "time_taken_avg_file": time_taken_avg_file,
-            "time_taken_avg_lines": time_taken_avg_line,
-        }
+        for f in paths:
+            newlines = self._readlines_from_file(f, line_prog, open_hook)
+            self._print_rawlines_pretty(f, newlines)
 
-        misc = {
-            "Number of files": num_files,
-            "Number of runs": runs,
-            "Number of lines": lines,
-            "Total number of lines": total_lines
-        }
+    def _proc_files_benchmark(self, paths: Sequence[str], tags: Sequence[str]):
+        from pytagged import _bench
 
-        _utils.pretty_print_title("PERFORMANCE REPORT", span=True)
-        width = get_terminal_size().columns // 4
-        print('')
-        for k, v in misc.items():
-            print(f"{k:{width}} {v:>{width}}")
+        lines, size = self._count_lines_bytes(paths)
+        num_files = len(paths)
+        timer = _bench.perf_counter_ns
+
+        # the benchmark works on copies of the files, so the cache is
+        # only looked up to report how many files a real run would skip
+        misc = {}
+        if self.use_cache:
+            cache = self._load_cache(tags)
+            st = timer()
+            for p in paths:
+                cache.lookup(p)
+            misc["Cache hits"] = cache.hits
+            misc["Cache misses"] = cache.misses
+            misc["Cache lookup (ms)"] = round((timer() - st) / 10**6, 4)
+
+        # same for the prefilter, files it misses are skipped by a real run
+        prefilter = _prefilter.Prefilter(tags)
+        st = timer()
+        for p in paths:
+            prefilter.may_match(p)
+        misc["Prefilter hits"] = prefilter.hits
+        misc["Prefilter misses"] = prefilter.misses
+        misc["Prefilter (ms)"] = round((timer() - st) / 10**6, 4)
+
+        for _ in range(self.benchmark_warmup):
+            self._time_process_files(paths, tags)
+
+        samples = {name: [] for name in BENCHMARK_PHASES}
+        written = 0
+        for _ in range(self.benchmark_runs):
+            *times, written = self._time_process_files(paths, tags)
+            for name, t in zip(BENCHMARK_PHASES, times):
+                samples[name].append(t)
+        misc["Files written per run"] = written
+        misc["Files skipped per run"] = num_files - written
+
+        report = _bench.make_report("io", samples, self.benchmark_warmup,
+                                    num_files, lines, size, misc)
+        self._output_benchmark_report(report, BENCHMARK_PHASES)
+
+    def _proc_files_benchmark_memory(self, paths: Sequence[str],
+                                     tags: Sequence[str]):
+        """Benchmark of the engine alone: the files are loaded in memory
+        once, then the engine runs over all of them in each run, without
+        any disk I/O or temporary file in the measured time.
+        """
+        from pytagged import _bench
 
-        print('')
+        lines, size = self._count_lines_bytes(paths)
+        engine = self.benchmark_engine
+        sources = _bench.load_sources(paths, engine)
+        matcher = nline.get_matcher(tags)
 
-        _utils.pretty_print_title("Open file", span=True)
-        print('')
-        for k, v in open_result.items():
-            print(f"{k:{width}} {v*1000:>{width - 2}.4f}ms")
-        print('')
+        for _ in range(self.benchmark_warmup):
+            _bench.time_engine(sources, engine, matcher)
 
-        _utils.pretty_print_title("Generate new lines", span=True)
-        for k, v in newlines_result.items():
-            print(f"{k:{width}} {v*1000:>{width - 2}.4f}ms")
-        print('')
+        samples = {"engine": []}
+        changed = 0
+        for _ in range(self.benchmark_runs):
+            elapsed, changed = _bench.time_engine(sources, engine, matcher)
+            samples["engine"].append(elapsed)
 
-        _utils.pretty_print_title("Write new lines", span=True)
-        for k, v in write_result.items():
-            print(f"{k:{width}} {v*1000:>{width - 2}.4f}ms")
-        print('')
+        misc = {
+            "Engine": engine,
+            "Files changed per run": changed,
+        }
+        report = _bench.make_report("memory", samples, self.benchmark_warmup,
+                                    len(paths), lines, size, misc)
+        self._output_benchmark_report(report, {"engine": f"Engine: {engine}"})
+
+    def _proc_files_benchmark_e2e(self, path: str,
+                                  is_excluded: Callable[[str], bool],
+                                  files: Sequence[str], tags: Sequence[str]):
+        """Benchmark of the whole default mode pipeline: the tree is
+        copied to a scratch directory, then each run walks it and
+        processes the files as they are found, writing the changed ones
+        for real. The files written by a run are cloned again before
+        the next one. The cache & the journal are left out.
+        """
+        from pytagged import _bench
+
+        lines, size = self._count_lines_bytes(files)
+
+        def is_pruned(dir_path: str) -> bool:
+            if is_excluded(dir_path):
+                return True
+            return self.gitignore is not None \
+                and self.gitignore.ignored(dir_path, True)
+
+        def time_run() -> _bench.E2ERun:
+            res = _bench.time_e2e(
+                scratch.path, is_excluded, self.extension,
+                self.gitignore is not None, tags,
+                stream_threshold=self.stream_threshold,
+                durability=self.durability)
+            scratch.reset(res.written)
+            return res
+
+        with _bench.Scratch(path, self.extension, is_pruned) as scratch:
+            scratch.create(files)
+            for _ in range(self.benchmark_warmup):
+                time_run()
+
+            samples = {name: [] for name in _bench.E2E_PHASES}
+            res = None
+            for _ in range(self.benchmark_runs):
+                res = time_run()
+                for name, t in res.times.items():
+                    samples[name].append(t)
+
+        counts = scratch.counts
+        misc = {
+            "Scratch copy": f"{counts['reflink']} reflinks, "
+                            f"{counts['hardlink']} hardlinks, "
+                            f"{counts['copy']} copies",
+            "Atomic writes": self.durability or "off",
+        }
+        if res is not None:
+            misc["Files written per run"] = len(res.written)
+            misc["Skipped by the prefilter per run"] = res.prefiltered
+            misc["Streamed or text mode per run"] = res.fallback
+        report = _bench.make_report("e2e", samples, self.benchmark_warmup,
+                                    len(files), lines, size, misc)
+        self._output_benchmark_report(report, _bench.E2E_PHASES)
+
+    def _output_benchmark_report(self, report: Dict[str, Any],
+                                 titles: Dict[str, str]):
+        """Save the report as the baseline and compare it to the baseline
+        to compare to, if any, then output it. Exits with 1 if the run
+        is slower than the baseline by more than the max slowdown.
+        """
+        from pytagged import _bench
 
-        _utils.pretty_print_title("Close file", span=True)
-        for k, v in close_result.items():
-            print(f"{k:{width}} {v*1000:>{width - 2}.4f}ms")
-        print('')
+        if self.benchmark_save is not None:
+            try:
+                _bench.save_baseline(report, self.benchmark_save)
+            except OSError as e:
+                sys.stderr.write(f"Error: could not save the baseline: {e}\n")
+                sys.exit(1)
 
-        _utils.pretty_print_title("Summary", span=True)
-        for k, v in summary.items():
-            print(f"{k:{width}} {v*1000:>{width - 2}.4f}ms")
-        print('')
+        comparison = None
+        if self.benchmark_baseline is not None:
+            try:
+                comparison = _bench.compare(self.benchmark_baseline, report,
+                                            self.benchmark_max_slowdown)
+            except _bench.BaselineError as e:
+                sys.stderr.write(f"Error: {e}\n")
+                sys.exit(1)
+            report["comparison"] = comparison
+            for warning in comparison["warnings"]:
+                sys.stderr.write(f"Warning: {warning}\n")
+
+        _bench.output_report(report, self.benchmark_format,
+                             self.benchmark_output, titles)
+        if comparison is not None and comparison["regressed"]:
+            total = comparison["phases"]["total"]
+            sys.stderr.write(
+                f"Error: {total['delta']:+.1%} slower than the baseline, "
+                f"more than the max slowdown of "
+                f"{self.benchmark_max_slowdown:g}%\n")
+            sys.exit(1)
 
-        _utils.pretty_print_title("END REPORT", span=True)
+    def _count_lines_bytes(self, paths: Sequence[str]) -> Tuple[int, int]:
+        def countline(path: str):
+            with open(path) as fin:
+                return len(list(fin))
+        lines = 0
+        size = 0
+        for p in paths:
+            lines += countline(p)
+            size += os.path.getsize(p)
+        return lines, size
 
     def _time_process_files(self, paths: Sequence[str],
-                            tags: Sequence[str]) -> Tuple[float, ...]:
+                            tags: Sequence[str]) -> Tuple[int, ...]:
+        import tempfile
+
+        from pytagged._bench import perf_counter_ns
 
         def _open(path: IOType,
                   timer: Callable[..., float],
@@ -611,10 +1359,12 @@ class App:
 
         open_with_timer = _utils.time_fn(_open)
 
+        matcher = nline.get_matcher(tags)
+
         def _newlines(fin: IO,
                       line_prog: LineProg,
-                      timer: Callable[..., float]) -> Sequence[str]:
-            return line_prog(fin, tags)
+                      timer: Callable[..., float]) -> nline.NewLines:
+            return line_prog(fin, matcher)
 
         newlines_with_timer = _utils.time_fn(_newlines)
 
@@ -636,11 +1386,11 @@ class App:
         gen_newlines_time_elapsed = 0
         write_time_elapsed = 0
         close_time_elapsed = 0
-        tmp_files = []
+        written = 0
 
         _open_hook = open
-        _line_prog = nline.get_newlines
-        _timer = time.monotonic
+        _line_prog = nline.get_newlines_changed
+        _timer = perf_counter_ns
         mk_tmpfile = tempfile.TemporaryFile
         for p in paths:
             # copy src file to temp file, also time the opening process
@@ -659,47 +1409,36 @@ class App:
 
             # get & time newlines
             newlines, gen_newlines_time = newlines_with_timer(
-                tmp_file, _line_prog, _timer)
+                tmp_file, _line_prog, timer=_timer)
             gen_newlines_time_elapsed += gen_newlines_time
 
-            # time writing
-            write_time_elapsed += write_newlines_with_timer(
-                tmp_file, newlines, _timer)
-
-            tmp_files.append(tmp_file)
+            # time writing, unchanged files are not written
+            if newlines.changed:
+                write_time_elapsed += write_newlines_with_timer(
+                    tmp_file, newlines.lines, timer=_timer)
+                written += 1
 
-        for f in tmp_files:
-            close_time_elapsed += close_with_timer(f, _timer)
+            # close right away, so that only one file is open at a time
+            close_time_elapsed += close_with_timer(tmp_file, timer=_timer)
 
         return (
             open_time_elapsed, gen_newlines_time_elapsed,
-            write_time_elapsed, close_time_elapsed)
-
-    def _write_newlines_to_file(
-            self,
-            path: IOType,
-            line_prog: LineProg,
-            open_hook: Callable[..., IO]) -> Tuple[IO, LineProgResult]:
-
-        fi = open_hook(path, mode='r+')
-        newlines = line_prog(fi)
-        fi.seek(0)
-        fi.truncate()
-        fi.writelines(newlines)
-
-        return fi, newlines
+            write_time_elapsed, close_time_elapsed, written)
 
     def _readlines_from_file(
             self,
             path: IOType,
             line_prog: LineProg,
-            open_hook: Callable[..., IO]) -> Tuple[IO, LineProgResult]:
-        fi = open_hook(path, mode='r')
-        newlines = line_prog(fi)
-        return fi, newlines
+            open_hook: Callable[..., IO]) -> LineProgResult:
+        with open_hook(path, mode='r') as fi:
+            newlines = line_prog(fi).lines
+        return newlines
 
     def _print_rawlines_pretty(self, fname: str, lines: Sequence[str]):
         _utils.pretty_print_title(fname, span=True)
         _utils.print_raw_lines(lines)
         _utils.pretty_print_title("EOF", span=True)
         print('')
+
+    def _print_write_summary(self, written: int, skipped: int):
+        print(f"Wrote {written} files, skipped {skipped} unchanged files")
@@ -0,0 +1,133 @@
+"""Thin client of the pytagged daemon, for callers that run pytag
+many times on a few files, like pre-commit hooks and editors. It
+forwards its arguments and working directory to the daemon over a
+Unix socket, and prints back what the run prints. Only imports
+what it needs to do that, and runs pytagged in process if no
+daemon is listening.
+"""
+import json
+import os
+import socket
+import stat
+import struct
+import sys
+from typing import List, Optional
+
+SOCKET_ENV = "PYTAGGED_SOCKET"
+SOCKET_NAME = "pytagged.sock"
+
+
+def private_dir() -> str:
+    """Directory of the socket if there's no $XDG_RUNTIME_DIR, in the
+    world writable temp dir, so only the user may have access to it
+    """
+    return os.path.join("/tmp", f"pytagged-{os.getuid()}")
+
+
+def socket_path() -> str:
+    """Socket of the daemon: $PYTAGGED_SOCKET, else pytagged.sock in
+    $XDG_RUNTIME_DIR, else in private_dir()
+    """
+    path = os.environ.get(SOCKET_ENV)
+    if path:
+        return path
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, SOCKET_NAME)
+    return os.path.join(private_dir(), SOCKET_NAME)
+
+
+def _is_private(st: os.stat_result) -> bool:
+    return st.st_uid == os.getuid() and not st.st_mode & 0o077
+
+
+def make_private_dir(path: str):
+    """Create the directory path, that only the user may access.
+    Raises PermissionError if it already exists and isn't theirs,
+    or others have access to it.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or not _is_private(st):
+        raise PermissionError(
+            f"{path} is not a directory private to the current user")
+
+
+def check_owner(path: str, private: bool = True):
+    """Raise PermissionError unless path is a socket of the user, and
+    if private, one that others can't access. Another user could have
+    put a socket of theirs at the path, to get the runs of this one.
+    """
+    st = os.lstat(path)
+    owned = _is_private(st) if private else st.st_uid == os.getuid()
+    if not stat.S_ISSOCK(st.st_mode) or not owned:
+        raise PermissionError(f"{path} is not a socket of the current user")
+
+
+def _peer_uid(sock: socket.socket) -> Optional[int]:
+    """Uid of the process at the other end of sock, None where
+    SO_PEERCRED isn't available
+    """
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                            struct.calcsize("3i"))
+    return struct.unpack("3i", creds)[1]
+
+
+def request(argv: List[str], path: Optional[str] = None) -> Optional[int]:
+    """Run pytagged with argv in the daemon, write its output to
+    stdout & stderr as it comes.
+
+    Returns:
+        Optional[int]: exit code of the run, None if no daemon
+            of the user is listening on path
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    path = path or socket_path()
+    try:
+        check_owner(path)
+    except PermissionError as e:
+        sys.stderr.write(f"Warning: not using the daemon, {e}\n")
+        return None
+    except OSError:
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    # the socket may have been replaced since it was checked
+    if _peer_uid(sock) not in (None, os.getuid()):
+        sock.close()
+        sys.stderr.write(f"Warning: not using the daemon, {path} is "
+                         f"served by another user\n")
+        return None
+
+    with sock, sock.makefile('rwb') as f:
+        msg = {"argv": argv, "cwd": os.getcwd()}
+        f.write(json.dumps(msg).encode() + b"\n")
+        f.flush()
+        for line in f:
+            frame = json.loads(line)
+            if "exit" in frame:
+                return frame["exit"]
+            if "out" in frame:
+                out, data = sys.stdout, frame["out"]
+            else:
+                out, data = sys.stderr, frame["err"]
+            out.write(data)
+            out.flush()
+    # the daemon went away in the middle of the run
+    sys.stderr.write("Error: lost the connection to the pytagged daemon\n")
+    return 1
+
+
+def main():
+    code = request(sys.argv[1:])
+    if code is None:
+        from pytagged.app import App
+        App().run()
+    sys.exit(code)
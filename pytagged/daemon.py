@@ -0,0 +1,158 @@
+"""pytagged daemon: runs pytagged for the thin client (see client.py)
+in a long lived process, so that each run skips the interpreter
+startup and imports. Config files, caches and compiled matchers are
+kept warm between runs, see _warm.WarmState. Runs are handled one
+at a time, each in the working directory of its client.
+"""
+import argparse
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import textwrap
+import traceback
+from typing import BinaryIO, Sequence
+
+from pytagged import _warm, client
+from pytagged.app import App
+
+
+class _FrameStream(io.TextIOBase):
+    """Text stream that sends each write to the client as a frame,
+    output of a client that went away is dropped.
+    """
+
+    def __init__(self, f: BinaryIO, key: str):
+        self.f = f
+        self.key = key
+        self.lost = False
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, s: str) -> int:
+        if s and not self.lost:
+            frame = json.dumps({self.key: s}).encode() + b"\n"
+            try:
+                self.f.write(frame)
+                self.f.flush()
+            except OSError:
+                self.lost = True
+        return len(s)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            msg = json.loads(self.rfile.readline())
+            argv = [str(a) for a in msg["argv"]]
+            cwd = str(msg["cwd"])
+        except (ValueError, KeyError, TypeError):
+            return
+        code = self.server.run(argv, cwd, _FrameStream(self.wfile, "out"),
+                               _FrameStream(self.wfile, "err"))
+        try:
+            self.wfile.write(json.dumps({"exit": code}).encode() + b"\n")
+        except OSError:
+            pass
+
+
+class Server(socketserver.UnixStreamServer):
+    """Unix socket server that runs the requests of the clients.
+    A stale socket left by a daemon that died is replaced, a live
+    one raises OSError.
+    """
+
+    def __init__(self, path: str):
+        self.warm = _warm.WarmState()
+        if os.path.lexists(path):
+            # don't probe, or remove, what another user put there
+            client.check_owner(path, private=False)
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except OSError:
+                os.remove(path)
+            else:
+                raise OSError(f"a daemon is already listening on {path}")
+            finally:
+                probe.close()
+        # only the user that started the daemon may connect
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(path, _Handler)
+        finally:
+            os.umask(old_umask)
+
+    def run(self, argv: Sequence[str], cwd: str,
+            out: io.TextIOBase, err: io.TextIOBase) -> int:
+        """Run pytagged with argv in cwd, with out & err as stdout
+        and stderr.
+
+        Returns:
+            int: exit code
+        """
+        old_cwd = os.getcwd()
+        old_out, old_err = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = out, err
+        try:
+            os.chdir(cwd)
+            App(self.warm).run(argv)
+            code = 0
+        except SystemExit as e:
+            code = e.code
+            if code is None:
+                code = 0
+            elif not isinstance(code, int):
+                err.write(f"{code}\n")
+                code = 1
+        except Exception:
+            err.write(traceback.format_exc())
+            code = 1
+        finally:
+            sys.stdout, sys.stderr = old_out, old_err
+            os.chdir(old_cwd)
+            self.warm.settle()
+        return code
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.remove(self.server_address)
+        except OSError:
+            pass
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Run pytagged for the pytag-client command",
+        formatter_class=argparse.RawTextHelpFormatter)
+    arg_parser.add_argument("--socket",
+                            type=str,
+                            default=None,
+                            help=textwrap.dedent("""\
+                            path of the Unix socket to listen on, defaults
+                            to $PYTAGGED_SOCKET, else pytagged.sock in
+                            $XDG_RUNTIME_DIR or in /tmp/pytagged-<uid>/.\n \n"""))
+    args = arg_parser.parse_args()
+    path = args.socket or client.socket_path()
+
+    try:
+        if os.path.dirname(path) == client.private_dir():
+            client.make_private_dir(client.private_dir())
+        server = Server(path)
+    except OSError as e:
+        sys.stderr.write(f"Error: {e}\n")
+        sys.exit(1)
+    # exit through server_close, which removes the socket
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Listening on {path}", flush=True)
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -1,25 +1,146 @@
+import codecs
+import locale
 import re
-from typing import IO, List, Iterable
+from bisect import bisect_right
+from functools import lru_cache
+from typing import (
+    IO, List, Iterable, Iterator, NamedTuple, Optional, Tuple, Union,
+)
 
 TRIPLE_QUOTE = '"""'
 TRIPLE_QUOTE_SINGLE = "'''"
+BLOCK_START = "# block: "
+BLOCK_END = "# end"
 
+# characters that make a tag a regex rather than a literal
+REGEX_SPECIAL_CHARS = set(".^$*+?{}[]\\|()")
 
-def get_newlines(file: IO, tags: Iterable[str]) -> List[str]:
+# bump this whenever the output of the engine changes,
+# results cached by a previous engine are then dropped
+ENGINE_VERSION = "2"
 
-    tags_match_str = '|'.join(tags)
-    inline_rgx = re.compile(
-        rf"^(?!.*({TRIPLE_QUOTE}|{TRIPLE_QUOTE_SINGLE})).*# ({tags_match_str})$")
-    cmt_line_rgx = re.compile(r"\s*#")
-    block_start_rgx = re.compile(rf"\s*# block: ({tags_match_str})")
-    block_end_rgx = re.compile(r"# end$")
-    triple_quote_rgx = re.compile(rf"\s*({TRIPLE_QUOTE}|{TRIPLE_QUOTE_SINGLE})")
-    triple_quote_end_rgx = re.compile(rf"({TRIPLE_QUOTE}|{TRIPLE_QUOTE_SINGLE})$")
+# byte order marks of encodings that are not ASCII compatible,
+# longest first since the UTF-32 LE BOM starts with the UTF-16 LE one
+UNSUPPORTED_BOMS = (codecs.BOM_UTF32_LE, codecs.BOM_UTF32_BE,
+                    codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+
+# PEP 263 coding cookie, only looked for in the first two lines
+CODING_RGX = re.compile(rb"^[ \t\f]*#.*?coding[:=][ \t]*([-\w.]+)")
+
+
+class NewLines(NamedTuple):
+    """New lines of a file, along with the number
+    of lines that were commented out.
+    """
+    lines: List[str]
+    changed: int
+
+
+class NewByteLines(NamedTuple):
+    """Same as NewLines, for the bytes engine: the lines keep
+    their original line terminators.
+    """
+    lines: List[bytes]
+    changed: int
+
+
+class Matcher:
+    """Compiled regexes for a set of tags. Build it once, with
+    get_matcher, and pass it to get_newlines in place of the tags
+    to avoid compiling the regexes for every file.
+    """
+
+    def __init__(self, tags: Iterable[str]):
+        self.tags = normalize_tags(tags)
+        # plain tags can be matched with str methods
+        self.literal = not any(REGEX_SPECIAL_CHARS.intersection(t)
+                               for t in self.tags)
+        tags_match_str = '|'.join(self.tags)
+        self.inline_rgx = re.compile(
+            rf"^(?!.*({TRIPLE_QUOTE}|{TRIPLE_QUOTE_SINGLE})).*# ({tags_match_str})$")
+        self.cmt_line_rgx = re.compile(r"\s*#")
+        self.block_start_rgx = re.compile(rf"\s*# block: ({tags_match_str})")
+        self.block_end_rgx = re.compile(r"# end$")
+        self.triple_quote_rgx = re.compile(
+            rf"\s*({TRIPLE_QUOTE}|{TRIPLE_QUOTE_SINGLE})")
+        self.triple_quote_end_rgx = re.compile(
+            rf"({TRIPLE_QUOTE}|{TRIPLE_QUOTE_SINGLE})$")
+
+    def __repr__(self) -> str:
+        return f"Matcher({list(self.tags)})"
+
+
+TagsOrMatcher = Union[Iterable[str], Matcher]
+
+
+def normalize_tags(tags: Iterable[str]) -> Tuple[str, ...]:
+    """Sorted tuple of unique tags, the order of the tags
+    does not change what the regexes match.
+    """
+    return tuple(sorted(set(tags)))
+
+
+@lru_cache(maxsize=32)
+def _compile_matcher(tags: Tuple[str, ...]) -> Matcher:
+    return Matcher(tags)
+
+
+def get_matcher(tags: TagsOrMatcher) -> Matcher:
+    """Get the matcher for tags, matchers are cached by their
+    normalized set of tags. If tags is already a Matcher, it's
+    returned as is.
+    """
+    if isinstance(tags, Matcher):
+        return tags
+    return _compile_matcher(normalize_tags(tags))
+
+
+def get_newlines(file: IO, tags: TagsOrMatcher) -> List[str]:
+    return get_newlines_changed(file, tags).lines
+
+
+def get_newlines_changed(file: IO, tags: TagsOrMatcher) -> NewLines:
+    """Same as get_newlines, but also returns the number of lines
+    that were commented out. Uses the default engine.
+    """
+    return ENGINES[DEFAULT_ENGINE](file, tags)
+
+
+class _Scan(NamedTuple):
+    lines: List[str]
+    # ascending line indices
+    indices: List[int]
+    # None if the comment lines weren't collected
+    cmt_line_idx: Optional[List[int]]
+    block_pairs: List[Tuple[int, int]]
+    triple_quote_pairs: List[Tuple[int, int]]
+
+
+def get_newlines_regex(file: IO, tags: TagsOrMatcher) -> NewLines:
+    """Reference engine, runs every regex on every line."""
+    return _resolve(_scan_regex(file, get_matcher(tags)))
+
+
+def get_newlines_fast(file: IO, tags: TagsOrMatcher) -> NewLines:
+    """Same output as get_newlines_regex, but lines are first
+    classified with cheap literal checks, and the regexes only
+    run on the few lines that could match them.
+    """
+    return _resolve(_scan_fast(file, get_matcher(tags)))
+
+
+def _scan_regex(file: IO, matcher: Matcher) -> _Scan:
+    inline_rgx = matcher.inline_rgx
+    cmt_line_rgx = matcher.cmt_line_rgx
+    block_start_rgx = matcher.block_start_rgx
+    block_end_rgx = matcher.block_end_rgx
+    triple_quote_rgx = matcher.triple_quote_rgx
+    triple_quote_end_rgx = matcher.triple_quote_end_rgx
 
     cur_block_start_idx = -1
     cur_triple_quote_block_start_idx = -1
-    indices = set()
-    cmt_line_idx = set()
+    indices = []
+    cmt_line_idx = []
     block_pairs = []
     triple_quote_pairs = []
     lines = []
@@ -29,10 +150,10 @@ def get_newlines(file: IO, tags: Iterable[str]) -> List[str]:
     for i, ln in readlines:
         lines.append(ln)
         if cmt_line_rgx.match(ln):
-            cmt_line_idx.add(i)
+            cmt_line_idx.append(i)
 
         if inline_rgx.search(ln):
-            indices.add(i)
+            indices.append(i)
 
         if block_end_rgx.search(ln):
             block_pairs.append((cur_block_start_idx, i))
@@ -52,27 +173,633 @@ def get_newlines(file: IO, tags: Iterable[str]) -> List[str]:
             cur_triple_quote_block_start_idx = i
             continue
 
-    for start, end in block_pairs:
-        if start == -1:
+    return _Scan(lines, indices, cmt_line_idx, block_pairs, triple_quote_pairs)
+
+
+# what a line does to the currently open block & triple quote region
+EV_NONE = 0
+EV_BLOCK_END = 1
+EV_TRIPLE_QUOTE_END = 2
+EV_BLOCK_START = 3
+EV_TRIPLE_QUOTE_START = 4
+
+
+AnyLine = Union[str, bytes]
+
+# first bytes of a bytes.lstrip()-ed line that str.lstrip could still
+# strip once decoded: \x1c-\x1f, and the start of NBSP, U+2000 & co
+_MAYBE_SPACE = frozenset(range(0x1c, 0x20)) | frozenset(range(0x80, 0x100))
+
+
+def _lstrip_bytes(ln: bytes, encoding: str) -> bytes:
+    """Same as str.lstrip on ln decoded, encoded back: bytes.lstrip
+    only strips ASCII whitespace. Lines are only decoded if what is
+    left may start with more whitespace.
+    """
+    stripped = ln.lstrip()
+    if not stripped or stripped[0] not in _MAYBE_SPACE:
+        return stripped
+    try:
+        text = ln.decode(encoding, 'surrogateescape')
+        return text.lstrip().encode(encoding, 'surrogateescape')
+    except UnicodeError:
+        return stripped
+
+
+class _LineClassifier:
+    """Literal checks equivalent to the regexes of a Matcher:
+    `\\s*` is what str.lstrip strips, also for bytes lines, and `$`
+    matches at the end
+    of the line or right before its trailing newline. Only lines
+    with a '#' or a quote in them need to be classified, any other
+    line is neither a comment, nor inline tagged, nor an event.
+    """
+
+    def __init__(self, matcher: Matcher, encoding: Optional[str] = None):
+        """Classifies str lines, or bytes lines if encoding is given,
+        in which case the tags & regexes are encoded with it. Bytes
+        lines keep their original terminator, and are classified as
+        if it was a single \\n like in a file opened in text mode.
+        """
+        self.encoding = encoding
+        if encoding is None:
+            def conv(s):
+                return s
+            self.inline_rgx = matcher.inline_rgx
+            self.block_start_rgx = matcher.block_start_rgx
+        else:
+            def conv(s):
+                return s.encode(encoding)
+            self.inline_rgx = re.compile(conv(matcher.inline_rgx.pattern))
+            self.block_start_rgx = re.compile(
+                conv(matcher.block_start_rgx.pattern))
+
+        self.hash = conv('#')
+        self.newline = conv('\n')
+        self.quote = conv('"')
+        self.quote_single = conv("'")
+        self.triple_quote = conv(TRIPLE_QUOTE)
+        self.triple_quote_single = conv(TRIPLE_QUOTE_SINGLE)
+        self.block_start = conv(BLOCK_START)
+        self.hash_space = conv('# ')
+        # single characters, to test if they are in a line: ints for
+        # bytes lines since `int in bytes` is much faster than a
+        # subsequence test
+        if encoding is None:
+            self.hash_char, self.newline_char = self.hash, self.newline
+            self.quote_char = self.quote
+            self.quote_single_char = self.quote_single
+            self.cr_char = None
+        else:
+            self.hash_char, self.newline_char = self.hash[0], self.newline[0]
+            self.quote_char = self.quote[0]
+            self.quote_single_char = self.quote_single[0]
+            self.cr_char = ord('\r')
+
+        self.literal = matcher.literal
+        self.inline_ends = tuple(conv(f"# {t}") for t in matcher.tags)
+        self.block_start_tags = tuple(conv(t) for t in matcher.tags)
+        self.block_start_len = len(self.block_start)
+        self.block_ends = (conv(BLOCK_END), conv(f"{BLOCK_END}\n"))
+        self.triple_quotes = (self.triple_quote, self.triple_quote_single)
+        self.triple_quote_ends = (
+            self.triple_quote, self.triple_quote_single,
+            conv(f"{TRIPLE_QUOTE}\n"), conv(f"{TRIPLE_QUOTE_SINGLE}\n"))
+        if encoding is not None:
+            self.candidate_needles = _candidate_needles(self)
+
+    def __call__(self, ln: AnyLine, has_hash: bool,
+                 has_quote: bool) -> Tuple[bool, bool, int]:
+        """Returns whether the line is a comment, whether it's inline
+        tagged, and its event, in the same order as _scan_regex checks
+        them.
+        """
+        if self.cr_char is not None and self.cr_char in ln:
+            # \r\n or \r, lines are split on both
+            ln = ln.rstrip(b'\r\n') + b'\n'
+
+        is_cmt = False
+        is_inline = False
+        if self.encoding is None:
+            stripped = ln.lstrip()
+        else:
+            stripped = _lstrip_bytes(ln, self.encoding)
+        if has_hash:
+            is_cmt = stripped.startswith(self.hash)
+
+            if self.literal:
+                newline = self.newline
+                body = ln[:-1] if ln.endswith(newline) else ln
+                is_inline = body.endswith(self.inline_ends) \
+                    and self.newline_char not in body \
+                    and self.triple_quote not in body \
+                    and self.triple_quote_single not in body
+            else:
+                is_inline = self.hash_space in ln \
+                    and bool(self.inline_rgx.search(ln))
+
+            if ln.endswith(self.block_ends):
+                return is_cmt, is_inline, EV_BLOCK_END
+
+        if has_quote and ln.endswith(self.triple_quote_ends):
+            return is_cmt, is_inline, EV_TRIPLE_QUOTE_END
+
+        if has_hash and stripped.startswith(self.block_start):
+            if self.literal:
+                tag = stripped[self.block_start_len:]
+                if tag.startswith(self.block_start_tags):
+                    return is_cmt, is_inline, EV_BLOCK_START
+            elif self.block_start_rgx.match(stripped):
+                return is_cmt, is_inline, EV_BLOCK_START
+
+        if has_quote and stripped.startswith(self.triple_quotes):
+            return is_cmt, is_inline, EV_TRIPLE_QUOTE_START
+
+        return is_cmt, is_inline, EV_NONE
+
+
+def _scan_fast(file: IO, matcher: Matcher) -> _Scan:
+    return _scan_classified(list(file), _LineClassifier(matcher))
+
+
+def _scan_classified(lines: List[AnyLine],
+                     classify: _LineClassifier,
+                     candidates: Optional[Iterable[int]] = None) -> _Scan:
+    """Scan with classify, but only the candidates lines, the indices
+    of every line with a '#' or a quote in it, in ascending order.
+    """
+    hash_ = classify.hash_char
+    quote = classify.quote_char
+    quote_single = classify.quote_single_char
+
+    cur_block_start_idx = -1
+    cur_triple_quote_block_start_idx = -1
+    indices = []
+    cmt_line_idx = []
+    block_pairs = []
+    triple_quote_pairs = []
+
+    if candidates is None:
+        # most lines have neither a comment nor a quote
+        candidates = (i for i, ln in enumerate(lines)
+                      if hash_ in ln or quote in ln or quote_single in ln)
+
+    for i in candidates:
+        ln = lines[i]
+        has_hash = hash_ in ln
+        has_quote = quote in ln or quote_single in ln
+
+        is_cmt, is_inline, event = classify(ln, has_hash, has_quote)
+        if is_cmt:
+            cmt_line_idx.append(i)
+        if is_inline:
+            indices.append(i)
+
+        if event == EV_BLOCK_END:
+            block_pairs.append((cur_block_start_idx, i))
+            cur_block_start_idx = -1
+        elif event == EV_TRIPLE_QUOTE_END:
+            triple_quote_pairs.append((cur_triple_quote_block_start_idx, i))
+            cur_triple_quote_block_start_idx = -1
+        elif event == EV_BLOCK_START:
+            cur_block_start_idx = i
+        elif event == EV_TRIPLE_QUOTE_START:
+            cur_triple_quote_block_start_idx = i
+
+    return _Scan(lines, indices, cmt_line_idx, block_pairs, triple_quote_pairs)
+
+
+def iter_newlines_changed(file: IO,
+                          tags: TagsOrMatcher) -> Iterator[Tuple[str, bool]]:
+    """Streaming engine, same output as get_newlines_fast, but each
+    line is yielded, along with whether it was commented out, as soon
+    as its fate is known. Only the lines from the start of a still open
+    block or triple quote region are buffered, so memory use doesn't
+    grow with the size of the file.
+    """
+    classify = _LineClassifier(get_matcher(tags))
+
+    cur_block_start_idx = -1
+    cur_triple_quote_block_start_idx = -1
+    # the buffer holds the lines from base on, indices are absolute
+    buf = []
+    base = 0
+    indices = []
+    cmt_line_idx = []
+    block_pairs = []
+    triple_quote_pairs = []
+
+    def flush() -> Iterator[Tuple[str, bool]]:
+        scan = _Scan(
+            list(buf),
+            [i - base for i in indices],
+            [i - base for i in cmt_line_idx],
+            [(s - base if s != -1 else -1, e - base) for s, e in block_pairs],
+            [(s - base if s != -1 else -1, e - base)
+             for s, e in triple_quote_pairs])
+        newlines = _resolve(scan).lines
+        for old, new in zip(buf, newlines):
+            yield new, new is not old
+
+    for i, ln in enumerate(file):
+        has_hash = '#' in ln
+        has_quote = '"' in ln or "'" in ln
+        if has_hash or has_quote:
+            is_cmt, is_inline, event = classify(ln, has_hash, has_quote)
+        else:
+            is_cmt, is_inline, event = False, False, EV_NONE
+
+        if not buf and event not in (EV_BLOCK_START, EV_TRIPLE_QUOTE_START):
+            # nothing is open, so the line can't be in a block or a
+            # triple quote region, see _resolve
+            if is_inline and not is_cmt and ln != '\n':
+                yield _comment_out(ln), True
+            else:
+                yield ln, False
             continue
-        _range = range(start + 1, end)
-        indices |= {j for j in _range}
 
-    for start, end in triple_quote_pairs:
-        if start == -1:
+        if not buf:
+            base = i
+        buf.append(ln)
+        if is_cmt:
+            cmt_line_idx.append(i)
+        if is_inline:
+            indices.append(i)
+
+        if event == EV_BLOCK_END:
+            block_pairs.append((cur_block_start_idx, i))
+            cur_block_start_idx = -1
+        elif event == EV_TRIPLE_QUOTE_END:
+            triple_quote_pairs.append((cur_triple_quote_block_start_idx, i))
+            cur_triple_quote_block_start_idx = -1
+        elif event == EV_BLOCK_START:
+            cur_block_start_idx = i
+        elif event == EV_TRIPLE_QUOTE_START:
+            cur_triple_quote_block_start_idx = i
+
+        if cur_block_start_idx == -1 and cur_triple_quote_block_start_idx == -1:
+            yield from flush()
+            buf.clear()
+            indices.clear()
+            cmt_line_idx.clear()
+            block_pairs.clear()
+            triple_quote_pairs.clear()
+
+    # regions still open at the end of the file are ignored
+    if buf:
+        yield from flush()
+
+
+def iter_newlines(file: IO, tags: TagsOrMatcher) -> Iterator[str]:
+    for ln, _ in iter_newlines_changed(file, tags):
+        yield ln
+
+
+def _comment_out(line: str) -> str:
+    for j, c in enumerate(line):
+        if c != ' ':
+            break
+    return f"{line[:j]}# {line[j:]}"
+
+
+_Interval = Tuple[int, int]
+
+
+def _merge_intervals(intervals: List[_Interval]) -> List[_Interval]:
+    """Sort & merge half open intervals, dropping empty ones."""
+    merged = []
+    for start, end in sorted(intervals):
+        if start >= end:
             continue
-        _range = range(start, end + 1)
-        indices -= {j for j in _range}
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
 
-    indices -= cmt_line_idx
+def _subtract_intervals(intervals: List[_Interval],
+                        holes: List[_Interval]) -> List[_Interval]:
+    """Subtract holes from intervals, both sorted & merged."""
+    res = []
+    j = 0
+    for start, end in intervals:
+        while j < len(holes) and holes[j][1] <= start:
+            j += 1
+        k = j
+        while k < len(holes) and holes[k][0] < end:
+            hole_start, hole_end = holes[k]
+            if hole_start > start:
+                res.append((start, hole_start))
+            start = max(start, hole_end)
+            k += 1
+        if start < end:
+            res.append((start, end))
+    return res
 
+
+def _marked_runs(scan: _Scan) -> Iterator[_Interval]:
+    """Runs of consecutive lines to comment out, including the blank
+    lines in them, as half open intervals in ascending order.
+    """
+    _, indices, cmt_line_idx, block_pairs, triple_quote_pairs = scan
+
+    # the inside of closed blocks, minus closed triple quote regions
+    blocks = _merge_intervals(
+        [(start + 1, end) for start, end in block_pairs if start != -1])
+    triple_quotes = _merge_intervals(
+        [(start, end + 1) for start, end in triple_quote_pairs if start != -1])
+
+    # one byte per line, 1 if the line should be commented out
+    marks = bytearray(len(scan.lines))
+    for start, end in _subtract_intervals(blocks, triple_quotes):
+        marks[start:end] = b'\x01' * (end - start)
+
+    # inline tags, unless in a triple quote region
+    tq_starts = [start for start, _ in triple_quotes]
     for i in indices:
-        line = lines[i]
-        if line == '\n':
-            continue
-        for j, c in enumerate(line):
-            if c != ' ':
+        k = bisect_right(tq_starts, i) - 1
+        if k < 0 or i >= triple_quotes[k][1]:
+            marks[i] = 1
+
+    if cmt_line_idx is not None:
+        for i in cmt_line_idx:
+            marks[i] = 0
+
+    start = marks.find(1)
+    while start != -1:
+        end = marks.find(0, start)
+        if end == -1:
+            end = len(marks)
+        yield start, end
+        start = marks.find(1, end)
+
+
+def _resolve(scan: _Scan) -> NewLines:
+    lines = scan.lines
+    # comment out each run of marked lines as a whole
+    changed = 0
+    for start, end in _marked_runs(scan):
+        run = lines[start:end]
+        lines[start:end] = [
+            ln if ln == '\n' else _comment_out(ln) for ln in run]
+        changed += len(run) - run.count('\n')
+
+    return NewLines(lines, changed)
+
+
+def get_newlines_stream(file: IO, tags: TagsOrMatcher) -> NewLines:
+    """Streaming engine collected into a list, mostly useful
+    to compare it with the other engines. Use iter_newlines
+    to actually stream.
+    """
+    lines = []
+    changed = 0
+    for ln, ln_changed in iter_newlines_changed(file, tags):
+        lines.append(ln)
+        changed += ln_changed
+    return NewLines(lines, changed)
+
+
+def _candidate_needles(classify: _LineClassifier) -> List[bytes]:
+    """Only the lines with one of these in them can be tagged, or open
+    or close a region: a triple quote, "# end", "# block: " or
+    "# <tag>", or just "# " if the tags are regexes.
+    """
+    needles = [classify.triple_quote, classify.triple_quote_single]
+    if classify.literal:
+        needles += [classify.hash_space + t for t in classify.block_start_tags]
+        needles += [classify.block_ends[0], classify.block_start]
+    else:
+        needles.append(classify.hash_space)
+    return needles
+
+
+def _scan_bytes(data: bytes, classify: _LineClassifier) -> _Scan:
+    """_scan_classified on the lines of data, but the candidate lines
+    are found by searching the whole of data at once, and most
+    comment lines aren't even looked at: cmt_line_idx is None, the
+    lines to comment out have to be checked instead.
+    """
+    lines = data.splitlines(True)
+    if b'\r' in data and data.count(b'\r') != data.count(b'\r\n'):
+        # lone \r terminators, lines can't be counted with \n
+        return _scan_classified(lines, classify)
+
+    def candidates() -> Iterator[int]:
+        # bytes.find is a lot faster than a regex with alternatives
+        find = data.find
+        offsets = []
+        for needle in classify.candidate_needles:
+            pos = find(needle)
+            while pos != -1:
+                offsets.append(pos)
+                pos = find(needle, pos + 1)
+        offsets.sort()
+
+        count = data.count
+        i = 0
+        prev_i = -1
+        prev_pos = 0
+        for pos in offsets:
+            i += count(b'\n', prev_pos, pos)
+            prev_pos = pos
+            if i != prev_i:
+                yield i
+                prev_i = i
+
+    scan = _scan_classified(lines, classify, candidates())
+    return scan._replace(cmt_line_idx=None)
+
+
+@lru_cache(maxsize=32)
+def _bytes_classifier(matcher: Matcher, encoding: str) -> _LineClassifier:
+    return _LineClassifier(matcher, encoding)
+
+
+def _comment_out_bytes(line: bytes) -> bytes:
+    j = len(line) - len(line.lstrip(b' '))
+    return line[:j] + b'# ' + line[j:]
+
+
+def comment_out(line: AnyLine) -> AnyLine:
+    """Comment out a str or bytes line, the way the engines do"""
+    if isinstance(line, bytes):
+        return _comment_out_bytes(line)
+    return _comment_out(line)
+
+
+def uncomment(line: AnyLine) -> AnyLine:
+    """Inverse of comment_out, line must have been commented out"""
+    space = b' ' if isinstance(line, bytes) else ' '
+    j = len(line) - len(line.lstrip(space))
+    return line[:j] + line[j + 2:]
+
+
+@lru_cache(maxsize=None)
+def _ascii_compatible(encoding: str) -> bool:
+    """Whether every ASCII character encodes to its own single byte,
+    so that the bytes engine can look for them in the raw bytes.
+    """
+    ascii_ = bytes(range(128))
+    try:
+        return ascii_.decode('ascii').encode(encoding) == ascii_
+    except (LookupError, UnicodeError):
+        return False
+
+
+def detect_encoding(data: bytes, default: str,
+                    tags: Iterable[str] = ()) -> Tuple[Optional[str], bytes]:
+    """Encoding of data for the bytes engine, and its BOM if it has
+    one. The encoding is None if it's not ASCII compatible, e.g.
+    UTF-16. The PEP 263 coding cookie is only looked for if some tag
+    isn't plain ASCII, since ASCII tags are the same bytes in any
+    ASCII compatible encoding.
+    """
+    if data.startswith(UNSUPPORTED_BOMS):
+        return None, b''
+    if data.startswith(codecs.BOM_UTF8):
+        return 'utf-8', codecs.BOM_UTF8
+
+    encoding = default
+    if any(not all(ord(c) < 128 for c in t) for t in tags):
+        for ln in data.split(b'\n', 2)[:2]:
+            match = CODING_RGX.match(ln)
+            if match:
+                encoding = match.group(1).decode('ascii')
                 break
-        lines[i] = f"{line[:j]}# {line[j:]}"
 
-    return lines
+    return (encoding if _ascii_compatible(encoding) else None), b''
+
+
+class Edit(NamedTuple):
+    """Replacement of a single line of the bytes engine: the line
+    at index, which starts at offset in the original bytes and is
+    length bytes long, is replaced by line.
+    """
+    index: int
+    offset: int
+    length: int
+    line: bytes
+
+
+class _BytesEdits(NamedTuple):
+    lines: List[bytes]
+    bom: bytes
+    edits: List[Edit]
+
+
+# blank lines are never commented out
+_BLANK_BYTES = (b'\n', b'\r\n', b'\r')
+
+
+def _get_bytes_edits(data: bytes,
+                     tags: TagsOrMatcher,
+                     encoding: Optional[str]) -> Optional[_BytesEdits]:
+    matcher = get_matcher(tags)
+    if encoding is None:
+        encoding = locale.getpreferredencoding(False)
+    encoding, bom = detect_encoding(data, encoding, matcher.tags)
+    if encoding is None:
+        return None
+    try:
+        classify = _bytes_classifier(matcher, encoding)
+    except UnicodeError:
+        return None
+
+    scan = _scan_bytes(data[len(bom):], classify)
+    lines = scan.lines
+    edits = []
+    offset = len(bom)
+    prev = 0
+    for start, end in _marked_runs(scan):
+        for i in range(start, end):
+            ln = lines[i]
+            # comment lines weren't all scanned, skip them here
+            if ln in _BLANK_BYTES \
+                    or _lstrip_bytes(ln, encoding).startswith(b'#'):
+                continue
+            offset += sum(map(len, lines[prev:i]))
+            prev = i
+            edits.append(Edit(i, offset, len(ln), _comment_out_bytes(ln)))
+
+    return _BytesEdits(lines, bom, edits)
+
+
+def get_edits_bytes(data: bytes,
+                    tags: TagsOrMatcher,
+                    encoding: Optional[str] = None) -> Optional[List[Edit]]:
+    """Same as get_newlines_bytes, but only returns the lines that
+    changed, as edits in ascending order. See apply_edits and
+    iter_edited to get the new bytes.
+
+    Returns:
+        Optional[List[Edit]]: edits, or None if the encoding of data
+            isn't ASCII compatible
+    """
+    res = _get_bytes_edits(data, tags, encoding)
+    return None if res is None else res.edits
+
+
+def iter_edited(data: bytes, edits: List[Edit]) -> Iterator[bytes]:
+    """Pieces of data with edits applied, from the offset of the first
+    edit on: data up to edits[0].offset is unchanged. Pieces of data
+    itself are memoryviews of it, not copies.
+    """
+    if not edits:
+        return
+    view = memoryview(data)
+    pos = edits[0].offset
+    for edit in edits:
+        if edit.offset > pos:
+            yield view[pos:edit.offset]
+        yield edit.line
+        pos = edit.offset + edit.length
+    if pos < len(data):
+        yield view[pos:]
+
+
+def apply_edits(data: bytes, edits: List[Edit]) -> bytes:
+    if not edits:
+        return data
+    return data[:edits[0].offset] + b''.join(iter_edited(data, edits))
+
+
+def get_newlines_bytes(data: bytes,
+                       tags: TagsOrMatcher,
+                       encoding: Optional[str] = None) -> Optional[NewByteLines]:
+    """Bytes engine, same output as get_newlines_fast, but works on
+    the raw bytes of a file without decoding it. Lines keep their
+    original terminator (\\n, \\r\\n or \\r), joining them gives
+    back data with only the commented out lines changed.
+
+    Args:
+        data (bytes): content of the file
+        tags (TagsOrMatcher): tags, or a matcher
+        encoding (Optional[str]): encoding used for files without a
+            BOM, defaults to the locale encoding like files opened
+            in text mode
+
+    Returns:
+        Optional[NewByteLines]: new lines, or None if the encoding of
+            data isn't ASCII compatible, or the tags can't be encoded
+            with it. Such files have to go through a text engine.
+    """
+    res = _get_bytes_edits(data, tags, encoding)
+    if res is None:
+        return None
+    lines, bom, edits = res
+    for edit in edits:
+        lines[edit.index] = edit.line
+    if bom and lines:
+        lines[0] = bom + lines[0]
+    return NewByteLines(lines, len(edits))
+
+
+ENGINES = {
+    "regex": get_newlines_regex,
+    "fast": get_newlines_fast,
+    "stream": get_newlines_stream,
+}
+DEFAULT_ENGINE = "fast"
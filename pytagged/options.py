@@ -17,7 +17,29 @@ class Options(NamedTuple):
     # modes
     mode: Mode = Mode.DEFAULT       # mode is either default or something, never None
     benchmark_runs: Optional[int] = None
+    benchmark_warmup: Optional[int] = None
+    benchmark_format: Optional[str] = None
+    benchmark_output: Optional[str] = None
+    benchmark_kind: Optional[str] = None
+    benchmark_engine: Optional[str] = None
+    save_baseline: Optional[str] = None
+    compare_to: Optional[str] = None
+    max_slowdown: Optional[float] = None
     verbosity: Optional[int] = None
+    jobs: Optional[int] = None
+    max_inflight_files: Optional[int] = None
+    max_inflight_bytes: Optional[int] = None
+    no_cache: Optional[bool] = None
+    cache_dir: Optional[str] = None
+    stream_threshold: Optional[int] = None
+    atomic: Optional[bool] = None
+    durability: Optional[str] = None
+    journal: Optional[str] = None
+    restore: Optional[str] = None
+    watch: Optional[bool] = None
+    changed_since: Optional[str] = None
+    staged: Optional[bool] = None
+    respect_gitignore: Optional[bool] = None
 
     def update_if_not_none(self, other: "Options") -> "Options":
         """Returns a new Options instance with values from others.
@@ -34,7 +56,7 @@ class Options(NamedTuple):
         merged = self._asdict()
         other_dict = other._asdict()
         for k, v in other_dict.items():
-            if k in merged and v is not None and v:
+            if k in merged and v is not None:
                 merged[k] = v
 
         return Options(**merged)
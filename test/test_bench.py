@@ -0,0 +1,203 @@
+import io
+import json
+import os
+import random
+from pathlib import Path
+
+import pytest
+
+from pytagged import _bench, _bench_defaults, _files_utils, nline
+
+
+@pytest.mark.parametrize("p, expected", [
+    (0, 1), (50, 3), (90, 4.6), (99, 4.96), (100, 5),
+])
+def test_percentile(p, expected):
+    assert _bench.percentile([1, 2, 3, 4, 5], p) == pytest.approx(expected)
+
+
+def test_percentile_edges():
+    assert _bench.percentile([], 50) == 0.0
+    assert _bench.percentile([7], 99) == 7
+
+
+def test_summarize():
+    stats = _bench.summarize([30, 10, 20])
+    assert stats["mean"] == 20
+    assert stats["stdev"] == pytest.approx(10)
+    assert (stats["min"], stats["p50"], stats["max"]) == (10, 20, 30)
+    assert list(stats) == ["mean", "stdev", "min", "p50", "p90", "p99", "max"]
+    assert _bench.summarize([5])["stdev"] == 0.0
+
+
+def test_make_report():
+    samples = {"open": [100, 300], "gen_newlines": [1000, 3000]}
+    report = _bench.make_report("io", samples, warmup=2, num_files=2,
+                                num_lines=10, num_bytes=2 * 10**6,
+                                misc={"Files written per run": 1})
+    assert report["runs"] == 2 and report["warmup"] == 2
+    assert report["samples"]["total"] == [1100, 3300]
+    assert list(report["phases"]) == ["open", "gen_newlines", "total"]
+    total = report["phases"]["total"]
+    assert total["mean"] == 2200
+    assert total["per_file"] == 1100
+    assert total["per_line"] == 220
+    # median run of 2200ns
+    assert report["throughput"]["lines_per_sec"] == pytest.approx(10 / 2.2e-6)
+    assert report["throughput"]["mb_per_sec"] == pytest.approx(2 / 2.2e-6)
+
+    out = io.StringIO()
+    _bench.write_json(report, out)
+    assert json.loads(out.getvalue()) == report
+
+
+def test_perf_counter_ns():
+    a = _bench.perf_counter_ns()
+    b = _bench.perf_counter_ns()
+    assert isinstance(a, int) and b >= a
+
+
+@pytest.mark.parametrize("engine", _bench_defaults.engine_names())
+def test_time_engine(tmp_path, engine):
+    paths = []
+    for name, src in (("a.py", "x = 1  # debug\n"), ("b.py", "y = 2\n")):
+        (tmp_path / name).write_text(src)
+        paths.append(str(tmp_path / name))
+    sources = _bench.load_sources(paths, engine)
+    assert isinstance(sources[0], bytes) == (engine in _bench.BYTES_ENGINES)
+
+    ticks = iter([10, 25])
+    elapsed, changed = _bench.time_engine(
+        sources, engine, nline.get_matcher(["debug"]), timer=lambda: next(ticks))
+    assert (elapsed, changed) == (15, 1)
+
+
+def make_tree(root):
+    for name, src in (("a.py", "x = 1  # debug\n"), ("pkg/b.py", "y = 2\n"),
+                      ("pkg/c.py", "z = 3  # debug\n"), ("pkg/notes.txt", ""),
+                      (".git/HEAD", ""), ("env/d.py", "w = 4  # debug\n")):
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).write_text(src)
+
+
+def test_scratch(tmp_path):
+    make_tree(tmp_path)
+    files = [str(tmp_path / "a.py"), str(tmp_path / "pkg" / "c.py")]
+    is_pruned = _files_utils.PathMatcher([".git", "env"])
+    with _bench.Scratch(str(tmp_path), ".py", is_pruned) as scratch:
+        scratch.create(files)
+        copy = Path(scratch.path)
+        assert sorted(str(p.relative_to(copy)) for p in copy.rglob("*")) == [
+            ".git", "a.py", "env", "pkg", "pkg/b.py", "pkg/c.py",
+            "pkg/notes.txt"]
+        # only the files that are never written may be hardlinked
+        assert (copy / "pkg" / "notes.txt").stat().st_nlink \
+            == (tmp_path / "pkg" / "notes.txt").stat().st_nlink
+        assert (copy / "a.py").stat().st_ino != (tmp_path / "a.py").stat().st_ino
+        assert sum(scratch.counts.values()) == 4
+
+        (copy / "a.py").write_text("changed\n")
+        assert (tmp_path / "a.py").read_text() == "x = 1  # debug\n"
+        scratch.reset([str(copy / "a.py")])
+        assert (copy / "a.py").read_text() == "x = 1  # debug\n"
+    assert not Path(scratch.dir).exists()
+
+
+@pytest.mark.parametrize("durability", [None, "none"])
+def test_time_e2e(tmp_path, durability):
+    make_tree(tmp_path)
+    is_excluded = _files_utils.PathMatcher([".git", "env"])
+    res = _bench.time_e2e(str(tmp_path), is_excluded, ".py", False, ["debug"],
+                          durability=durability)
+    assert list(res.times) == list(_bench.E2E_PHASES)
+    assert all(t >= 0 for t in res.times.values())
+    assert res.files == 3
+    assert sorted(res.written) == [str(tmp_path / "a.py"),
+                                   str(tmp_path / "pkg" / "c.py")]
+    assert (res.prefiltered, res.fallback) == (1, 0)
+    assert (tmp_path / "a.py").read_text() == "# x = 1  # debug\n"
+    assert (tmp_path / "env" / "d.py").read_text() == "w = 4  # debug\n"
+
+    # streamed files go through proc_file, c.py is already commented out
+    (tmp_path / "a.py").write_text("x = 1  # debug\n")
+    res = _bench.time_e2e(str(tmp_path), is_excluded, ".py", False, ["debug"],
+                          stream_threshold=0, durability=durability)
+    assert res.fallback == 2 and res.written == [str(tmp_path / "a.py")]
+
+
+def test_baseline_path():
+    assert _bench.baseline_path("v1", "cache") == os.path.join(
+        "cache", _bench.BASELINE_DIR, "v1.json")
+    assert _bench.baseline_path("v1.json", "cache") == "v1.json"
+    assert _bench.baseline_path(os.path.join("a", "v1"), "cache") \
+        == os.path.join("a", "v1")
+
+
+def test_save_load_baseline(tmp_path):
+    report = _bench.make_report("io", {"open": [1, 2]}, 0, 1, 1, 1)
+    path = str(tmp_path / "baselines" / "v1.json")
+    _bench.save_baseline(report, path)
+    assert _bench.load_baseline(path) == report
+
+    with pytest.raises(_bench.BaselineError):
+        _bench.load_baseline(str(tmp_path / "missing.json"))
+    (tmp_path / "bad.json").write_text("{")
+    with pytest.raises(_bench.BaselineError):
+        _bench.load_baseline(str(tmp_path / "bad.json"))
+    (tmp_path / "old.json").write_text(json.dumps(
+        dict(report, report_version=0)))
+    with pytest.raises(_bench.BaselineError):
+        _bench.load_baseline(str(tmp_path / "old.json"))
+
+
+def test_bootstrap_delta():
+    rng = random.Random(0)
+    base = [100, 101, 102, 103, 104] * 4
+    delta, low, high = _bench.bootstrap_delta(base, [2 * s for s in base], rng)
+    assert delta == pytest.approx(1.0)
+    assert 0.9 < low <= delta <= high < 1.1
+
+    delta, low, high = _bench.bootstrap_delta(base, base, rng)
+    assert delta == 0 and low <= 0 <= high
+    assert _bench.bootstrap_delta([10], [15], rng) == (0.5, 0.5, 0.5)
+
+
+def test_compare():
+    base = list(range(100, 120))
+    baseline = _bench.make_report("io", {"open": base, "write": base},
+                                  0, 2, 10, 100)
+    slower = [int(s * 1.2) for s in base]
+    report = _bench.make_report("io", {"open": slower, "write": base},
+                                0, 2, 10, 100)
+    comparison = _bench.compare(baseline, report, max_slowdown=5)
+    assert list(comparison["phases"]) == ["open", "write", "total"]
+    assert comparison["phases"]["open"]["slower"]
+    assert not comparison["phases"]["write"]["slower"]
+    assert comparison["regressed"]
+    assert comparison["warnings"] == []
+    assert _bench.compare(baseline, report, max_slowdown=5) == comparison
+
+    assert not _bench.compare(baseline, report, max_slowdown=20)["regressed"]
+    assert not _bench.compare(baseline, baseline)["regressed"]
+
+    other = _bench.make_report("io", {"open": base}, 0, 3, 10, 100)
+    assert _bench.compare(baseline, other)["warnings"] == [
+        "files differ, 2 in the baseline, 3 now"]
+    with pytest.raises(_bench.BaselineError):
+        _bench.compare(baseline, dict(report, kind="memory"))
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc")
+def test_time_e2e_closes_on_error(tmp_path, monkeypatch):
+    make_tree(tmp_path)
+
+    def fail(data, matcher):
+        raise RuntimeError("engine failed")
+
+    monkeypatch.setattr(nline, "get_edits_bytes", fail)
+    before = len(os.listdir("/proc/self/fd"))
+    with pytest.raises(RuntimeError) as excinfo:
+        _bench.time_e2e(str(tmp_path), lambda p: False, ".py", False, ["debug"])
+    # the traceback keeps the frame of time_e2e, and its locals, alive
+    assert excinfo.traceback
+    assert len(os.listdir("/proc/self/fd")) == before
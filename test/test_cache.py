@@ -0,0 +1,109 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from conftest import (
+    path_to_src_file_singles,
+    path_to_target_file_singles,
+)
+from pytagged import _cache, _proc, nline
+
+
+@pytest.fixture
+def hello_copy(tmp_path) -> str:
+    dst = tmp_path / "hello.py"
+    shutil.copyfile(path_to_src_file_singles("hello.py"), str(dst))
+    return str(dst)
+
+
+def read(path: str) -> str:
+    with open(path) as f:
+        return f.read()
+
+
+def test_normalize_tags():
+    assert _cache.normalize_tags(["slow", " debug", "slow"]) == "debug,slow"
+
+
+def test_cache_lookup_and_record(tmp_path, hello_copy):
+    cache_dir = str(tmp_path / "cache")
+    cache = _cache.Cache(cache_dir, ["debug"]).load()
+    assert not cache.lookup(hello_copy)
+
+    cache.record(hello_copy)
+    cache.save()
+    assert os.path.exists(os.path.join(cache_dir, _cache.INDEX_NAME))
+
+    cache = _cache.Cache(cache_dir, ["debug"]).load()
+    assert cache.lookup(hello_copy)
+    assert (cache.hits, cache.misses) == (1, 0)
+
+    # other tags, other entries
+    assert not _cache.Cache(cache_dir, ["skip"]).load().lookup(hello_copy)
+
+    # same content with a new mtime is still a hit
+    content = read(hello_copy)
+    with open(hello_copy, 'w') as f:
+        f.write(content)
+    assert cache.lookup(hello_copy)
+
+    # new content is a miss
+    with open(hello_copy, 'a') as f:
+        f.write("print('debug')  # debug\n")
+    assert not cache.lookup(hello_copy)
+
+
+def test_cache_record_processed_digest(tmp_path):
+    path = tmp_path / "a.py"
+    path.write_bytes(b"x = 1  # debug\n")
+    res = _proc.proc_file(str(path), nline.get_matcher(["debug"]),
+                          write=True, keep_lines=False, digest=True)
+    # changed between the run and the time it is recorded, same size
+    path.write_bytes(b"xy = 12  # debug\n")
+
+    cache = _cache.Cache(str(tmp_path / "cache"), ["debug"])
+    cache.record(str(path), res.digest)
+    assert not cache.lookup(str(path))
+
+
+def test_cache_save_gitignore(tmp_path, hello_copy):
+    # created by something else first, like the journal
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    cache = _cache.Cache(str(cache_dir), ["debug"])
+    cache.record(hello_copy)
+    cache.save()
+    assert (cache_dir / ".gitignore").read_text() == _cache.README + "*\n"
+
+
+def test_cache_invalidated_on_engine_change(tmp_path, hello_copy):
+    cache_dir = str(tmp_path / "cache")
+    cache = _cache.Cache(cache_dir, ["debug"]).load()
+    cache.record(hello_copy)
+    cache.save()
+
+    cache = _cache.Cache(cache_dir, ["debug"], engine="other").load()
+    assert not cache.lookup(hello_copy)
+
+
+def test_cli_cache_hits(tmp_path, hello_copy):
+    cache_dir = str(tmp_path / "cache")
+    cmd = ["pytag", hello_copy, "-t", "debug", "-v", "1",
+           "--cache-dir", cache_dir]
+
+    first = subprocess.run(cmd, check=True, stdout=subprocess.PIPE)
+    assert "Cache hits: 0, misses: 1" in first.stdout.decode()
+    with open(path_to_target_file_singles("expected_hello.py")) as f:
+        expected = f.read()
+    assert read(hello_copy) == expected
+
+    mtime = os.stat(hello_copy).st_mtime_ns
+    second = subprocess.run(cmd, check=True, stdout=subprocess.PIPE)
+    assert "Cache hits: 1, misses: 0" in second.stdout.decode()
+    assert os.stat(hello_copy).st_mtime_ns == mtime
+
+    no_cache = subprocess.run([*cmd, "--no-cache"], check=True,
+                              stdout=subprocess.PIPE)
+    assert "Cache hits" not in no_cache.stdout.decode()
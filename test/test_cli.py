@@ -1,7 +1,11 @@
 import configparser
+import json
 import os
+import shutil
+import signal
 from pathlib import Path
 import subprocess
+import time
 from typing import (
     Sequence, Mapping,
     Iterator, Tuple
@@ -15,9 +19,13 @@ from conftest import (
     write_file_from_dict,
     TEST_FILES_PATH
 )
+from pytagged.app import App
+from pytagged._cache import Cache
 from pytagged._utils import print_raw_lines, pretty_print_title
 from pytagged._files_utils import filepaths_from_path
 from pytagged._mode import Mode
+from pytagged._parallel import resolve_jobs
+from pytagged._watch import DEBOUNCE
 
 
 TAG_FLAGS = ["-t", "--tags"]
@@ -27,6 +35,7 @@ BENCHMARK_FLAGS = ["-b", "--benchmark"]
 CONFIG_FLAGS = ["-cf", "--config"]
 EXCLUDE_FLAGS = ["-x", "--exclude"]
 EXTEND_FLAGS = ["-xt", "--extend-exclude"]
+JOBS_FLAGS = ["-j", "--jobs"]
 
 
 @pytest.fixture(params=TAG_FLAGS)
@@ -64,6 +73,11 @@ def flag_extend(request):
     return request.param
 
 
+@pytest.fixture(params=JOBS_FLAGS)
+def flag_jobs(request):
+    return request.param
+
+
 @pytest.fixture
 def generate_options_exclude(
         src_to_target_params_multiples) -> Iterator[Tuple[str, ...]]:
@@ -253,6 +267,529 @@ def test_cli_multiples_verbose(cleanup_test_path_multiples,
         assert actual == expected
 
 
+def assert_multiples_match(src_path: str, target_path: str):
+    """Each file of src_path has the content of its expected_ file
+    in target_path, as read in text mode
+    """
+    expected_contents = {}
+    for f in Path(target_path).glob(r"**/*.py"):
+        with f.open() as fin:
+            expected_contents[f.parts[-1]] = fin.readlines()
+
+    for f in Path(src_path).glob(r"**/*.py"):
+        with f.open() as fin:
+            actual = fin.readlines()
+        assert actual == expected_contents[f"expected_{f.parts[-1]}"]
+
+
+@pytest.mark.parametrize("jobs", ["0", "2"])
+def test_cli_multiples_jobs(cleanup_test_path_multiples,
+                            src_to_target_params_multiples,
+                            flag_tag,
+                            flag_jobs,
+                            jobs):
+    # same as test_cli_multiples but with a process pool
+    src_path, target_path = src_to_target_params_multiples[:2]
+    tags = src_to_target_params_multiples[2:]
+    cmd = ["pytag", src_path, flag_tag, *tags, flag_jobs, jobs]
+
+    print(cmd)
+    subprocess.run(cmd, check=True)
+    assert_multiples_match(src_path, target_path)
+
+
+@pytest.mark.parametrize(
+    "caps",
+    [
+        ["--max-inflight-files", "1"],
+        ["--max-inflight-bytes", "1"],
+        ["--max-inflight-files", "2", "--max-inflight-bytes", "4096"],
+    ]
+)
+def test_cli_multiples_jobs_bounded(cleanup_test_path_multiples,
+                                    src_to_target_params_multiples,
+                                    caps):
+    src_path, target_path = src_to_target_params_multiples[:2]
+    tags = src_to_target_params_multiples[2:]
+    cmd = ["pytag", src_path, "-t", *tags, "-j", "2", *caps]
+    subprocess.run(cmd, check=True)
+    assert_multiples_match(src_path, target_path)
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_cli_multiples_stream(cleanup_test_path_multiples,
+                              src_to_target_params_multiples,
+                              jobs):
+    # stream every file, should be the same as test_cli_multiples
+    src_path, target_path = src_to_target_params_multiples[:2]
+    tags = src_to_target_params_multiples[2:]
+    cmd = ["pytag", src_path, "-t", *tags, "-j", jobs,
+           "--stream-threshold", "0", "--no-cache"]
+    subprocess.run(cmd, check=True)
+    assert_multiples_match(src_path, target_path)
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+@pytest.mark.parametrize("atomic", [["--atomic"], ["--durability", "dir"],
+                                    ["--durability", "file"]])
+def test_cli_multiples_atomic(cleanup_test_path_multiples,
+                              src_to_target_params_multiples,
+                              jobs, atomic):
+    src_path, target_path = src_to_target_params_multiples[:2]
+    tags = src_to_target_params_multiples[2:]
+    cmd = ["pytag", src_path, "-t", *tags, "-j", jobs, "--no-cache", *atomic]
+    subprocess.run(cmd, check=True)
+    assert_multiples_match(src_path, target_path)
+    assert not list(Path(src_path).glob(r"**/*.pytagged-tmp"))
+
+
+def test_cli_bad_durability_in_config(tmp_path):
+    config = tmp_path / "pytagged.ini"
+    config.write_text(f"[pytagged]\npath = {path_to_multiples()}\n"
+                      "tags = debug\nmode = printonly\ndurability = always\n")
+    completed = subprocess.run(["pytag", "-cf", str(config)])
+    assert completed.returncode == 1
+
+
+def test_cli_jobs_overrides_config(tmp_path):
+    """-j 0 is falsy, but should still win over the jobs of the
+    config, and run with one worker per cpu
+    """
+    path = tmp_path / "a.py"
+    path.write_bytes(b"x = 1  # debug\n")
+    config = tmp_path / "pytagged.ini"
+    config.write_text("[pytagged]\ntags = debug\njobs = 4\n")
+    argv = [str(tmp_path), "--no-cache", "-cf", str(config), "-j", "0"]
+
+    assert App().get_opts(argv).jobs == 0
+    app = App()
+    with pytest.raises(SystemExit) as excinfo:
+        app.run(argv)
+    assert excinfo.value.code == 0
+    assert app.jobs == resolve_jobs(0) == (os.cpu_count() or 1)
+    assert path.read_bytes() == b"# x = 1  # debug\n"
+
+
+def test_cli_stream_threshold_overrides_config(tmp_path):
+    """--stream-threshold 0 should stream every file, even if the
+    config has a threshold above their size
+    """
+    path = tmp_path / "a.py"
+    path.write_bytes(b"x = 1  # debug\r\ny = 2\r\n")
+    config = tmp_path / "pytagged.ini"
+    config.write_text("[pytagged]\ntags = debug\n"
+                      "stream_threshold = 100000000\n")
+    subprocess.run(["pytag", str(path), "--no-cache", "-cf", str(config),
+                    "--stream-threshold", "0"], check=True)
+    # streamed files are written in text mode
+    assert path.read_bytes() == b"# x = 1  # debug\ny = 2\n"
+
+
+@pytest.mark.parametrize("caps", [["--max-inflight-files", "0"],
+                                  ["--max-inflight-bytes", "-1"]])
+def test_cli_bad_inflight_caps(caps):
+    cmd = ["pytag", path_to_multiples(), "-t", "debug", "-p", *caps]
+    completed = subprocess.run(cmd)
+    assert completed.returncode == 1
+
+
+def test_cli_printonly_jobs_stable_order(flag_jobs):
+    """Output of printonly mode with a process pool should
+    be the same as the output without one.
+    """
+    path = f"{path_to_multiples()}/src"
+    cmd = ["pytag", path, "-t", "debug", "-p"]
+    serial = subprocess.run(cmd, check=True, stdout=subprocess.PIPE)
+    pooled = subprocess.run([*cmd, flag_jobs, "2"], check=True,
+                            stdout=subprocess.PIPE)
+
+    def file_output(out: bytes) -> bytes:
+        # skip the run info, which prints the number of jobs
+        return out[out.index(b"|  0|"):]
+
+    assert file_output(serial.stdout) == file_output(pooled.stdout)
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_cli_skip_unchanged(cleanup_test_path_multiples, jobs):
+    """Files without any matching tag should not be rewritten"""
+    path = f"{path_to_multiples()}/src"
+    files = sorted(filepaths_from_path(path, is_excluded=lambda x: False))
+    mtimes = [os.stat(f).st_mtime_ns for f in files]
+
+    cmd = ["pytag", path, "-t", "no_such_tag", "-j", jobs, "-v", "1"]
+    completed = subprocess.run(cmd, check=True, stdout=subprocess.PIPE)
+
+    assert [os.stat(f).st_mtime_ns for f in files] == mtimes
+    summary = f"Wrote 0 files, skipped {len(files)} unchanged files"
+    assert summary in completed.stdout.decode()
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_cli_keeps_line_terminators(tmp_path, jobs):
+    """Only the tagged lines should change, CRLF endings included"""
+    src = b"import os\r\nprint(os.name)  # debug\r\nx = 1\r\n"
+    untagged = b"y = 2\r\n"
+    (tmp_path / "crlf.py").write_bytes(src)
+    (tmp_path / "untagged.py").write_bytes(untagged)
+
+    cmd = ["pytag", str(tmp_path), "-t", "debug", "-j", jobs, "--no-cache"]
+    subprocess.run(cmd, check=True)
+
+    assert (tmp_path / "crlf.py").read_bytes() == \
+        b"import os\r\n# print(os.name)  # debug\r\nx = 1\r\n"
+    assert (tmp_path / "untagged.py").read_bytes() == untagged
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+@pytest.mark.parametrize("extra", [[], ["--atomic"], ["--stream-threshold", "0"]])
+def test_cli_restore(tmp_path, jobs, extra):
+    """--restore should give back the original files byte for byte,
+    and only touch the files the run changed
+    """
+    src = tmp_path / "src"
+    src.mkdir()
+    contents = {
+        "crlf.py": b"import os\r\nprint(os.name)  # debug\r\nx = 1\r\n",
+        "block.py": b"# block: debug\nx = 1\n  y = 2\n# end\nz = 3\n",
+        "untagged.py": b"y = 2\n",
+    }
+    for name, data in contents.items():
+        (src / name).write_bytes(data)
+    journal = str(tmp_path / "journal.json")
+
+    cmd = ["pytag", str(src), "-t", "debug", "-j", jobs, "--no-cache",
+           "--journal", journal, *extra]
+    subprocess.run(cmd, check=True)
+    assert (src / "block.py").read_bytes() != contents["block.py"]
+    untagged_mtime = os.stat(src / "untagged.py").st_mtime_ns
+
+    completed = subprocess.run(["pytag", "--restore", journal, *extra],
+                               check=True, stdout=subprocess.PIPE)
+    assert "Restored 2 files" in completed.stdout.decode()
+    for name, data in contents.items():
+        expected = data
+        if extra[:1] == ["--stream-threshold"]:
+            # streamed files are written in text mode
+            expected = data.replace(b"\r\n", b"\n")
+        assert (src / name).read_bytes() == expected
+    assert os.stat(src / "untagged.py").st_mtime_ns == untagged_mtime
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="needs git")
+def test_cli_staged_and_changed_since(tmp_path):
+    def git(*args):
+        subprocess.run(["git", "-c", "user.name=t", "-c", "user.email=t@t",
+                        *args], cwd=str(tmp_path), check=True,
+                       stdout=subprocess.DEVNULL)
+
+    src = b"x = 1  # debug\n"
+    for name in ("a.py", "b.py", "c.py"):
+        (tmp_path / name).write_bytes(src)
+    git("init", "-q")
+    git("add", "a.py", "b.py")
+    git("commit", "-q", "-m", "init")
+    (tmp_path / "b.py").write_bytes(src + b"y = 2\n")
+    git("add", "b.py")
+
+    cmd = ["pytag", str(tmp_path), "-t", "debug", "--no-cache"]
+    subprocess.run([*cmd, "--staged"], check=True)
+    assert (tmp_path / "a.py").read_bytes() == src
+    assert (tmp_path / "b.py").read_bytes().startswith(b"# x = 1")
+    assert (tmp_path / "c.py").read_bytes() == src
+
+    # c.py is untracked, so changed since HEAD
+    subprocess.run([*cmd, "--changed-since", "HEAD"], check=True)
+    assert (tmp_path / "a.py").read_bytes() == src
+    assert (tmp_path / "c.py").read_bytes() == b"# " + src
+
+    completed = subprocess.run([*cmd, "--changed-since", "no-such-ref"],
+                               stderr=subprocess.PIPE)
+    assert completed.returncode == 1
+    assert b"git diff failed" in completed.stderr
+
+
+def test_cli_benchmark_json(tmp_path):
+    out = tmp_path / "report.json"
+    cmd = ["pytag", path_to_multiples(), "-t", "debug", "--no-cache",
+           "-b", "3", "--benchmark-warmup", "1",
+           "--benchmark-format", "json", "--benchmark-output", str(out)]
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+    report = json.loads(out.read_text())
+    assert report["kind"] == "io"
+    assert (report["runs"], report["warmup"]) == (3, 1)
+    assert list(report["phases"]) == [
+        "open", "gen_newlines", "write", "close", "total"]
+    for stats in report["phases"].values():
+        assert stats["min"] <= stats["p50"] <= stats["p90"] \
+            <= stats["p99"] <= stats["max"]
+    assert all(len(s) == 3 for s in report["samples"].values())
+    assert report["throughput"]["lines_per_sec"] > 0
+    assert report["files"] == len(list(filepaths_from_path(
+        path_to_multiples(), lambda p: False, ".py")))
+
+    completed = subprocess.run([*cmd[:-6], "--benchmark-warmup", "-1"],
+                               stderr=subprocess.PIPE)
+    assert completed.returncode == 1
+
+
+def test_cli_benchmark_warmup_overrides_config(tmp_path):
+    out = tmp_path / "report.json"
+    config = tmp_path / "pytagged.ini"
+    config.write_text("[pytagged]\nbenchmark_warmup = 2\n")
+    cmd = ["pytag", path_to_multiples(), "-t", "debug", "--no-cache",
+           "-b", "2", "-cf", str(config), "--benchmark-warmup", "0",
+           "--benchmark-format", "json", "--benchmark-output", str(out)]
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+    assert json.loads(out.read_text())["warmup"] == 0
+
+
+@pytest.mark.parametrize("engine", ["fast", "bytes"])
+def test_cli_benchmark_memory(tmp_path, engine):
+    out = tmp_path / "report.json"
+    path = path_to_multiples()
+    src_files = sorted(filepaths_from_path(path, lambda p: False, ".py"))
+    before = [Path(f).read_bytes() for f in src_files]
+    cmd = ["pytag", path, "-t", "debug", "--no-cache", "-b", "3",
+           "--benchmark-kind", "memory", "--benchmark-engine", engine,
+           "--benchmark-format", "json", "--benchmark-output", str(out)]
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+    report = json.loads(out.read_text())
+    assert report["kind"] == "memory"
+    assert report["misc"]["Engine"] == engine
+    assert report["misc"]["Files changed per run"] > 0
+    assert list(report["phases"]) == ["engine", "total"]
+    assert len(report["samples"]["engine"]) == 3
+
+    # the files are left alone
+    assert [Path(f).read_bytes() for f in src_files] == before
+
+
+def test_cli_benchmark_e2e(tmp_path):
+    out = tmp_path / "report.json"
+    path = path_to_multiples()
+    src_files = sorted(filepaths_from_path(path, lambda p: False, ".py"))
+    before = [Path(f).read_bytes() for f in src_files]
+    cmd = ["pytag", path, "-t", "debug", "--no-cache", "-b", "3",
+           "--benchmark-kind", "e2e", "--benchmark-warmup", "1",
+           "--benchmark-format", "json", "--benchmark-output", str(out)]
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+    report = json.loads(out.read_text())
+    assert report["kind"] == "e2e"
+    assert list(report["phases"]) == [
+        "walk", "filter", "read", "transform", "write", "close", "total"]
+    assert report["files"] == len(src_files)
+    # every run starts from a fresh copy, so each one writes
+    assert report["misc"]["Files written per run"] > 0
+    assert report["phases"]["write"]["min"] > 0
+
+    # the files are left alone
+    assert [Path(f).read_bytes() for f in src_files] == before
+
+    completed = subprocess.run([*cmd, "--staged"], stderr=subprocess.PIPE)
+    assert completed.returncode == 1
+
+
+def test_cli_benchmark_baseline(tmp_path):
+    cache_dir = tmp_path / "cache"
+    cmd = ["pytag", path_to_multiples(), "-t", "debug", "--no-cache", "-b", "5",
+           "--benchmark-warmup", "0", "--cache-dir", str(cache_dir)]
+    subprocess.run([*cmd, "--save-baseline", "v1"], check=True,
+                   stdout=subprocess.DEVNULL)
+    saved = cache_dir / "baselines" / "v1.json"
+    baseline = json.loads(saved.read_text())
+    assert baseline["kind"] == "io" and len(baseline["samples"]["open"]) == 5
+
+    out = tmp_path / "report.json"
+    compare = [*cmd, "--compare-to", "v1", "--benchmark-format", "json",
+               "--benchmark-output", str(out)]
+    subprocess.run([*compare, "--max-slowdown", "1000"], check=True)
+    comparison = json.loads(out.read_text())["comparison"]
+    assert list(comparison["phases"]) == [
+        "open", "gen_newlines", "write", "close", "total"]
+    assert not comparison["regressed"]
+
+    # a baseline 100 times faster than any run
+    fast = tmp_path / "fast.json"
+    baseline["samples"] = {k: [max(1, t // 100) for t in v]
+                           for k, v in baseline["samples"].items()}
+    fast.write_text(json.dumps(baseline))
+    completed = subprocess.run([*cmd, "--compare-to", str(fast)],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert completed.returncode == 1
+    assert b"slower than the baseline" in completed.stderr
+    assert b"SLOWER" in completed.stdout
+
+    completed = subprocess.run([*cmd, "--compare-to", "missing"],
+                               stderr=subprocess.PIPE)
+    assert completed.returncode == 1
+    assert b"could not load the baseline" in completed.stderr
+
+    # also from the config file
+    config = tmp_path / "pytagged.ini"
+    config.write_text(f"[pytagged]\ncompare_to = {fast}\nmax_slowdown = 1e6\n")
+    subprocess.run([*cmd, "-cf", str(config)], check=True,
+                   stdout=subprocess.DEVNULL)
+
+
+def test_cli_max_slowdown_overrides_config(tmp_path):
+    cache_dir = tmp_path / "cache"
+    cmd = ["pytag", path_to_multiples(), "-t", "debug", "--no-cache", "-b", "3",
+           "--benchmark-warmup", "0", "--cache-dir", str(cache_dir)]
+    subprocess.run([*cmd, "--save-baseline", "v1"], check=True,
+                   stdout=subprocess.DEVNULL)
+    # a baseline 100 times slower than any run, which can't regress
+    saved = cache_dir / "baselines" / "v1.json"
+    baseline = json.loads(saved.read_text())
+    baseline["samples"] = {k: [t * 100 for t in v]
+                           for k, v in baseline["samples"].items()}
+    saved.write_text(json.dumps(baseline))
+
+    out = tmp_path / "report.json"
+    config = tmp_path / "pytagged.ini"
+    config.write_text("[pytagged]\nmax_slowdown = 50\n")
+    subprocess.run([*cmd, "-cf", str(config), "--compare-to", "v1",
+                    "--max-slowdown", "0", "--benchmark-format", "json",
+                    "--benchmark-output", str(out)], check=True)
+    assert json.loads(out.read_text())["comparison"]["max_slowdown"] == 0
+
+
+def test_cli_respect_gitignore(tmp_path):
+    src = b"x = 1  # debug\n"
+    for name in ("a.py", "build/b.py", "gen_pb2.py"):
+        (tmp_path / name).parent.mkdir(exist_ok=True)
+        (tmp_path / name).write_bytes(src)
+    (tmp_path / ".gitignore").write_text("build/\n*_pb2.py\n")
+
+    cmd = ["pytag", str(tmp_path), "-t", "debug", "--no-cache", "-v", "1",
+           "--respect-gitignore"]
+    completed = subprocess.run(cmd, check=True, stdout=subprocess.PIPE)
+    assert b"Pruned by .gitignore: 2 entries" in completed.stdout
+    assert (tmp_path / "a.py").read_bytes() == b"# " + src
+    assert (tmp_path / "build" / "b.py").read_bytes() == src
+    assert (tmp_path / "gen_pb2.py").read_bytes() == src
+
+    # also from the config file
+    (tmp_path / "a.py").write_bytes(src)
+    (tmp_path / "pytagged.ini").write_text(
+        "[pytagged]\ntags = debug\nrespect_gitignore = true\n")
+    subprocess.run(["pytag", str(tmp_path), "--no-cache",
+                    "-cf", str(tmp_path / "pytagged.ini")], check=True)
+    assert (tmp_path / "a.py").read_bytes() == b"# " + src
+    assert (tmp_path / "build" / "b.py").read_bytes() == src
+
+
+def test_cli_watch(tmp_path):
+    """--watch should process the files created or modified after
+    the full pass, and not its own writes
+    """
+    a = tmp_path / "a.py"
+    a.write_bytes(b"x = 1  # debug\n")
+    cmd = ["pytag", str(tmp_path), "-t", "debug", "--no-cache", "--watch",
+           "-v", "1"]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    try:
+        for line in proc.stdout:
+            if line.startswith(b"Watching"):
+                break
+        assert a.read_bytes() == b"# x = 1  # debug\n"
+
+        b = tmp_path / "b.py"
+        b.write_bytes(b"y = 2  # debug\n")
+        for line in proc.stdout:
+            if line.startswith(b"Wrote"):
+                break
+        assert line == b"Wrote 1 files, skipped 0 unchanged files\n"
+        assert b.read_bytes() == b"# y = 2  # debug\n"
+        # leave time for the events of its own write
+        time.sleep(3 * DEBOUNCE)
+    finally:
+        proc.send_signal(signal.SIGINT)
+        out = proc.communicate(timeout=10)[0]
+    assert proc.returncode == 0
+    # its own write of b.py didn't trigger another batch
+    assert b"Wrote" not in out
+
+
+def test_cli_watch_journal_and_cache(tmp_path):
+    """The batches of --watch should be in the journal of the session,
+    with the full pass, and their files in the cache
+    """
+    src = tmp_path / "src"
+    src.mkdir()
+    a = src / "a.py"
+    a.write_bytes(b"x = 1  # debug\n")
+    journal = str(tmp_path / "journal.json")
+    cache_dir = str(tmp_path / "cache")
+    cmd = ["pytag", str(src), "-t", "debug", "--watch", "-v", "1",
+           "--journal", journal, "--cache-dir", cache_dir]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    try:
+        for line in proc.stdout:
+            if line.startswith(b"Watching"):
+                break
+        b = src / "b.py"
+        b.write_bytes(b"y = 2  # debug\n")
+        for line in proc.stdout:
+            if line.startswith(b"Wrote"):
+                break
+        # a file of the full pass changed again
+        a.write_bytes(a.read_bytes() + b"z = 3  # debug\n")
+        for line in proc.stdout:
+            if line.startswith(b"Wrote"):
+                break
+        assert a.read_bytes() == b"# x = 1  # debug\n# z = 3  # debug\n"
+    finally:
+        proc.send_signal(signal.SIGINT)
+        proc.communicate(timeout=10)
+    assert proc.returncode == 0
+
+    cache = Cache(cache_dir, ["debug"]).load()
+    assert cache.lookup(str(a)) and cache.lookup(str(b))
+
+    subprocess.run(["pytag", "--restore", journal], check=True,
+                   stdout=subprocess.DEVNULL)
+    assert a.read_bytes() == b"x = 1  # debug\nz = 3  # debug\n"
+    assert b.read_bytes() == b"y = 2  # debug\n"
+
+
+def test_cli_watch_other_mode():
+    cmd = ["pytag", path_to_multiples(), "-t", "debug", "-p", "--watch"]
+    assert subprocess.run(cmd).returncode == 1
+
+
+@pytest.mark.parametrize("extra", [[], ["--no-cache"],
+                                   ["--journal", "out/journal.json"]])
+def test_cli_journal_dir_gitignored(tmp_path, extra):
+    """The journal holds lines of source, its directory should be
+    ignored by git however it was created
+    """
+    (tmp_path / "a.py").write_bytes(b"x = 1  # debug\n")
+    subprocess.run(["pytag", "a.py", "-t", "debug", *extra], check=True,
+                   cwd=str(tmp_path))
+    journal = tmp_path / (extra[1] if extra[:1] == ["--journal"]
+                          else ".pytagged_cache/journal.json")
+    assert journal.exists()
+    gitignore = journal.parent / ".gitignore"
+    assert gitignore.read_text().endswith("*\n")
+
+
+def test_cli_restore_skips_edited_files(tmp_path):
+    path = tmp_path / "a.py"
+    path.write_bytes(b"x = 1  # debug\n")
+    journal = str(tmp_path / "journal.json")
+    subprocess.run(["pytag", str(path), "-t", "debug", "--no-cache",
+                    "--journal", journal], check=True)
+
+    # the user uncommented the line themselves and changed it
+    path.write_bytes(b"x = 2  # debug\n")
+    completed = subprocess.run(["pytag", "--restore", journal],
+                               stderr=subprocess.PIPE)
+    assert completed.returncode == 1
+    assert "changed since the run" in completed.stderr.decode()
+    assert path.read_bytes() == b"x = 2  # debug\n"
+
+
 @pytest.mark.parametrize(
     "tags",
     [
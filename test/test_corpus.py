@@ -0,0 +1,69 @@
+import importlib.util
+import io
+import os
+import random
+
+import pytest
+
+from pytagged import nline
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "benchmarks", "corpus.py")
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    # benchmarks/ isn't a package, load the generator from its file
+    spec = importlib.util.spec_from_file_location("corpus", CORPUS_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def read_tree(root):
+    files = {}
+    for dir_path, _, names in os.walk(str(root)):
+        for name in names:
+            path = os.path.join(dir_path, name)
+            with open(path, "rb") as f:
+                files[os.path.relpath(path, str(root))] = f.read()
+    return files
+
+
+def test_write_corpus_deterministic(corpus, tmp_path):
+    spec = corpus.Spec(seed=7, files=30, median_lines=50, depth=3)
+    a = corpus.write_corpus(str(tmp_path / "a"), spec)
+    b = corpus.write_corpus(str(tmp_path / "b"), spec)
+    assert a == b and a.files == 30
+    files = read_tree(tmp_path / "a")
+    assert files == read_tree(tmp_path / "b")
+    assert sum(len(data) for data in files.values()) == a.bytes
+
+    corpus.write_corpus(str(tmp_path / "c"), spec._replace(seed=8))
+    assert read_tree(tmp_path / "c") != files
+
+
+def count_blocks(corpus, src):
+    """Blocks outside of docstrings, which aren't nested"""
+    in_doc = False
+    blocks = 0
+    for ln in src.splitlines():
+        if in_doc:
+            in_doc = ln not in corpus.QUOTES
+        elif ln[:3] in corpus.QUOTES:
+            in_doc = True
+        elif ln == "# block: debug":
+            blocks += 1
+    return blocks
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_make_source_counts(corpus, seed):
+    spec = corpus.Spec(seed=seed, nesting=0, tag_density=0.1, block_rate=0.02,
+                       docstring_rate=0.03)
+    src, stats = corpus.make_source(random.Random(seed), spec, 2000)
+    assert stats.lines == len(src.splitlines())
+    assert stats.blocks == count_blocks(corpus, src) > 0
+    assert stats.docstrings > 0
+    res = nline.get_newlines_changed(io.StringIO(src), ["debug"])
+    assert res.changed == stats.tagged
@@ -0,0 +1,201 @@
+import os
+import socket
+import stat
+import subprocess
+import sys
+
+import pytest
+
+from pytagged import client
+
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"),
+                                reason="needs Unix sockets")
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    path = str(tmp_path / "pytagged.sock")
+    proc = subprocess.Popen(["pytag-daemon", "--socket", path],
+                            stdout=subprocess.PIPE)
+    assert proc.stdout.readline() == f"Listening on {path}\n".encode()
+    yield path
+    proc.terminate()
+    proc.wait(timeout=10)
+    # the socket is removed on exit
+    assert not os.path.exists(path)
+
+
+def run_client(path, *args, cwd=None):
+    env = dict(os.environ, **{client.SOCKET_ENV: path})
+    return subprocess.run(["pytag-client", *args], cwd=cwd, env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def test_daemon_run(daemon, tmp_path):
+    work = tmp_path / "work"
+    work.mkdir()
+    (work / "a.py").write_bytes(b"x = 1  # debug\r\n")
+    (work / "pytagged.ini").write_text("[pytagged]\ntags = debug\n")
+
+    # relative paths & the config file are resolved in the client's cwd
+    completed = run_client(daemon, "a.py", "-v", "1", "--no-cache",
+                           cwd=str(work))
+    assert completed.returncode == 0
+    assert b"Wrote 1 files" in completed.stdout
+    assert (work / "a.py").read_bytes() == b"# x = 1  # debug\r\n"
+
+    # config changes are picked up by the next run
+    (work / "b.py").write_bytes(b"y = 2  # other\n")
+    (work / "pytagged.ini").write_text("[pytagged]\ntags = other\n")
+    assert run_client(daemon, "b.py", cwd=str(work)).returncode == 0
+    assert (work / "b.py").read_bytes() == b"# y = 2  # other\n"
+
+
+def test_daemon_exit_codes(daemon, tmp_path):
+    completed = run_client(daemon, str(tmp_path), "-t", " ")
+    assert completed.returncode == 1
+    assert b"tag cannot be an empty string" in completed.stderr
+
+    # argparse errors
+    completed = run_client(daemon, "--jobs", "many")
+    assert completed.returncode == 2
+    assert b"invalid int value" in completed.stderr
+
+    completed = run_client(daemon, str(tmp_path), "-t", "debug", "--watch")
+    assert completed.returncode == 1
+    assert b"daemon" in completed.stderr
+
+
+def test_daemon_stale_socket(tmp_path):
+    path = str(tmp_path / "pytagged.sock")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.close()
+    # nothing listens on it, the daemon replaces it
+    proc = subprocess.Popen(["pytag-daemon", "--socket", path],
+                            stdout=subprocess.PIPE)
+    try:
+        assert proc.stdout.readline().startswith(b"Listening")
+        # a second daemon on the same socket refuses to start
+        second = subprocess.run(["pytag-daemon", "--socket", path],
+                                stderr=subprocess.PIPE)
+        assert second.returncode == 1
+        assert b"already listening" in second.stderr
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def test_client_without_daemon(tmp_path):
+    (tmp_path / "a.py").write_bytes(b"x = 1  # debug\n")
+    missing = str(tmp_path / "missing.sock")
+    assert client.request(["-t", "debug"], missing) is None
+
+    # runs pytagged in process instead
+    completed = run_client(missing, str(tmp_path / "a.py"), "-t", "debug",
+                           "--no-cache")
+    assert completed.returncode == 0
+    assert (tmp_path / "a.py").read_bytes() == b"# x = 1  # debug\n"
+
+
+def test_socket_path_fallback(monkeypatch):
+    monkeypatch.delenv(client.SOCKET_ENV, raising=False)
+    monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+    assert client.socket_path() == \
+        f"/tmp/pytagged-{os.getuid()}/pytagged.sock"
+
+
+def test_make_private_dir(tmp_path):
+    path = tmp_path / "private"
+    client.make_private_dir(str(path))
+    assert stat.S_IMODE(path.stat().st_mode) == 0o700
+    client.make_private_dir(str(path))
+
+    # others could swap the socket in it
+    path.chmod(0o755)
+    with pytest.raises(PermissionError):
+        client.make_private_dir(str(path))
+    link = tmp_path / "link"
+    link.symlink_to(tmp_path / "elsewhere")
+    (tmp_path / "elsewhere").mkdir(mode=0o700)
+    with pytest.raises(PermissionError):
+        client.make_private_dir(str(link))
+
+
+def test_client_checks_socket(tmp_path, capsys):
+    path = str(tmp_path / "pytagged.sock")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(path)
+        sock.listen()
+        # others can connect to it, so it isn't the user's daemon
+        os.chmod(path, 0o666)
+        assert client.request(["-t", "debug"], path) is None
+    assert "not a socket of the current user" in capsys.readouterr().err
+
+    not_socket = tmp_path / "a.sock"
+    not_socket.write_text("")
+    not_socket.chmod(0o600)
+    with pytest.raises(PermissionError):
+        client.check_owner(str(not_socket))
+
+
+@pytest.mark.skipif(os.getuid() != 0, reason="needs to chown")
+def test_daemon_socket_of_other_user(tmp_path):
+    path = str(tmp_path / "pytagged.sock")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.close()
+    os.chown(path, 12345, -1)
+    with pytest.raises(PermissionError):
+        client.check_owner(path, private=False)
+
+    # neither probed nor removed
+    completed = subprocess.run(["pytag-daemon", "--socket", path],
+                               stderr=subprocess.PIPE)
+    assert completed.returncode == 1
+    assert b"not a socket of the current user" in completed.stderr
+    assert os.path.exists(path)
+
+
+def test_client_imports_are_light():
+    code = "import sys, pytagged.client; print(sorted(sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], check=True,
+                         stdout=subprocess.PIPE).stdout.decode()
+    for heavy in ("argparse", "configparser", "statistics", "pytagged.app"):
+        assert f"'{heavy}'" not in out
+
+
+def test_warm_state(tmp_path):
+    from pytagged import _warm
+
+    warm = _warm.WarmState()
+    config = tmp_path / "pytagged.ini"
+    config.write_text("a")
+    parsed = []
+
+    def parse(path):
+        parsed.append(path)
+        return len(parsed)
+
+    assert warm.config(str(config), parse) == 1
+    assert warm.config(str(config), parse) == 1
+    config.write_text("ab")
+    assert warm.config(str(config), parse) == 2
+
+    cache_dir = str(tmp_path / "cache")
+    cache = warm.cache(cache_dir, ["debug"])
+    (tmp_path / "a.py").write_text("x = 1\n")
+    cache.record(str(tmp_path / "a.py"))
+    cache.save()
+    warm.settle()
+    assert warm.cache(cache_dir, ["debug"]) is cache
+    warm.settle()
+    # another tag set saved the shared index, reload
+    other = warm.cache(cache_dir, ["other"])
+    other.record(str(tmp_path / "a.py"))
+    other.save()
+    warm.settle()
+    reloaded = warm.cache(cache_dir, ["debug"])
+    assert reloaded is not cache
+    assert reloaded.lookup(str(tmp_path / "a.py"))
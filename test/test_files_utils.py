@@ -0,0 +1,134 @@
+import fnmatch
+import os
+
+import pytest
+
+from pytagged import _files_utils
+from pytagged.app import DEFAULT_EXCLUDED_PATTERNS
+
+
+def fnmatch_match_path(path, patterns):
+    """match_path as it was before PathMatcher, one fnmatch per pattern"""
+    if not patterns:
+        return False
+    basename = os.path.basename(path)
+    if basename not in ('**', "*"):
+        return any(fnmatch.fnmatch(basename, p) for p in patterns)
+    abs_path = os.path.abspath(path)
+    return any(fnmatch.fnmatch(abs_path, p) for p in patterns)
+
+
+PATTERNS = [
+    [],
+    DEFAULT_EXCLUDED_PATTERNS,
+    DEFAULT_EXCLUDED_PATTERNS + ["env", "*_test.py", "build*", "[!a]?.py"],
+    ["*/vendor/*", "docs/*", "[/]x", "*"],
+    ["*.py", "*.py"],
+]
+PATHS = [
+    ".", "./", "a.py", "b.py", "ab.py", "pkg/env", "pkg/env.py", "env",
+    ".git", "src/.git", "x.egg", "pkg/x.egg/y.py", "foo_test.py",
+    "build", "build-1", "lib/vendor/*", "lib/vendor/**", "*", "**",
+    "docs/*", "/tmp/docs/*", "x", "/x", "__pycache__", "d/__pycache__/",
+]
+
+
+@pytest.mark.parametrize("patterns", PATTERNS)
+def test_path_matcher_same_as_fnmatch(patterns):
+    matcher = _files_utils.PathMatcher(patterns)
+    for path in PATHS:
+        assert matcher(path) == fnmatch_match_path(path, patterns), path
+        assert _files_utils.match_path(path, patterns) \
+            == fnmatch_match_path(path, patterns), path
+
+
+def test_path_matcher_rules():
+    matcher = _files_utils.PathMatcher(["*/vendor/*", "env"])
+    assert matcher.basename_rgx.pattern.count("|") == 0
+    assert matcher.path_rgx.pattern.count("|") == 1
+    assert matcher("pkg/env")
+    assert not matcher("lib/vendor/x.py")
+
+    empty = _files_utils.PathMatcher([])
+    assert empty.basename_rgx is None and empty.path_rgx is None
+    assert not empty("a.py")
+
+
+def test_get_path_matcher_cached():
+    a = _files_utils.get_path_matcher(["env", ".git"])
+    assert _files_utils.get_path_matcher(("env", ".git")) is a
+    assert _files_utils.get_path_matcher(["env"]) is not a
+
+
+def test_walk_with_path_matcher(tmp_path):
+    for name in ("a.py", "env/b.py", "pkg/c.py", "pkg/.git/d.py",
+                 "pkg/e_test.py"):
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_text("")
+    patterns = DEFAULT_EXCLUDED_PATTERNS + ["env", "*_test.py"]
+
+    found = sorted(_files_utils.filepaths_from_path(
+        str(tmp_path), _files_utils.get_path_matcher(patterns)))
+    expected = sorted(_files_utils.filepaths_from_path(
+        str(tmp_path), lambda p: fnmatch_match_path(p, patterns)))
+    assert found == expected
+    assert found == [str(tmp_path / "a.py"), str(tmp_path / "pkg" / "c.py")]
+
+
+def make_files(root, *names):
+    for name in names:
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).write_text("")
+
+
+def test_walk_prunes_adjacent_excluded_dirs(tmp_path):
+    # removing from subdirs while iterating over it used to skip
+    # the directory right after an excluded one
+    make_files(tmp_path, "a/x.py", "b/x.py", "c/x.py", "d/x.py")
+    found = sorted(_files_utils.filepaths_from_path(
+        str(tmp_path), _files_utils.PathMatcher(["a", "b", "c"])))
+    assert found == [str(tmp_path / "d" / "x.py")]
+
+
+def test_walk_extension_and_order(tmp_path):
+    make_files(tmp_path, "a.py", "a.txt", "sub/b.py", "sub/deep/c.py",
+               "sub/deep/c.pyc")
+    found = list(_files_utils.filepaths_from_path(
+        str(tmp_path), lambda p: False, ".py"))
+    assert sorted(found) == [str(tmp_path / n) for n in
+                             ("a.py", "sub/b.py", "sub/deep/c.py")]
+    # files of a directory come before the ones of its subdirs
+    assert found.index(str(tmp_path / "a.py")) \
+        < found.index(str(tmp_path / "sub" / "b.py")) \
+        < found.index(str(tmp_path / "sub" / "deep" / "c.py"))
+
+    single = str(tmp_path / "a.txt")
+    assert list(_files_utils.filepaths_from_path(
+        single, lambda p: False, ".py")) == []
+    assert list(_files_utils.filepaths_from_path(
+        single, lambda p: False)) == [single]
+
+
+def test_walk_dedupes_links(tmp_path):
+    make_files(tmp_path, "pkg/a.py", "other/b.py")
+    os.symlink(str(tmp_path / "pkg" / "a.py"), str(tmp_path / "link.py"))
+    os.link(str(tmp_path / "pkg" / "a.py"), str(tmp_path / "hard.py"))
+    # not followed, like os.walk
+    os.symlink(str(tmp_path / "other"), str(tmp_path / "linkdir"))
+    os.symlink(str(tmp_path / "missing.py"), str(tmp_path / "broken.py"))
+    os.mkfifo(str(tmp_path / "fifo.py"))
+
+    found = list(_files_utils.filepaths_from_path(
+        str(tmp_path), lambda p: False, ".py"))
+    assert len(found) == 2
+    assert str(tmp_path / "other" / "b.py") in found
+    assert len({os.stat(f).st_ino for f in found}) == 2
+
+
+def test_walk_streams(tmp_path):
+    make_files(tmp_path, "a.py", "sub/b.py")
+    gen = _files_utils.filepaths_from_path(str(tmp_path), lambda p: False)
+    assert next(gen) == str(tmp_path / "a.py")
+    # sub wasn't read yet
+    make_files(tmp_path, "sub/c.py")
+    assert sorted(gen) == [str(tmp_path / "sub" / n) for n in ("b.py", "c.py")]
@@ -0,0 +1,94 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from pytagged import _files_utils, _git
+
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None,
+                                reason="needs git")
+
+
+def git(repo, *args):
+    subprocess.run(["git", "-c", "user.name=t", "-c", "user.email=t@t",
+                    *args], cwd=str(repo), check=True,
+                   stdout=subprocess.DEVNULL)
+
+
+def excluded(*patterns):
+    return lambda p: _files_utils.match_path(p, list(patterns))
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = tmp_path / "repo"
+    (repo / "pkg" / "env").mkdir(parents=True)
+    for name in ("a.py", "b.py", "pkg/c.py", "pkg/env/d.py", "pkg/e.py"):
+        (repo / name).write_text("x = 1\n")
+    git(repo, "init", "-q")
+    git(repo, "add", ".")
+    git(repo, "commit", "-q", "-m", "init")
+    return repo
+
+
+def test_changed_since(repo):
+    (repo / "a.py").write_text("x = 2\n")
+    (repo / "pkg" / "c.py").write_text("x = 2\n")
+    git(repo, "commit", "-q", "-am", "change")
+    (repo / "pkg" / "env" / "d.py").write_text("x = 2\n")
+    (repo / "pkg" / "new.py").write_text("x = 2\n")
+    (repo / "b.py").unlink()
+    path = str(repo)
+
+    files = _git.changed_files(path, "HEAD~1", False, excluded("env"))
+    # committed, untracked, not excluded & not deleted
+    assert files == [os.path.join(path, "a.py"),
+                     os.path.join(path, "pkg", "c.py"),
+                     os.path.join(path, "pkg", "new.py")]
+
+    # only the changes under path
+    sub = os.path.join(path, "pkg")
+    assert _git.changed_files(sub, "HEAD", False, excluded()) == [
+        os.path.join(sub, "env", "d.py"), os.path.join(sub, "new.py")]
+
+
+def test_staged(repo):
+    (repo / "a.py").write_text("x = 2\n")
+    (repo / "pkg" / "e.py").write_text("x = 2\n")
+    git(repo, "add", "pkg/e.py")
+
+    files = _git.changed_files(str(repo), None, True, excluded())
+    assert files == [os.path.join(str(repo), "pkg", "e.py")]
+    files = _git.changed_files(str(repo), "HEAD", True, excluded())
+    assert len(files) == 2
+
+
+def test_relative_path(repo, monkeypatch):
+    monkeypatch.chdir(repo)
+    (repo / "pkg" / "c.py").write_text("x = 2\n")
+    assert _git.changed_files("pkg", "HEAD", False, excluded()) == \
+        [os.path.join("pkg", "c.py")]
+    assert _git.changed_files(os.path.join("pkg", "c.py"), "HEAD", False,
+                              excluded()) == [os.path.join("pkg", "c.py")]
+
+
+def test_git_errors(repo, tmp_path):
+    with pytest.raises(_git.GitError):
+        _git.changed_files(str(repo), "no-such-ref", False, excluded())
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    with pytest.raises(_git.GitError):
+        _git.changed_files(str(outside), "HEAD", False, excluded())
+
+
+@pytest.mark.parametrize("rel, expected", [
+    ("a.py", False), ("env/a.py", True), ("pkg/env/a.py", True),
+    ("pkg/a.py", False), ("../a.py", True),
+])
+def test_is_excluded_under(tmp_path, rel, expected):
+    root = str(tmp_path / "root")
+    path = os.path.join(root, rel)
+    assert _files_utils.is_excluded_under(path, root, excluded("env")) \
+        is expected
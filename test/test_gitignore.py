@@ -0,0 +1,147 @@
+import os
+import re
+import shutil
+import subprocess
+
+import pytest
+
+from pytagged import _files_utils, _gitignore
+
+
+needs_git = pytest.mark.skipif(shutil.which("git") is None,
+                               reason="needs git")
+
+GITIGNORE = """\
+# comment
+build/
+*.pyc
+!keep.pyc
+venv
+/top.py
+a/**/gen_*.py
+data[0-9].py
+\\#hash.py
+trailing.py
+"""
+NESTED_GITIGNORE = """\
+!venv
+*_pb2.py
+/local.py
+"""
+FILES = [
+    "build/x/y.py", "a/build/z.py", "a/b/gen_1.py", "a/b/c/gen_2.py",
+    "a/gen_0.py", "gen_3.py", "top.py", "a/top.py", "x.pyc", "keep.pyc",
+    "venv/lib.py", "a/venv/v.py", "a/msg_pb2.py", "msg_pb2.py",
+    "a/local.py", "a/b/local.py", "data1.py", "dataX.py", "#hash.py",
+    "trailing.py", "src/mod.py", "src/build.py", "info.py",
+]
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "repo"
+    for name in FILES:
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).write_text("")
+    (root / ".gitignore").write_text(GITIGNORE)
+    (root / "a" / ".gitignore").write_text(NESTED_GITIGNORE)
+    if shutil.which("git") is not None:
+        subprocess.run(["git", "init", "-q"], cwd=str(root), check=True)
+    (root / ".git" / "info").mkdir(parents=True, exist_ok=True)
+    (root / ".git" / "info" / "exclude").write_text("info.py\n")
+    return root
+
+
+@pytest.mark.parametrize("pattern, path, match", [
+    ("*.py", "a.py", True),
+    ("*.py", "a/b.py", False),
+    ("a?c", "abc", True),
+    ("a?c", "a/c", False),
+    ("**/foo", "x/y/foo", True),
+    ("**/foo", "foo", True),
+    ("a/**/b", "a/b", True),
+    ("a/**/b", "a/x/y/b", True),
+    ("abc/**", "abc/x/y", True),
+    ("abc/**", "abc", False),
+    ("a**b", "axxb", True),
+    ("a**b", "ax/b", False),
+    ("[!a]b", "cb", True),
+    ("[!a]b", "ab", False),
+    ("[!a]b", "/b", False),
+    ("[a-c]x", "bx", True),
+    ("[ab", "[ab", True),
+    ("\\*x", "*x", True),
+    ("\\*x", "ax", False),
+])
+def test_translate(pattern, path, match):
+    rgx = re.compile(_gitignore.translate(pattern), re.DOTALL)
+    assert (rgx.fullmatch(path) is not None) == match
+
+
+def test_parse_rule():
+    assert _gitignore.parse_rule("# comment") is None
+    assert _gitignore.parse_rule("\n") is None
+    assert _gitignore.parse_rule("/") is None
+    rule = _gitignore.parse_rule("!build/\n")
+    assert rule.negate and rule.dir_only
+    rule = _gitignore.parse_rule("a/b")
+    assert not rule.negate and not rule.dir_only
+    assert _gitignore.parse_rule("x\\ ").rgx.endswith("\\ ")
+    assert not _gitignore.parse_rule("x  ").rgx.endswith(" ")
+
+
+@needs_git
+def test_ignored_same_as_git(tree):
+    paths = FILES + ["build", "a/build", "venv", "a/venv", "src"]
+    completed = subprocess.run(
+        ["git", "check-ignore", "--no-index", "--stdin"],
+        input="\n".join(paths).encode(), cwd=str(tree),
+        stdout=subprocess.PIPE)
+    expected = set(completed.stdout.decode().splitlines())
+
+    ignore = _gitignore.GitIgnore(str(tree))
+    for p in paths:
+        is_dir = os.path.isdir(str(tree / p))
+        assert ignore.ignored(str(tree / p), is_dir) == (p in expected), p
+
+
+@needs_git
+def test_walk_same_as_git(tree):
+    completed = subprocess.run(
+        ["git", "ls-files", "--others", "--exclude-standard"],
+        cwd=str(tree), stdout=subprocess.PIPE, check=True)
+    expected = sorted(str(tree / p) for p in
+                      completed.stdout.decode().splitlines()
+                      if p.endswith(".py"))
+
+    ignore = _gitignore.GitIgnore(str(tree))
+    found = sorted(_files_utils.filepaths_from_path(
+        str(tree), lambda p: False, ".py", ignore))
+    assert found == expected
+    # build/, a/build/ & venv/ are pruned without being read,
+    # along with 10 .py files
+    assert ignore.pruned == 13
+
+
+def test_walk_below_top(tree):
+    # the rules of the directories above the path apply
+    ignore = _gitignore.GitIgnore(str(tree / "a"))
+    assert ignore.top == str(tree)
+    found = sorted(_files_utils.filepaths_from_path(
+        str(tree / "a"), lambda p: False, ".py", ignore))
+    assert found == [str(tree / "a" / n) for n in
+                     ("b/local.py", "top.py", "venv/v.py")]
+
+
+def test_outside_work_tree(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / ".gitignore").write_text("*.py\n")
+    (tmp_path / "sub" / "a.py").write_text("")
+    (tmp_path / "b.py").write_text("")
+    ignore = _gitignore.GitIgnore(str(tmp_path))
+    if _gitignore.find_top(str(tmp_path)) is None:
+        assert ignore.top == str(tmp_path)
+    found = list(_files_utils.filepaths_from_path(
+        str(tmp_path), lambda p: False, ".py", ignore))
+    assert found == [str(tmp_path / "b.py")]
+    assert ignore.pruned == 1
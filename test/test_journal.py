@@ -0,0 +1,163 @@
+import codecs
+import subprocess
+
+import pytest
+
+from pytagged import _journal, _proc, _write, nline
+
+
+SOURCES = [
+    b"import os\nprint(os.name)  # debug\nx = 1\n",
+    b"import os\r\nprint(os.name)  # debug\r\nx = 1\r\n",
+    codecs.BOM_UTF8 + b"x = 1  # debug\n    y = 2  # debug\nz = 3",
+    b"# block: debug\nx = 1\n\n    y = 2\n# end\nz = 3\n",
+    b's = "\xff\xfe"  # debug\r  t = 1  # debug\r',
+]
+
+
+def run(path, writer=None, stream_threshold=_proc.STREAM_THRESHOLD):
+    journal = _journal.Journal()
+    res = _proc.proc_file(str(path), nline.get_matcher(["debug"]),
+                          write=True, keep_lines=False,
+                          stream_threshold=stream_threshold,
+                          writer=writer, undo=True)
+    assert res.written
+    journal.record(str(path), res.undo)
+    return journal
+
+
+@pytest.mark.parametrize("src", SOURCES)
+@pytest.mark.parametrize("atomic", [False, True])
+def test_restore_bytes(tmp_path, src, atomic):
+    path = tmp_path / "a.py"
+    path.write_bytes(src)
+    writer = _write.AtomicWriter() if atomic else None
+    journal = run(path, writer)
+    assert not journal.files[str(path)].text
+
+    journal_path = str(tmp_path / "cache" / "journal.json")
+    journal.save(journal_path)
+    res = _journal.restore(_journal.Journal.load(journal_path), writer)
+    assert res == _journal.RestoreResult([str(path)], [])
+    assert path.read_bytes() == src
+
+
+@pytest.mark.parametrize("src", [b"x = 1  # debug\n", b"a\n'''\nb  # debug\n'''\n"])
+def test_restore_streamed(tmp_path, src):
+    path = tmp_path / "a.py"
+    path.write_bytes(src)
+    journal = run(path, stream_threshold=0)
+    assert journal.files[str(path)].text
+    journal_path = str(tmp_path / "journal.json")
+    journal.save(journal_path)
+
+    _journal.restore(_journal.Journal.load(journal_path))
+    assert path.read_bytes() == src
+
+
+def test_restore_only_changed_lines(tmp_path):
+    path = tmp_path / "a.py"
+    path.write_bytes(b"x = 1  # debug\ny = 2\n")
+    journal = run(path)
+    # lines that the run didn't comment out are left as they are
+    path.write_bytes(b"# x = 1  # debug\ny = 3\nz = 4\n")
+
+    assert _journal.restore(journal).restored == [str(path)]
+    assert path.read_bytes() == b"x = 1  # debug\ny = 3\nz = 4\n"
+
+
+def test_restore_skips_edited_files(tmp_path):
+    path = tmp_path / "a.py"
+    path.write_bytes(b"x = 1  # debug\n")
+    journal = run(path)
+    path.write_bytes(b"x = 2  # debug\n")
+    missing = tmp_path / "missing.py"
+    journal.files[str(missing)] = journal.files[str(path)]
+
+    res = _journal.restore(journal)
+    assert res == _journal.RestoreResult([], [str(path), str(missing)])
+    assert path.read_bytes() == b"x = 2  # debug\n"
+
+
+def test_record_keeps_earlier_runs(tmp_path):
+    path = str(tmp_path / "a.py")
+    journal = _journal.Journal()
+    journal.record(path, [(0, b"x = 1  # debug\n")])
+    journal.record(path, [(2, b"z = 3  # debug\n")])
+    assert journal.files[path].undo == [
+        (0, b"x = 1  # debug\n"), (2, b"z = 3  # debug\n")]
+
+    # streamed in text mode this time
+    journal.record(path, [(1, "y = 2  # debug\n")])
+    assert journal.files[path] == (True, [(1, "y = 2  # debug\n")])
+
+
+def test_load_bad_journal(tmp_path):
+    path = tmp_path / "journal.json"
+    path.write_text('{"version": 0, "files": {}}')
+    with pytest.raises(_journal.JournalError):
+        _journal.Journal.load(str(path))
+    path.write_text('{"version"')
+    with pytest.raises(_journal.JournalError):
+        _journal.Journal.load(str(path))
+
+
+@pytest.mark.parametrize("data", [
+    '{"version": 1}',
+    '{"version": 1, "files": []}',
+    '{"version": 1, "files": {"a.py": {"text": true}}}',
+    '{"version": 1, "files": {"a.py": {"text": false, "lines": [[0]]}}}',
+    '{"version": 1, "files": {"a.py": {"text": false, "lines": [["0", "x"]]}}}',
+    '{"version": 1, "files": {"a.py": {"text": 1, "lines": []}}}',
+])
+def test_load_malformed_journal(tmp_path, data):
+    path = tmp_path / "journal.json"
+    path.write_text(data)
+    with pytest.raises(_journal.JournalError):
+        _journal.Journal.load(str(path))
+
+    completed = subprocess.run(["pytag", "--restore", str(path)],
+                               stderr=subprocess.PIPE)
+    assert completed.returncode == 1
+    assert completed.stderr.decode().startswith("Error: malformed journal")
+
+
+# develop code like that of pytagged/ itself, which --release strips,
+# the live tree can't be used since it may already be stripped
+RELEASE_SOURCES = {
+    "app.py": b"import sys\n\n\ndef run(options):\n"
+              b"    # block: develop\n"
+              b"    print(f\"path: {options.path}\")\n"
+              b"    print(f\"tags: {options.tags}\")\n"
+              b"    print('')\n"
+              b"    # end\n"
+              b"    sys.exit(0)\n",
+    "sub/util.py": b"def f(x):\r\n    print(x)  # develop\r\n    return x\r\n",
+    "env/lib.py": b"y = 1  # develop\n",
+}
+
+
+def test_cli_restore_release(tmp_path):
+    """Strip the develop code of a package, as --release does,
+    and give it back with --restore
+    """
+    src = tmp_path / "pkg"
+    for name, data in RELEASE_SOURCES.items():
+        (src / name).parent.mkdir(parents=True, exist_ok=True)
+        (src / name).write_bytes(data)
+    before = {p: p.read_bytes() for p in src.glob("**/*.py")}
+    journal = str(tmp_path / "journal.json")
+    subprocess.run(["pytag", str(src), "-t", "develop", "-xt", "env",
+                    "--no-cache", "--journal", journal], check=True)
+    after = {p: p.read_bytes() for p in src.glob("**/*.py")}
+    assert after[src / "app.py"] != before[src / "app.py"]
+    assert after[src / "sub" / "util.py"] != before[src / "sub" / "util.py"]
+    assert after[src / "env" / "lib.py"] == before[src / "env" / "lib.py"]
+
+    subprocess.run(["pytag", "--restore", journal], check=True)
+    assert {p: p.read_bytes() for p in src.glob("**/*.py")} == before
+
+
+@pytest.mark.parametrize("line", ["x = 1\n", "    x = 1\r\n", b"  x\r", b"y"])
+def test_uncomment(line):
+    assert nline.uncomment(nline.comment_out(line)) == line
@@ -1,6 +1,39 @@
+import io
+import random
+
+import pytest
+
 from pytagged import nline, _utils
 
 
+FRAGMENTS = [
+    "x = 1", "print(x)", "  ", "    ", "\t", "# debug", "# skip", "#debug",
+    "# block: debug", "# block: skip", "# end", "# ending", '"""', "'''",
+    '"', "'", "# d.bug", "# deb", "\u00a0", "\x0c", "\r", "# ", "#",
+    "\u2003", "\x1c", "\x85",
+    "s = \"\"\"doc", "return 0",
+]
+
+
+def random_lines(rnd: random.Random, num_lines: int):
+    """Random lines as read from a file, only the
+    last line may not end with a newline.
+    """
+    lines = []
+    for _ in range(num_lines):
+        parts = rnd.choices(FRAGMENTS, k=rnd.randint(0, 4))
+        sep = rnd.choice(["", " ", "  "])
+        lines.append(sep.join(parts) + "\n")
+    if lines and rnd.random() < 0.5 and lines[-1] != "\n":
+        lines[-1] = lines[-1][:-1]
+    return lines
+
+
+@pytest.fixture(params=sorted(nline.ENGINES))
+def engine(request):
+    return nline.ENGINES[request.param]
+
+
 def test_get_newlines(src_to_target_params):
     src_file, target_file = src_to_target_params[:2]
     tags = src_to_target_params[2:]
@@ -21,3 +54,194 @@ def test_get_newlines(src_to_target_params):
 
     assert src_lines != expected_lines
     assert actual_lines == expected_lines
+
+
+def test_get_newlines_changed(src_to_target_params):
+    src_file, target_file = src_to_target_params[:2]
+    tags = src_to_target_params[2:]
+    with open(target_file) as f:
+        expected_lines = f.readlines()
+
+    with open(src_file) as f:
+        actual_lines, changed = nline.get_newlines_changed(f, tags)
+        f.seek(0)
+        src_lines = f.readlines()
+
+    assert actual_lines == expected_lines
+    assert changed == sum(a != b for a, b in zip(src_lines, expected_lines))
+
+    # running again on the result changes nothing
+    with open(target_file) as f:
+        again_lines, changed = nline.get_newlines_changed(f, tags)
+    assert again_lines == expected_lines
+    assert changed == 0
+
+
+def test_get_newlines_matcher(src_to_target_params):
+    src_file, target_file = src_to_target_params[:2]
+    tags = src_to_target_params[2:]
+    with open(target_file) as f:
+        expected_lines = f.readlines()
+
+    matcher = nline.get_matcher(tags)
+    with open(src_file) as f:
+        actual_lines = nline.get_newlines(f, matcher)
+    assert actual_lines == expected_lines
+
+
+def test_get_matcher_cached():
+    matcher = nline.get_matcher(["debug", "slow"])
+    assert nline.get_matcher(["slow", "debug", "slow"]) is matcher
+    assert nline.get_matcher(matcher) is matcher
+    assert nline.get_matcher(["debug"]) is not matcher
+    assert matcher.tags == ("debug", "slow")
+
+
+def test_engines(src_to_target_params, engine):
+    src_file, target_file = src_to_target_params[:2]
+    tags = src_to_target_params[2:]
+    with open(target_file) as f:
+        expected_lines = f.readlines()
+
+    with open(src_file) as f:
+        actual_lines, _ = engine(f, tags)
+    assert actual_lines == expected_lines
+
+
+@pytest.mark.parametrize("tags", [["debug"], ["debug", "skip"], ["d.bug"],
+                                  ["deb|skip"], [""]])
+@pytest.mark.parametrize("seed", range(20))
+def test_engines_same_output(engine, tags, seed):
+    """Every engine should give the exact same output as the regex engine"""
+    lines = random_lines(random.Random(seed), 200)
+    expected = nline.get_newlines_regex(iter(list(lines)), tags)
+    actual = engine(iter(list(lines)), tags)
+    assert actual == expected
+
+
+def test_engines_same_output_on_stringio(engine):
+    lines = random_lines(random.Random(0), 2000)
+    src = ''.join(lines)
+    expected = nline.get_newlines_regex(io.StringIO(src), ["debug"])
+    assert engine(io.StringIO(src), ["debug"]) == expected
+
+
+def test_iter_newlines_buffers_open_regions_only():
+    """Lines outside of any block or triple quote region
+    should come out as soon as they are read.
+    """
+    read = []
+
+    def lines():
+        for ln in ["a = 1  # debug\n", "# block: debug\n", "b = 2\n",
+                   "# end\n", "c = 3\n"]:
+            read.append(ln)
+            yield ln
+
+    it = nline.iter_newlines_changed(lines(), ["debug"])
+    assert next(it) == ("# a = 1  # debug\n", True)
+    assert len(read) == 1
+    assert next(it) == ("# block: debug\n", False)
+    assert len(read) == 4
+    assert list(it) == [("# b = 2\n", True), ("# end\n", False),
+                        ("c = 3\n", False)]
+
+
+@pytest.mark.parametrize("intervals, holes, expected", [
+    ([], [(0, 5)], []),
+    ([(0, 10)], [], [(0, 10)]),
+    ([(0, 10)], [(2, 4), (6, 8)], [(0, 2), (4, 6), (8, 10)]),
+    ([(0, 10)], [(0, 10)], []),
+    ([(2, 5), (7, 9)], [(0, 3), (4, 8)], [(3, 4), (8, 9)]),
+])
+def test_subtract_intervals(intervals, holes, expected):
+    assert nline._subtract_intervals(intervals, holes) == expected
+
+
+def test_merge_intervals():
+    assert nline._merge_intervals([(5, 8), (0, 2), (3, 3), (1, 4), (8, 9)]) \
+        == [(0, 4), (5, 9)]
+
+
+def test_resolve_large_block():
+    body = ["x = 1\n", "\n"] * 50000
+    doc = ['"""doc\n', "more doc\n", '"""\n']
+    lines = ["# block: debug\n"] + body + doc + ["# end\n"]
+    newlines, changed = nline.get_newlines_changed(iter(lines), ["debug"])
+    assert changed == 50000
+    assert newlines[1:3] == ["# x = 1\n", "\n"]
+    assert newlines[-4:] == lines[-4:]
+
+
+@pytest.mark.parametrize("terminator", ["\n", "\r\n", "\r"])
+@pytest.mark.parametrize("tags", [["debug"], ["debug", "skip"], ["d.bug"],
+                                  ["deb|skip"], [""]])
+@pytest.mark.parametrize("seed", range(20))
+def test_bytes_engine_same_output(terminator, tags, seed):
+    """Same output as the regex engine, but with the original line
+    terminators. Lines can't have a \\r in them as bytes lines.
+    """
+    lines = [ln.replace("\r", "")
+             for ln in random_lines(random.Random(seed), 200)]
+    expected = nline.get_newlines_regex(iter(list(lines)), tags)
+
+    data = "".join(lines).replace("\n", terminator).encode("utf-8")
+    actual = nline.get_newlines_bytes(data, tags, "utf-8")
+    assert actual.changed == expected.changed
+    assert b"".join(actual.lines) == \
+        "".join(expected.lines).replace("\n", terminator).encode("utf-8")
+
+
+@pytest.mark.parametrize("space", ["\u00a0", "\x1c", "\x85", "\u2003",
+                                   "\u3000"])
+def test_bytes_engine_unicode_whitespace(space):
+    """Comments indented with whitespace that only str.lstrip strips
+    are still comments, like in the text engines
+    """
+    src = (f"{space}# debug\n# block: debug\nx = 1\n{space}# note\n"
+           f"# end\n{space}# block: debug\ny = 2\n# end\n")
+    expected = nline.get_newlines_fast(io.StringIO(src), ["debug"])
+    actual = nline.get_newlines_bytes(src.encode("utf-8"), ["debug"], "utf-8")
+    assert b"".join(actual.lines).decode("utf-8") == "".join(expected.lines)
+    assert actual.changed == expected.changed == 2
+
+
+def test_bytes_engine_keeps_bom():
+    data = "\ufeffx = 1  # debug\r\ny = 2\r\n".encode("utf-8")
+    newlines = nline.get_newlines_bytes(data, ["debug"], "ascii")
+    assert newlines == nline.NewByteLines(
+        ["\ufeff# x = 1  # debug\r\n".encode("utf-8"), b"y = 2\r\n"], 1)
+
+
+def test_bytes_engine_coding_cookie():
+    data = "# -*- coding: latin-1 -*-\nx = 1  # débug\n".encode("latin-1")
+    newlines = nline.get_newlines_bytes(data, ["débug"], "utf-8")
+    assert newlines.lines[1] == "# x = 1  # débug\n".encode("latin-1")
+    assert newlines.changed == 1
+
+
+@pytest.mark.parametrize("data", [
+    "x = 1  # debug\n".encode("utf-16"),
+    "x = 1  # debug\n".encode("utf-32"),
+    "# coding: utf-16\nx = 1  # débug\n".encode("utf-8"),
+])
+def test_bytes_engine_not_ascii_compatible(data):
+    assert nline.get_newlines_bytes(data, ["debug", "débug"]) is None
+
+
+@pytest.mark.parametrize("terminator", ["\n", "\r\n"])
+@pytest.mark.parametrize("seed", range(20))
+def test_bytes_edits(terminator, seed):
+    lines = [ln.replace("\r", "")
+             for ln in random_lines(random.Random(seed), 200)]
+    data = "\ufeff" * (seed % 2) + "".join(lines).replace("\n", terminator)
+    data = data.encode("utf-8")
+
+    edits = nline.get_edits_bytes(data, ["debug", "skip"], "utf-8")
+    expected = nline.get_newlines_bytes(data, ["debug", "skip"], "utf-8")
+    assert len(edits) == expected.changed
+    assert nline.apply_edits(data, edits) == b"".join(expected.lines)
+    for edit in edits:
+        original = data[edit.offset:edit.offset + edit.length]
+        indent = original[:len(original) - len(original.lstrip(b" "))]
+        assert edit.line == indent + b"# " + original[len(indent):]
@@ -0,0 +1,61 @@
+import subprocess
+
+import pytest
+
+from conftest import path_to_multiples
+from pytagged import _prefilter
+
+
+@pytest.mark.parametrize(
+    "data, expected",
+    [
+        (b"x = 1\n", False),
+        (b"", False),
+        (b"print(x)  # debug\n", True),
+        (b"# block: debug\nx = 1\n# end\n", True),
+        (b"#debug\n# debugging is fun\n", True),
+        (b"# block:debug\n", False),
+    ]
+)
+def test_may_match_bytes(data, expected):
+    assert _prefilter.Prefilter(["debug"]).may_match_bytes(data) is expected
+
+
+def test_many_tags_use_regex():
+    tags = [f"tag{i}" for i in range(_prefilter.MAX_FIND_NEEDLES)]
+    prefilter = _prefilter.Prefilter(tags)
+    assert prefilter.rgx is not None
+    assert prefilter.may_match_bytes(b"x = 1  # tag3\n")
+    assert not prefilter.may_match_bytes(b"x = 1  # tag\n")
+
+
+def test_regex_tags_disable_prefilter():
+    prefilter = _prefilter.Prefilter(["deb.g"])
+    assert not prefilter.enabled
+    assert prefilter.may_match_bytes(b"x = 1\n")
+
+
+def test_may_match_path(tmp_path, monkeypatch):
+    # force the mmap path
+    monkeypatch.setattr(_prefilter, "MMAP_THRESHOLD", 1)
+    prefilter = _prefilter.Prefilter(["debug"])
+    no_tag = tmp_path / "no_tag.py"
+    no_tag.write_text("x = 1\n")
+    tag = tmp_path / "tag.py"
+    tag.write_text("x = 1  # debug\n")
+    empty = tmp_path / "empty.py"
+    empty.write_text("")
+
+    assert not prefilter.may_match(str(no_tag))
+    assert prefilter.may_match(str(tag))
+    assert not prefilter.may_match(str(empty))
+    assert (prefilter.hits, prefilter.misses) == (1, 2)
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_cli_prefilter_misses(cleanup_test_path_multiples, jobs):
+    path = f"{path_to_multiples()}/src"
+    cmd = ["pytag", path, "-t", "no_such_tag", "-v", "1", "-j", jobs,
+           "--no-cache"]
+    completed = subprocess.run(cmd, check=True, stdout=subprocess.PIPE)
+    assert "Skipped by the prefilter: 4 files" in completed.stdout.decode()
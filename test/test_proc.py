@@ -0,0 +1,78 @@
+import io
+
+import pytest
+
+from pytagged import _cache, _prefilter, _proc, _write, nline
+
+
+SRC = b"x = 1\r\n" * 1000 + b"print(x)  # debug\r\n" + b"y = 2\r\n" * 10
+
+
+class RecordingFile(io.BytesIO):
+    """BytesIO that remembers where its writes start"""
+
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.write_offsets = []
+
+    def write(self, b) -> int:
+        self.write_offsets.append(self.tell())
+        return super().write(b)
+
+
+def test_write_edits_rewrites_from_first_edit_only():
+    edits = nline.get_edits_bytes(SRC, ["debug"], "utf-8")
+    assert [e.index for e in edits] == [1000]
+
+    f = RecordingFile(SRC)
+    written = _proc.write_edits(f, SRC, edits)
+
+    assert f.getvalue() == nline.apply_edits(SRC, edits)
+    assert f.getvalue() == SRC.replace(b"print", b"# print")
+    assert min(f.write_offsets) == edits[0].offset == 7000
+    assert written == len(SRC) - 7000 + 2
+
+
+def test_proc_file_bytes(tmp_path):
+    path = tmp_path / "crlf.py"
+    path.write_bytes(SRC)
+    matcher = nline.get_matcher(["debug"])
+
+    res = _proc.proc_file(str(path), matcher, write=True, keep_lines=True)
+    assert res.written
+    assert path.read_bytes() == SRC.replace(b"print", b"# print")
+    # printed lines are read as in text mode
+    assert res.lines[1000] == "# print(x)  # debug\n"
+
+    res = _proc.proc_file(str(path), matcher, write=True, keep_lines=False)
+    assert not res.written
+
+
+def test_write_edits_shorter():
+    data = b"aaaa\nbbbb\ncccc\n"
+    edits = [nline.Edit(1, 5, 5, b"b\n")]
+    f = io.BytesIO(data)
+    assert _proc.write_edits(f, data, edits) == 7
+    assert f.getvalue() == b"aaaa\nb\ncccc\n"
+
+
+@pytest.mark.parametrize("src", [SRC, b"x = 1\n", b"x = 1  # other\n"])
+@pytest.mark.parametrize("atomic", [False, True])
+def test_proc_file_digest(tmp_path, src, atomic):
+    """The digest is the one of the file as it was left"""
+    path = tmp_path / "a.py"
+    path.write_bytes(src)
+    writer = _write.AtomicWriter() if atomic else None
+    res = _proc.proc_file(str(path), nline.get_matcher(["debug"]),
+                          write=True, keep_lines=False,
+                          prefilter=_prefilter.Prefilter(["debug"]),
+                          writer=writer, digest=True)
+    if writer is not None:
+        writer.flush()
+    assert res.digest == _cache.file_digest(str(path))
+
+    # streamed files are hashed again when recorded
+    res = _proc.proc_file(str(path), nline.get_matcher(["debug"]),
+                          write=True, keep_lines=False, stream_threshold=0,
+                          digest=True)
+    assert res.digest is None
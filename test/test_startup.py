@@ -0,0 +1,79 @@
+"""Import time of a run on a single file, see the note on lazy
+imports at the top of pytagged/app.py
+"""
+import os
+import subprocess
+import sys
+from typing import Dict
+
+import pytest
+
+
+# total import time of a single file run, generous since it's
+# measured on shared CI machines, override with the env var
+IMPORT_BUDGET_MS = float(os.environ.get("PYTAGGED_IMPORT_BUDGET_MS", 60))
+
+# only needed by other modes, config files, big or many files
+LAZY_MODULES = [
+    "configparser", "statistics", "tempfile", "shutil",
+    "concurrent.futures", "ctypes", "socketserver", "pytagged._watch",
+    "pytagged._bench",
+]
+
+RUN = ("import sys; from pytagged.cli import main; "
+       "sys.argv = ['pytag', *sys.argv[1:]]; main()")
+
+
+def import_times(tmp_path, *args) -> Dict[str, int]:
+    """Cumulative import time in us of each import of the run, after
+    python's own startup. Nested imports are indented.
+    """
+    env = dict(os.environ, PYTHONPYCACHEPREFIX=str(tmp_path / "pycache"))
+    # bytecode is cached, like in an installed package
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", RUN, *args],
+        env=env, cwd=str(tmp_path), check=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    times = {}
+    for line in completed.stderr.decode().splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name[1:].rstrip()
+        if name == "site":
+            # site is the last import of the startup
+            times.clear()
+            continue
+        times[name] = int(cumulative)
+    return times
+
+
+@pytest.fixture
+def single_file(tmp_path) -> str:
+    path = tmp_path / "a.py"
+    path.write_text("import os\nprint(os.name)  # debug\n")
+    return str(path)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason="needs -X importtime")
+@pytest.mark.parametrize("mode", [[], ["-p"]])
+def test_single_file_lazy_imports(tmp_path, single_file, mode):
+    times = import_times(tmp_path, single_file, "-t", "debug", *mode)
+    imported = {name.strip() for name in times}
+    for name in LAZY_MODULES:
+        assert name not in imported
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason="needs -X importtime")
+def test_single_file_import_budget(tmp_path, single_file):
+    # warm the bytecode cache, then keep the best of a few runs
+    import_times(tmp_path, single_file, "-t", "debug")
+    best = None
+    for _ in range(3):
+        times = import_times(tmp_path, single_file, "-t", "debug")
+        total = sum(us for name, us in times.items()
+                    if not name.startswith(" "))
+        best = total if best is None else min(best, total)
+    assert best / 1000 < IMPORT_BUDGET_MS
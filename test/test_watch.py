@@ -0,0 +1,90 @@
+import pytest
+
+from pytagged import _files_utils, _proc, _watch, nline
+
+
+BACKENDS = ["poll"]
+if _watch._load_libc() is not None:
+    BACKENDS.append("inotify")
+
+
+def make_watcher(path, backend, patterns=("env",)):
+    def is_excluded(p: str) -> bool:
+        return _files_utils.match_path(p, list(patterns))
+
+    return _watch.Watcher(str(path), is_excluded, ".py", backend=backend,
+                          debounce=0.05, poll_interval=0.05)
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request) -> str:
+    return request.param
+
+
+def test_watch_created_and_modified(tmp_path, backend):
+    a = tmp_path / "a.py"
+    a.write_text("x = 1\n")
+    with make_watcher(tmp_path, backend) as watcher:
+        watcher.seen([str(a)])
+        assert watcher.next_batch(timeout=0.2) == []
+
+        a.write_text("x = 2  # debug\n")
+        (tmp_path / "pkg").mkdir()
+        b = tmp_path / "pkg" / "b.py"
+        b.write_text("y = 1\n")
+        assert watcher.next_batch(timeout=2) == [str(a), str(b)]
+
+
+def test_watch_respects_excludes(tmp_path, backend):
+    (tmp_path / "env").mkdir()
+    (tmp_path / "sub" / "env").mkdir(parents=True)
+    with make_watcher(tmp_path, backend) as watcher:
+        (tmp_path / "env" / "a.py").write_text("x = 1\n")
+        (tmp_path / "sub" / "env" / "b.py").write_text("x = 1\n")
+        (tmp_path / "c.txt").write_text("x = 1\n")
+        (tmp_path / "d.py").write_text("x = 1\n")
+        # patterns match whole names, like in a full pass
+        (tmp_path / "env.py").write_text("x = 1\n")
+        assert watcher.next_batch(timeout=2) == \
+            [str(tmp_path / "d.py"), str(tmp_path / "env.py")]
+
+
+def test_watch_ignores_own_writes(tmp_path, backend):
+    a = tmp_path / "a.py"
+    a.write_text("x = 1\n")
+    matcher = nline.get_matcher(["debug"])
+    with make_watcher(tmp_path, backend) as watcher:
+        a.write_text("x = 1  # debug\n")
+        batch = watcher.next_batch(timeout=2)
+        assert batch == [str(a)]
+        assert _proc.proc_file(batch[0], matcher, True, False).written
+        watcher.seen(batch)
+
+        assert watcher.next_batch(timeout=0.3) == []
+        assert a.read_text() == "# x = 1  # debug\n"
+
+
+def test_watch_single_file(tmp_path, backend):
+    a = tmp_path / "a.py"
+    a.write_text("x = 1\n")
+    with make_watcher(a, backend) as watcher:
+        (tmp_path / "b.py").write_text("x = 1\n")
+        a.write_text("x = 2\n")
+        assert watcher.next_batch(timeout=2) == [str(a)]
+
+
+def test_watch_debounces(tmp_path, backend):
+    a = tmp_path / "a.py"
+    with make_watcher(tmp_path, backend) as watcher:
+        for i in range(5):
+            a.write_text(f"x = {i}\n")
+        b = tmp_path / "b.py"
+        b.write_text("y = 1\n")
+        # a burst of writes is a single batch, with each file once
+        assert watcher.next_batch(timeout=2) == [str(a), str(b)]
+        assert watcher.next_batch(timeout=0.2) == []
+
+
+def test_watch_unknown_backend(tmp_path):
+    with pytest.raises(ValueError):
+        make_watcher(tmp_path, "kqueue")
@@ -0,0 +1,70 @@
+import os
+import stat
+
+import pytest
+
+from pytagged import _write
+
+
+def tmp_files(dir_path) -> list:
+    return [p for p in os.listdir(dir_path) if p.endswith(_write.TMP_SUFFIX)]
+
+
+@pytest.mark.parametrize("durability", _write.DURABILITY_LEVELS)
+def test_atomic_write(tmp_path, durability):
+    path = tmp_path / "a.py"
+    path.write_bytes(b"x = 1\n")
+    os.chmod(path, 0o640)
+    ino = os.stat(path).st_ino
+
+    writer = _write.AtomicWriter(durability)
+    assert writer.write(str(path), [b"# x", b" = 1\n"]) == 8
+    writer.flush()
+
+    assert path.read_bytes() == b"# x = 1\n"
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+    # replaced, not rewritten in place
+    assert os.stat(path).st_ino != ino
+    assert not tmp_files(tmp_path)
+    assert writer.fsyncs == {"none": 0, "dir": 2, "file": 2}[durability]
+
+
+def test_atomic_write_dir_batch(tmp_path):
+    writer = _write.AtomicWriter("dir")
+    for name in ("a.py", "b.py", "c.py"):
+        (tmp_path / name).write_bytes(b"x = 1\n")
+        writer.write(str(tmp_path / name), [b"y = 2\n"])
+    # one fsync per file, the directory is only fsynced on flush
+    assert writer.fsyncs == 3
+    writer.flush()
+    assert writer.fsyncs == 4
+
+
+def test_atomic_write_follows_symlinks(tmp_path):
+    target = tmp_path / "target.py"
+    target.write_bytes(b"x = 1\n")
+    link = tmp_path / "link.py"
+    link.symlink_to(target)
+
+    _write.AtomicWriter().write(str(link), [b"# x = 1\n"])
+    assert link.is_symlink()
+    assert target.read_bytes() == b"# x = 1\n"
+
+
+def test_atomic_write_interrupted(tmp_path):
+    path = tmp_path / "a.py"
+    path.write_bytes(b"x = 1\n")
+
+    def pieces():
+        yield b"# x"
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        _write.AtomicWriter().write(str(path), pieces())
+    assert path.read_bytes() == b"x = 1\n"
+    assert not tmp_files(tmp_path)
+
+
+def test_unknown_durability():
+    with pytest.raises(ValueError):
+        _write.AtomicWriter("always")